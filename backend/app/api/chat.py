@@ -1,73 +1,42 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from typing import Optional
+from typing import Dict, List, Optional
 import json
 import time
 import asyncio
 
-from app.database import get_db
-from app.models.document import Document
+from app.database import get_db, SessionLocal
+from app.models.document import Document, DocumentChunk
 from app.models.user import User, UserRole
-from app.schemas.chat import ChatRequest, ChatResponse  # We'll create this
+from app.schemas.chat import ChatRequest, ChatResponse, MultiChatRequest, MultiChatResponse, SearchRequest
 from app.auth.dependencies import require_user
 from app.services.chat_service import chat_service
 from app.services.chat_persistence import chat_persistence
+from app.utils.vector_store import vector_store_manager
 from app.utils import get_logger
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 logger = get_logger(__name__)
 
-@router.post("/stream")
-async def chat_stream(
-    request: ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_user)
-):
-    """Streaming chat endpoint with RAG + persistence"""
-    
-    # Validate document exists and user has access
-    document = db.query(Document).filter(Document.id == request.document_id).first()
-    
-    if not document:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Document not found"
-        )
-    
-    # Check permissions
-    if not document.is_public and current_user.role == UserRole.USER:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have permission to chat with this document"
-        )
-    
-    if (document.is_public == False and 
-        current_user.role == UserRole.ADMIN and 
-        document.uploaded_by_id != current_user.id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have permission to chat with this document"
-        )
-    
-    # Check if document is processed
-    if not document.is_processed:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Document must be processed before chatting"
-        )
-    
-    logger.info(f"Chat request from {current_user.username} for document {document.id}: {request.query[:50]}...")
-    
-    # Get chat response with timeout
+def document_cache_version(document: Document) -> Optional[str]:
+    """Answer cache version of a document: changes whenever its embeddings are rebuilt"""
+    return document.embeddings_created_at.isoformat() if document.embeddings_created_at else None
+
+def save_chat(**kwargs):
+    """Persist a finished chat in its own session"""
+    db = SessionLocal()
+    try:
+        chat_persistence.save_chat(db=db, **kwargs)
+    finally:
+        db.close()
+
+async def await_chat_result(awaitable):
+    """Chat result with a timeout (504 if retrieval and the first LLM response take too long, 502 if they fail)"""
     try:
-        chat_result = await asyncio.wait_for(
-            asyncio.to_thread(
-                chat_service.get_chat_response,
-                document_id=request.document_id,
-                query=request.query,
-                stream=True
-            ),
+        return await asyncio.wait_for(
+            awaitable,
             timeout=180  # 3 minute timeout for very long responses
         )
     except asyncio.TimeoutError:
@@ -76,13 +45,38 @@ async def chat_stream(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail="Chat generation took too long. Please try again."
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Chat generation failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Error generating response"
+        )
+
+def chat_event_response(chat_result: dict, request_start: float, user_id: int,
+                        document_ids: List[int], question: str) -> StreamingResponse:
+    """Stream a chat result as Server-Sent Events and save it under each document once complete"""
     
-    # Create streaming response
     async def event_stream():
         """Generator for Server-Sent Events"""
         
         full_response = ""
         metadata = chat_result["metadata"]
+        stream = chat_result["stream_generator"]
+        
+        error_event = {
+            "type": "error",
+            "data": {"message": "Error generating response"}
+        }
+        
+        # Wait for the first token so time-to-first-token goes out with the metadata
+        try:
+            chunk = await anext(stream, None)
+        except Exception as e:
+            logger.error(f"Error starting chat stream: {e}")
+            chunk = None
+        metadata["ttft_ms"] = round((time.time() - request_start) * 1000, 1)
         
         # Send metadata first
         metadata_event = {
@@ -91,9 +85,9 @@ async def chat_stream(
         }
         yield f"data: {json.dumps(metadata_event)}\n\n"
         
-        # Send response chunks
+        # Send response chunks as they arrive
         try:
-            for chunk in chat_result["stream_generator"]:
+            while chunk is not None:
                 if chunk:
                     full_response += chunk
                     text_event = {
@@ -101,6 +95,12 @@ async def chat_stream(
                         "data": chunk
                     }
                     yield f"data: {json.dumps(text_event)}\n\n"
+                chunk = await anext(stream, None)
+            
+            if not full_response:
+                # Nothing was generated: report an error instead of saving an empty answer
+                yield f"data: {json.dumps(error_event)}\n\n"
+                return
             
             # Send completion event
             completion_event = {
@@ -109,26 +109,23 @@ async def chat_stream(
             }
             yield f"data: {json.dumps(completion_event)}\n\n"
             
-            # Save to database (async)
-            try:
-                chat_persistence.save_chat(
-                    db=db,
-                    user_id=current_user.id,
-                    document_id=request.document_id,
-                    question=request.query,
-                    response=full_response,
-                    relevance_score=metadata.get("top_similarity_score", 0.0),
-                    context_chunks=metadata.get("context_chunks_retrieved", 0)
-                )
-            except Exception as e:
-                logger.warning(f"Failed to save chat to DB: {e}")
+            # Save to database (short-lived session, off the event loop)
+            for document_id in document_ids:
+                try:
+                    await asyncio.to_thread(
+                        save_chat,
+                        user_id=user_id,
+                        document_id=document_id,
+                        question=question,
+                        response=full_response,
+                        relevance_score=metadata.get("top_similarity_score", 0.0),
+                        context_chunks=metadata.get("context_chunks_retrieved", 0)
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to save chat to DB: {e}")
             
         except Exception as e:
             logger.error(f"Error in chat stream: {e}")
-            error_event = {
-                "type": "error",
-                "data": {"message": "Error generating response"}
-            }
             yield f"data: {json.dumps(error_event)}\n\n"
     
     return StreamingResponse(
@@ -142,6 +139,66 @@ async def chat_stream(
         }
     )
 
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_user)
+):
+    """Streaming chat endpoint with RAG + persistence"""
+    
+    request_start = time.time()
+    
+    # Validate document exists and user has access
+    document = db.query(Document).filter(Document.id == request.document_id).first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found"
+        )
+    
+    # Check permissions
+    if not document.is_public and current_user.role == UserRole.USER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to chat with this document"
+        )
+    
+    if (document.is_public == False and 
+        current_user.role == UserRole.ADMIN and 
+        document.uploaded_by_id != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to chat with this document"
+        )
+    
+    # Check if document is processed
+    if not document.is_processed:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Document must be processed before chatting"
+        )
+    
+    logger.info(f"Chat request from {current_user.username} for document {document.id}: {request.query[:50]}...")
+    
+    # Return the connection to the pool now: the stream can last much longer than the
+    # request checks, and held sessions would cap concurrent chats at the pool size
+    user_id = current_user.id
+    document_version = document_cache_version(document)
+    db.close()
+    
+    chat_result = await await_chat_result(
+        chat_service.get_chat_response_async(
+            document_id=request.document_id,
+            query=request.query,
+            stream=True,
+            document_version=document_version
+        )
+    )
+    
+    return chat_event_response(chat_result, request_start, user_id, [request.document_id], request.query)
+
 @router.post("/message", response_model=ChatResponse)
 async def chat_message(
     request: ChatRequest,
@@ -184,10 +241,13 @@ async def chat_message(
     logger.info(f"Chat message from {current_user.username} for document {document.id}")
     
     # Get chat response (non-streaming)
-    chat_result = chat_service.get_chat_response(
-        document_id=request.document_id,
-        query=request.query,
-        stream=False
+    chat_result = await await_chat_result(
+        chat_service.get_chat_response_async(
+            document_id=request.document_id,
+            query=request.query,
+            stream=False,
+            document_version=document_cache_version(document)
+        )
     )
     
     return ChatResponse(
@@ -201,6 +261,99 @@ async def chat_message(
         }
     )
 
+def get_chat_documents(document_ids: List[int], db: Session, current_user: User) -> Dict[int, Document]:
+    """Load and permission-check several documents with a single query"""
+    documents = {doc.id: doc for doc in db.query(Document).filter(Document.id.in_(document_ids)).all()}
+    
+    for document_id in document_ids:
+        document = documents.get(document_id)
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Document {document_id} not found"
+            )
+        
+        # Same rules as single-document chat
+        if not document.is_public and (
+            current_user.role == UserRole.USER or
+            (current_user.role == UserRole.ADMIN and document.uploaded_by_id != current_user.id)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"You don't have permission to chat with document {document_id}"
+            )
+        
+        if not document.is_processed:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Document {document_id} must be processed before chatting"
+            )
+    
+    return documents
+
+@router.post("/multi/stream")
+async def multi_chat_stream(
+    request: MultiChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_user)
+):
+    """Streaming chat over several documents: one retrieval pass per document, one LLM call"""
+    
+    request_start = time.time()
+    document_ids = list(dict.fromkeys(request.document_ids))
+    documents = get_chat_documents(document_ids, db, current_user)
+    
+    logger.info(f"Multi-document chat from {current_user.username} for documents {document_ids}: {request.query[:50]}...")
+    
+    # Release the connection before streaming (see chat_stream)
+    user_id = current_user.id
+    titles = {doc.id: doc.title or doc.original_filename for doc in documents.values()}
+    db.close()
+    
+    chat_result = await await_chat_result(
+        chat_service.get_multi_chat_response_async(
+            document_ids=document_ids,
+            query=request.query,
+            stream=True,
+            source_titles=titles
+        )
+    )
+    
+    return chat_event_response(chat_result, request_start, user_id, document_ids, request.query)
+
+@router.post("/multi/message", response_model=MultiChatResponse)
+async def multi_chat_message(
+    request: MultiChatRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_user)
+):
+    """Non-streaming chat over several documents"""
+    
+    document_ids = list(dict.fromkeys(request.document_ids))
+    documents = get_chat_documents(document_ids, db, current_user)
+    
+    logger.info(f"Multi-document chat message from {current_user.username} for documents {document_ids}")
+    
+    chat_result = await await_chat_result(
+        chat_service.get_multi_chat_response_async(
+            document_ids=document_ids,
+            query=request.query,
+            stream=False,
+            source_titles={doc.id: doc.title or doc.original_filename for doc in documents.values()}
+        )
+    )
+    
+    return MultiChatResponse(
+        success=True,
+        message="Chat response generated",
+        data={
+            "document_ids": document_ids,
+            "query": request.query,
+            "response": chat_result["response"],
+            "metadata": chat_result["metadata"]
+        }
+    )
+
 @router.get("/documents")
 async def get_chatable_documents(
     skip: int = 0,
@@ -247,6 +400,69 @@ async def get_chatable_documents(
     }
 
 
+@router.post("/search")
+async def search_documents(
+    request: SearchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_user)
+):
+    """Search across every document the user can chat with in a single top-k query"""
+    
+    # Same visibility rules as get_chatable_documents
+    query = db.query(Document.id, Document.title, Document.original_filename).filter(
+        Document.is_processed == True
+    )
+    if current_user.role == UserRole.USER:
+        query = query.filter(Document.is_public == True)
+    elif current_user.role == UserRole.ADMIN:
+        query = query.filter(
+            (Document.is_public == True) | 
+            (Document.uploaded_by_id == current_user.id)
+        )
+    
+    titles = {doc_id: title or filename for doc_id, title, filename in query.all()}
+    
+    logger.info(f"Global search from {current_user.username} over {len(titles)} documents: {request.query[:50]}...")
+    
+    hits = await asyncio.to_thread(
+        vector_store_manager.search_all,
+        request.query,
+        k=request.top_k,
+        document_ids=list(titles),
+        threshold=chat_service.relevance_threshold
+    )
+    
+    # Fetch chunk text for the hits in one query
+    chunks = {}
+    if hits:
+        keys = [(doc_id, chunk_index) for doc_id, chunk_index, _ in hits]
+        rows = db.query(DocumentChunk).filter(
+            tuple_(DocumentChunk.document_id, DocumentChunk.chunk_index).in_(keys)
+        ).all()
+        chunks = {(c.document_id, c.chunk_index): c for c in rows}
+    
+    result = []
+    for doc_id, chunk_index, similarity in hits:
+        chunk = chunks.get((doc_id, chunk_index))
+        if chunk is None:
+            continue
+        result.append({
+            "document_id": doc_id,
+            "document_title": titles.get(doc_id),
+            "chunk_id": chunk.id,
+            "chunk_index": chunk_index,
+            "page_number": chunk.page_number,
+            "text": chunk.content,
+            "similarity_score": similarity
+        })
+    
+    return {
+        "success": True,
+        "message": f"Found {len(result)} matching chunks",
+        "data": result
+    }
+
+
 @router.get("/history/{document_id}")
 async def get_chat_history(
     document_id: int,
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
 import os
 from datetime import datetime
 
+from app.config import settings
 from app.database import get_db, SessionLocal
 from app.models.document import Document, DocumentChunk
 from app.models.user import User, UserRole
+from app.models.processing_job import JobStatus, ProcessingJob
 from app.schemas.document import (
     Document as DocumentSchema,
     DocumentUpdate,
@@ -14,8 +17,10 @@ from app.schemas.document import (
     UploadResponse
 )
 from app.auth.dependencies import require_admin, require_user
-from app.services.pdf_processor import pdf_processor
+from app.services.pdf_processor import FileTooLargeError, pdf_processor
 from app.utils import create_response, get_logger
+from app.services.chat_service import chat_service
+from app.services.job_queue import job_queue
 from app.utils.vector_store import vector_store_manager
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -90,11 +95,13 @@ async def auto_process_document(document_id: int, user_id: int):
 
         vector_store = vector_store_manager.get_store(document_id)
         vector_store.clear()
-        vector_store.add_texts(texts, metadata)
-        vector_store.save()
+        # Batched concurrent embedding requests; run off the event loop
+        await asyncio.to_thread(vector_store.add_texts, texts, metadata)
+        vector_store_manager.save_store(document_id)
 
         document.embeddings_created_at = datetime.utcnow()
         db.commit()
+        chat_service.invalidate_document(document_id)
 
         logger.info(f"✅ Auto-processing complete for document {document_id}")
 
@@ -126,20 +133,17 @@ async def upload_document(
             detail="Only PDF files are allowed"
         )
 
-    file.file.seek(0, os.SEEK_END)
-    file_size = file.file.tell()
-    file.file.seek(0)
-
-    if file_size > 50 * 1024 * 1024:
+    # Early reject when the size is known up front; the streamed write enforces the limit regardless
+    if file.size is not None and file.size > settings.MAX_UPLOAD_SIZE:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File size exceeds 50MB limit"
+            detail=f"File size exceeds {settings.MAX_UPLOAD_SIZE // (1024 * 1024)}MB limit"
         )
 
     try:
-        # ---- Save file ----
-        unique_filename, file_path, saved_file_size = (
-            pdf_processor.save_uploaded_file(file.file, file.filename)
+        # ---- Save file (streamed to disk in chunks) ----
+        unique_filename, file_path, saved_file_size, content_hash = (
+            await pdf_processor.save_uploaded_file(file, file.filename)
         )
 
         db_document = Document(
@@ -147,6 +151,7 @@ async def upload_document(
             original_filename=file.filename,
             file_path=file_path,
             file_size=saved_file_size,
+            content_hash=content_hash,
             title=title or os.path.splitext(file.filename)[0],
             description=description,
             is_public=is_public,
@@ -177,6 +182,11 @@ async def upload_document(
             file_size=db_document.file_size
         )
 
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(
@@ -223,14 +233,25 @@ async def get_document_status(
         except Exception:
             pass
 
+    job = job_queue.latest_job(db, document_id)
     status_label = (
         "ready"
         if document.embeddings_created_at
+        else "failed"
+        if job and job.status == JobStatus.FAILED
         else "processing"
         if document.is_processed
         else "uploaded"
     )
 
+    processing_job = {
+        "job_id": job.id,
+        "status": job.status.value,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error
+    } if job else None
+
     return {
         "success": True,
         "data": {
@@ -243,6 +264,7 @@ async def get_document_status(
             if document.embeddings_created_at else None,
             "chunk_count": chunk_count,
             "vector_stats": vector_stats,
+            "processing_job": processing_job,
             "status": status_label
         }
     }
@@ -325,13 +347,25 @@ async def delete_document(
     if current_user.role == UserRole.ADMIN and document.uploaded_by_id != current_user.id:
         raise HTTPException(status_code=403, detail="Permission denied")
 
+    file_path = document.file_path
+
+    # Rows first: a job still processing the document checks for it before (and after)
+    # saving its vector store, and discards the store once the document is gone
+    db.query(ProcessingJob).filter(ProcessingJob.document_id == document_id).delete()
+    db.delete(document)
+    db.commit()
+
     try:
-        if os.path.exists(document.file_path):
-            os.remove(document.file_path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
     except Exception:
         logger.warning("File deletion failed")
 
-    db.delete(document)
-    db.commit()
+    try:
+        vector_store_manager.delete_store(document_id)
+    except Exception:
+        logger.warning("Vector store deletion failed")
+
+    chat_service.invalidate_document(document_id)
 
     return create_response(success=True, message="Document deleted successfully")
\ No newline at end of file
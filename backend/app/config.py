@@ -18,16 +18,111 @@ class Settings:
     
     # File storage
     UPLOAD_DIR: str = "uploads"
+    MAX_UPLOAD_SIZE: int = int(os.getenv("MAX_UPLOAD_SIZE", str(50 * 1024 * 1024)))
+    # Uploads are streamed to disk in chunks of this size
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
     VECTOR_STORE_DIR: str = "vector_stores"
     
+    # Vector store settings
+    # Memory-map embeddings on load so pages are shared across workers via the OS page cache
+    VECTOR_STORE_MMAP: bool = os.getenv("VECTOR_STORE_MMAP", "true").lower() == "true"
+    # Embedding storage format: "float32" (full precision) or "int8" (quantized: 4x smaller
+    # in memory and on disk, and brute-force search is 15-20% faster than float32)
+    # Embeddings are L2-normalized at write time in every format
+    VECTOR_STORE_DTYPE: str = os.getenv("VECTOR_STORE_DTYPE", "float32")
+    # Optional exact re-rank of the top k * factor int8 candidates; keeps a float32 copy
+    # on disk (and counted in the cache budget), so it costs the storage savings
+    VECTOR_STORE_RERANK: bool = os.getenv("VECTOR_STORE_RERANK", "false").lower() == "true"
+    VECTOR_STORE_RERANK_FACTOR: int = int(os.getenv("VECTOR_STORE_RERANK_FACTOR", "4"))
+    
+    # Loaded-store cache in VectorStoreManager (LRU, bounded by approximate resident bytes)
+    VECTOR_STORE_CACHE_MAX_BYTES: int = int(os.getenv("VECTOR_STORE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    # Comma-separated document ids that are never evicted
+    VECTOR_STORE_PINNED_DOCUMENTS: list = [
+        int(doc_id) for doc_id in os.getenv("VECTOR_STORE_PINNED_DOCUMENTS", "").split(",") if doc_id.strip()
+    ]
+    
+    # Approximate nearest neighbour index (built at save time for large documents)
+    ANN_INDEX_TYPE: str = os.getenv("ANN_INDEX_TYPE", "ivf_flat")
+    ANN_INDEX_MIN_VECTORS: int = int(os.getenv("ANN_INDEX_MIN_VECTORS", "2000"))
+    ANN_IVF_NLIST: int = int(os.getenv("ANN_IVF_NLIST", "0"))  # 0 = sqrt(vector count)
+    ANN_IVF_NPROBE: int = int(os.getenv("ANN_IVF_NPROBE", "8"))
+    
+    # Per-document BM25 keyword index (built at save time)
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.5"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    
+    # Chat retrieval: "hybrid" (dense + BM25 fused with reciprocal-rank fusion), "dense" or "sparse"
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    # Candidates taken from each source before fusion, and the RRF rank constant
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "20"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    
+    # Multi-document chat: at most this many documents, global top-k chunks
+    MULTI_CHAT_MAX_DOCUMENTS: int = int(os.getenv("MULTI_CHAT_MAX_DOCUMENTS", "10"))
+    MULTI_CHAT_TOP_K: int = int(os.getenv("MULTI_CHAT_TOP_K", "8"))
+    
+    # Context packing: prompt token budget, and chunks scoring below this
+    # fraction of the best retrieved chunk are left out
+    CONTEXT_MAX_PROMPT_TOKENS: int = int(os.getenv("CONTEXT_MAX_PROMPT_TOKENS", "3000"))
+    CONTEXT_MIN_RELATIVE_SCORE: float = float(os.getenv("CONTEXT_MIN_RELATIVE_SCORE", "0.3"))
+    
+    # Exact-match answer cache for repeated questions (per process)
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+    # Paraphrased questions: reuse an answer whose query embedding is this similar
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_MAX_PER_DOCUMENT: int = int(os.getenv("SEMANTIC_CACHE_MAX_PER_DOCUMENT", "500"))
+    # Documents with cached queries; the least recently used is dropped beyond this
+    SEMANTIC_CACHE_MAX_DOCUMENTS: int = int(os.getenv("SEMANTIC_CACHE_MAX_DOCUMENTS", "200"))
+    # With RETRIEVAL_MODE=sparse nothing else embeds the query: only pay for it if this is set
+    SEMANTIC_CACHE_IN_SPARSE_MODE: bool = os.getenv("SEMANTIC_CACHE_IN_SPARSE_MODE", "false").lower() == "true"
+    
+    # Cross-document index used by /chat/search
+    GLOBAL_INDEX_SHARDS: int = int(os.getenv("GLOBAL_INDEX_SHARDS", "8"))
+    
     # AI Model settings
+    # Embedding provider: "gemini" (API) or "local" (offline feature hashing, no network)
+    # Documents must be reprocessed after switching providers
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "gemini")
+    LOCAL_EMBEDDING_DIM: int = int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"  # Free, local model
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    # PDF text extraction: worker processes (<= 1 extracts in-process), and the
+    # fewest pages per worker worth the process hand-off
+    PDF_EXTRACTION_WORKERS: int = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+    PDF_EXTRACTION_MIN_PAGES_PER_WORKER: int = int(os.getenv("PDF_EXTRACTION_MIN_PAGES_PER_WORKER", "25"))
+    
+    # Document processing jobs: "inline" runs them in the API process, "worker" leaves
+    # them to separate `python run_worker.py` processes
+    PROCESSING_MODE: str = os.getenv("PROCESSING_MODE", "inline")
+    PROCESSING_CONCURRENCY: int = int(os.getenv("PROCESSING_CONCURRENCY", "2"))  # Jobs per process
+    # A running job whose lease is not renewed in time (worker died) is claimed again
+    PROCESSING_LEASE_SECONDS: int = int(os.getenv("PROCESSING_LEASE_SECONDS", "120"))
+    PROCESSING_MAX_ATTEMPTS: int = int(os.getenv("PROCESSING_MAX_ATTEMPTS", "3"))
+    PROCESSING_RETRY_DELAY_SECONDS: int = int(os.getenv("PROCESSING_RETRY_DELAY_SECONDS", "30"))  # Doubles per attempt
+    PROCESSING_POLL_SECONDS: float = float(os.getenv("PROCESSING_POLL_SECONDS", "2"))
     
     # Gemini API settings
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     GEMINI_MODEL: str = "gemini-1.5-flash"
+    GEMINI_API_BASE_URL: str = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com")
+    # Concurrent streaming LLM connections per worker (async chat pipeline)
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "500"))
+    
+    # Batch embedding (batchEmbedContents accepts at most 100 texts per request)
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+    EMBEDDING_CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_REQUESTS_PER_MINUTE: int = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "1500"))
+    EMBEDDING_MAX_RETRIES: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+    
+    # On-disk embedding cache keyed by (model, task type, text), LRU-evicted by size
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
     
     def __init__(self):
         # Create necessary directories
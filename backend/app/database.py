@@ -1,19 +1,64 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 # Create SQLAlchemy engine
+# (timeout: API and worker processes share the database; writers wait for each other's locks)
 engine = create_engine(
-    settings.DATABASE_URL, connect_args={"check_same_thread": False}
+    settings.DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30}
 )
 
+@event.listens_for(engine, "connect")
+def enable_wal(dbapi_connection, connection_record):
+    """Write-ahead logging, so readers don't block on (or block) a writing process"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create Base class
 Base = declarative_base()
 
+def add_missing_columns():
+    """Lightweight migration for columns added to models after their table was created.
+    
+    create_all() only creates missing tables, so new nullable columns are added
+    to existing tables here with ALTER TABLE, and indexes added to a model since
+    its table was created are created.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            added = set()
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logger.warning(f"Cannot add non-nullable column {table.name}.{column.name} automatically")
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                added.add(column.name)
+                logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                if not all(column.name in existing | added for column in index.columns):
+                    continue
+                try:
+                    with connection.begin_nested():
+                        index.create(connection, checkfirst=True)
+                except Exception as e:
+                    # e.g. a unique index the existing rows violate
+                    logger.warning(f"Could not create index {index.name}: {e}")
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
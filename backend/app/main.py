@@ -6,14 +6,15 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from app.database import engine, Base, add_missing_columns
 # Import all models to ensure they're registered with Base
-from app.models import user, document, chat_history
+from app.models import user, document, chat_history, processing_job
 from app.api import auth, users, documents, chat  # Add chat
 from app.auth.dependencies import require_user, require_admin, require_superadmin
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 app = FastAPI(
     title="PDF AI Chatbot API",
@@ -36,6 +37,30 @@ app.include_router(users.router, prefix="/api/v1")
 app.include_router(documents.router, prefix="/api/v1")
 app.include_router(chat.router, prefix="/api/v1")  # Add chat router
 
+@app.on_event("startup")
+async def resume_document_processing():
+    """Queue unprocessed documents and, in inline mode, start working the job queue"""
+    from app.services.background_tasks import background_task_manager
+    background_task_manager.resume_interrupted()
+
+@app.on_event("shutdown")
+async def stop_processing_worker():
+    """Hand jobs still running in this process back to the queue"""
+    from app.services.processing_worker import processing_worker
+    await processing_worker.stop()
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """Close pooled connections of the async LLM client"""
+    from app.services.gemini_service import GeminiChat
+    await GeminiChat.aclose()
+
+@app.on_event("shutdown")
+async def stop_extraction_workers():
+    """Stop the PDF text extraction process pool"""
+    from app.services.pdf_processor import pdf_processor
+    pdf_processor.shutdown()
+
 @app.get("/")
 async def root():
     return {
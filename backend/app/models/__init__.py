@@ -1,5 +1,6 @@
 from app.models.user import User
 from app.models.document import Document, DocumentChunk
 from app.models.chat_history import ChatHistory
+from app.models.processing_job import ProcessingJob, JobStatus
 
-__all__ = ["User", "Document", "DocumentChunk", "ChatHistory"]
\ No newline at end of file
+__all__ = ["User", "Document", "DocumentChunk", "ChatHistory", "ProcessingJob", "JobStatus"]
\ No newline at end of file
@@ -11,6 +11,7 @@ class Document(Base):
     original_filename = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     file_size = Column(Integer, nullable=False)  # Size in bytes
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the file, for deduplication
     title = Column(String, nullable=True)
     description = Column(Text, nullable=True)
     is_public = Column(Boolean, default=True, nullable=False)
@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Index
+from sqlalchemy.sql import func
+import enum
+from app.database import Base
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class ProcessingJob(Base):
+    """Durable document processing job, claimed by workers under a time-limited lease"""
+    __tablename__ = "processing_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False, index=True)
+    
+    # Retries: a failed or abandoned job is queued again until max_attempts is reached
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime, nullable=False)  # Earliest time the job may be claimed (retry backoff)
+    last_error = Column(Text, nullable=True)
+    
+    # Lease: a running job whose lease expired (its worker died) can be claimed again
+    leased_by = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # At most one queued or running job per document, even when two processes enqueue at once
+    __table_args__ = (
+        Index("ix_processing_jobs_active_document", document_id, unique=True,
+              sqlite_where=status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+              postgresql_where=status.in_([JobStatus.QUEUED, JobStatus.RUNNING])),
+    )
+    
+    def __repr__(self):
+        return f"<ProcessingJob(id={self.id}, document_id={self.document_id}, status={self.status})>"
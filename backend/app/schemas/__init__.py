@@ -7,7 +7,7 @@ from app.schemas.document import (
 )
 from app.schemas.chat import (
     ChatRequest, ChatResponse, ChatResponseData, 
-    ChatResponseMetadata, ChatMessage, ChatHistory
+    ChatResponseMetadata, ChatMessage, ChatHistory, SearchRequest
 )
 
 __all__ = [
@@ -19,5 +19,5 @@ __all__ = [
     "DocumentVisibility",
     # New
     "ChatRequest", "ChatResponse", "ChatResponseData",
-    "ChatResponseMetadata", "ChatMessage", "ChatHistory"
+    "ChatResponseMetadata", "ChatMessage", "ChatHistory", "SearchRequest"
 ]
\ No newline at end of file
@@ -1,17 +1,38 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+from app.config import settings
 
 class ChatRequest(BaseModel):
     document_id: int = Field(..., description="ID of the document to chat with")
     query: str = Field(..., min_length=1, max_length=1000, description="User's question")
     stream: Optional[bool] = Field(True, description="Whether to stream the response")
 
+class MultiChatRequest(BaseModel):
+    document_ids: List[int] = Field(..., min_length=1, max_length=settings.MULTI_CHAT_MAX_DOCUMENTS,
+                                    description="IDs of the documents to chat with")
+    query: str = Field(..., min_length=1, max_length=1000, description="User's question")
+    stream: Optional[bool] = Field(True, description="Whether to stream the response")
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1, max_length=1000, description="Search query")
+    top_k: int = Field(5, ge=1, le=50, description="Number of chunks to return across all documents")
+
 class ChatResponseMetadata(BaseModel):
-    document_id: int
+    document_id: Optional[int] = None
+    document_ids: Optional[List[int]] = None
     query: str
     is_relevant: bool
     context_chunks_retrieved: int
     top_similarity_score: float
+    retrieval_mode: Optional[str] = None
+    context_chunks_used: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    chunk_scores: Optional[List[Dict[str, Any]]] = None
+    ttft_ms: Optional[float] = None
+    cached: Optional[bool] = None
+    cache_type: Optional[str] = None
+    cache_similarity: Optional[float] = None
+    coalesced: Optional[bool] = None
 
 class ChatResponseData(BaseModel):
     document_id: int
@@ -24,6 +45,17 @@ class ChatResponse(BaseModel):
     message: str
     data: ChatResponseData
 
+class MultiChatResponseData(BaseModel):
+    document_ids: List[int]
+    query: str
+    response: str
+    metadata: ChatResponseMetadata
+
+class MultiChatResponse(BaseModel):
+    success: bool
+    message: str
+    data: MultiChatResponseData
+
 class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
     content: str
@@ -0,0 +1,96 @@
+"""
+Exact-match answer cache for repeated questions
+Keyed by (document_id, normalized query, model, prompt version, document
+embeddings version), so reprocessing a document or changing the model or
+prompt can never serve a stale answer. Entries expire after a TTL and the
+least recently used are evicted beyond a size bound.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[int, str, str, str, str]
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change the question"""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+class AnswerCache:
+    """In-process LRU + TTL cache of generated answers"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def make_key(document_id: int, query: str, document_version: str) -> CacheKey:
+        from app.services.gemini_service import GeminiChat
+        return (document_id, normalize_query(query), GeminiChat.MODEL_NAME, GeminiChat.PROMPT_VERSION, document_version)
+
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key: CacheKey, response: str, metadata: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), {"response": response, "metadata": dict(metadata)})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate_document(self, document_id: int):
+        """Drop every cached answer for a document (reprocessed or deleted)"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == document_id]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached answers for document {document_id}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+# Global cache instance (None when disabled)
+answer_cache = (
+    AnswerCache(settings.ANSWER_CACHE_MAX_ENTRIES, settings.ANSWER_CACHE_TTL_SECONDS)
+    if settings.ANSWER_CACHE_ENABLED else None
+)
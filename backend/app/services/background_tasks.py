@@ -1,10 +1,16 @@
 import asyncio
 import logging
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from itertools import islice
 from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
 from app.database import SessionLocal
 from app.models.document import Document, DocumentChunk
+from app.services.chat_service import chat_service
+from app.services.deduplication import clone_document, find_duplicate
+from app.services.embedding_cache import embedding_cache
+from app.services.job_queue import job_queue
 from app.services.pdf_processor import pdf_processor
 from app.utils.vector_store import vector_store_manager
 from datetime import datetime
@@ -18,11 +24,151 @@ class BackgroundTaskManager:
     """Manager for background processing tasks"""
     
     def __init__(self):
-        self.processing_tasks: Dict[int, asyncio.Task] = {}
         logger.info("Background task manager initialized")
     
-    async def process_document_async(self, document_id: int, user_id: int):
-        """Process document asynchronously - optimized"""
+    async def _stream_document(self, db, document: Document, vector_store) -> Dict[str, Any]:
+        """Extract, chunk, store and embed a document page by page; returns timings.
+        
+        Pages flow through a generator pipeline (extract -> chunk) that is pulled
+        one embedding round at a time, so only a round of chunks is in memory and
+        the next round is extracted while the current one is embedded. The document
+        becomes searchable (is_processed) after its first round; processed_at is set
+        once every chunk is stored. Chunk rows and flushed embeddings left by an
+        interrupted run are reused when the re-extracted chunks match them.
+        """
+        batch_size = settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_CONCURRENCY
+        loop = asyncio.get_event_loop()
+        chunk_iter = pdf_processor.iter_chunks(pdf_processor.iter_pages(document.file_path))
+        
+        stored = db.query(DocumentChunk.id).filter(
+            DocumentChunk.document_id == document.id
+        ).order_by(DocumentChunk.chunk_index).all()
+        # Skip chunks already embedded by an interrupted run (flushed segments)
+        done = vector_store.resume_point([chunk_id for chunk_id, in stored])
+        stored = len(stored)
+        if stored:
+            logger.info(f"Re-extracting document {document.id}: {stored} stored chunks, {done} embedded")
+        
+        start_time = time.time()
+        timings = {"extract_chunk": 0.0, "insert": 0.0, "embed": 0.0, "first_searchable": None}
+        chunk_count = 0
+        
+        def next_batch():
+            return list(islice(chunk_iter, batch_size))
+        
+        prefetch = executor.submit(next_batch)
+        try:
+            while True:
+                wait_start = time.time()
+                batch = await asyncio.wrap_future(prefetch)
+                prefetch = None
+                timings["extract_chunk"] += time.time() - wait_start
+                if not batch:
+                    break
+                # Extract the next round while this one is stored and embedded
+                prefetch = executor.submit(next_batch)
+                
+                insert_start = time.time()
+                batch_start = chunk_count
+                chunk_count += len(batch)
+                previous = dict(db.query(DocumentChunk.chunk_index, DocumentChunk.content).filter(
+                    DocumentChunk.document_id == document.id,
+                    DocumentChunk.chunk_index >= batch_start,
+                    DocumentChunk.chunk_index < chunk_count
+                ).all()) if batch_start < stored else {}
+                db_chunks = []
+                for chunk_index, (chunk_text, page_number) in enumerate(batch, start=batch_start):
+                    if chunk_index < stored:
+                        if previous.get(chunk_index) == chunk_text:
+                            continue
+                        # Chunking changed since the interrupted run: drop what follows
+                        logger.info(f"Stored chunks of document {document.id} differ from chunk {chunk_index} on")
+                        db.query(DocumentChunk).filter(
+                            DocumentChunk.document_id == document.id,
+                            DocumentChunk.chunk_index >= chunk_index
+                        ).delete()
+                        stored = chunk_index
+                        if done > chunk_index:
+                            await loop.run_in_executor(executor, vector_store.clear)
+                            done = 0
+                    db_chunks.append(DocumentChunk(
+                        document_id=document.id,
+                        chunk_index=chunk_index,
+                        content=chunk_text,
+                        page_number=page_number,
+                        token_count=pdf_processor.estimate_tokens(chunk_text)
+                    ))
+                if db_chunks:
+                    db.bulk_save_objects(db_chunks)
+                    db.commit()
+                timings["insert"] += time.time() - insert_start
+                
+                embed_start = time.time()
+                done = await self._embed_chunks(db, document.id, vector_store, done, chunk_count)
+                timings["embed"] += time.time() - embed_start
+                
+                if timings["first_searchable"] is None:
+                    document.is_processed = True
+                    db.commit()
+                    timings["first_searchable"] = time.time() - start_time
+                    logger.info(f"Document {document.id} searchable after {timings['first_searchable']:.2f}s "
+                                f"({chunk_count} chunks)")
+        finally:
+            # Stops extraction workers still running ahead; a round still being
+            # extracted (cancelled mid-prefetch) must finish before the generator can close
+            if prefetch is not None:
+                prefetch.add_done_callback(lambda _: chunk_iter.close())
+            else:
+                chunk_iter.close()
+        
+        if stored > chunk_count:
+            # Fewer chunks than the interrupted run stored
+            db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document.id,
+                DocumentChunk.chunk_index >= chunk_count
+            ).delete()
+            if done > chunk_count:
+                await loop.run_in_executor(executor, vector_store.clear)
+                done = await self._embed_chunks(db, document.id, vector_store, 0, chunk_count)
+        
+        document.processed_at = datetime.utcnow()
+        db.commit()
+        timings["chunks"] = chunk_count
+        return timings
+    
+    async def _embed_chunks(self, db, document_id: int, vector_store, start: int, end: int) -> int:
+        """Embed stored chunks [start, end) by chunk_index and flush them.
+        
+        Each round fills every concurrent embedding request and is flushed as an
+        append-only segment. Returns the new embedded count, which never goes
+        below start: a resumed store can be ahead of the chunks re-extracted so far.
+        """
+        batch_size = settings.EMBEDDING_BATCH_SIZE * settings.EMBEDDING_CONCURRENCY
+        loop = asyncio.get_event_loop()
+        for batch_start in range(start, end, batch_size):
+            chunks_db = db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id,
+                DocumentChunk.chunk_index >= batch_start,
+                DocumentChunk.chunk_index < min(batch_start + batch_size, end)
+            ).order_by(DocumentChunk.chunk_index).all()
+            texts = [chunk.content for chunk in chunks_db]
+            metadata_list = [{
+                "chunk_id": chunk.id,
+                "document_id": document_id,
+                "chunk_index": chunk.chunk_index,
+                "page_number": chunk.page_number,
+                "token_count": chunk.token_count
+            } for chunk in chunks_db]
+            await loop.run_in_executor(executor, vector_store.add_texts, texts, metadata_list)
+            await loop.run_in_executor(executor, vector_store.flush)
+        return max(start, end)
+    
+    async def process_document_async(self, document_id: int, user_id: Optional[int] = None):
+        """Process document asynchronously - optimized
+        
+        Run by a ProcessingWorker for a claimed job; errors are raised so the job
+        is retried.
+        """
         try:
             db = SessionLocal()
             start_time = time.time()
@@ -31,107 +177,123 @@ class BackgroundTaskManager:
             document = db.query(Document).filter(Document.id == document_id).first()
             if not document:
                 logger.error(f"Document {document_id} not found")
-                db.close()
+                # Deleted while an earlier attempt ran: drop anything that attempt left behind
+                await self._discard_deleted(db, document_id)
                 return
             
             logger.info(f"Starting optimized async processing for document {document_id}: {document.title}")
             
-            # Step 1: Extract text (runs in thread pool to not block)
-            logger.info(f"Extracting text from {document.filename}")
-            extract_start = time.time()
-            full_text, page_parts = await asyncio.get_event_loop().run_in_executor(
-                executor,
-                pdf_processor.extract_text_from_pdf,
-                document.file_path
-            )
-            extract_time = time.time() - extract_start
-            logger.info(f"Text extraction completed in {extract_time:.2f}s")
-            
-            # Step 2: Create chunks
-            chunk_start = time.time()
-            chunks = pdf_processor.chunk_text(full_text, page_parts)
-            chunk_time = time.time() - chunk_start
-            logger.info(f"Chunking completed in {chunk_time:.2f}s: {len(chunks)} chunks")
-            
-            # Step 3: Save chunks in batch (faster than individual inserts)
-            insert_start = time.time()
-            db_chunks = []
-            for chunk_index, (chunk_text, page_number) in enumerate(chunks):
-                token_count = pdf_processor.estimate_tokens(chunk_text)
-                db_chunk = DocumentChunk(
-                    document_id=document.id,
-                    chunk_index=chunk_index,
-                    content=chunk_text,
-                    page_number=page_number,
-                    token_count=token_count
-                )
-                db_chunks.append(db_chunk)
-            
-            # Batch insert
-            db.bulk_save_objects(db_chunks)
-            db.commit()
-            insert_time = time.time() - insert_start
-            logger.info(f"Batch chunk insert completed in {insert_time:.2f}s")
+            # Same file already processed: reuse its chunks and vector store
+            source = find_duplicate(db, document) if document.embeddings_created_at is None else None
+            if source is not None:
+                try:
+                    chunk_count = clone_document(db, source, document)
+                    logger.info(f"✅ Deduplicated document {document_id} from document {source.id}: "
+                                f"{chunk_count} chunks in {time.time() - start_time:.3f}s")
+                    return
+                except Exception as e:
+                    logger.warning(f"Could not reuse document {source.id} for document {document_id}, processing it: {e}")
             
-            # Step 4: Update document as processed
-            document.is_processed = True
-            document.processed_at = datetime.utcnow()
-            db.commit()
-            
-            # Step 5: Create embeddings (parallel processing)
-            embed_start = time.time()
+            # Pin the store so the cache can't evict it while it is being filled
+            vector_store_manager.pin(document_id)
+            vector_store = vector_store_manager.get_store(document_id)
             
-            # Fetch chunks again (they have IDs now)
-            chunks_db = db.query(DocumentChunk).filter(
+            # Extraction is skipped when resuming a document whose chunks were all stored
+            chunk_ids = [chunk_id for chunk_id, in db.query(DocumentChunk.id).filter(
                 DocumentChunk.document_id == document_id
-            ).order_by(DocumentChunk.chunk_index).all()
+            ).order_by(DocumentChunk.chunk_index).all()]
+            if document.processed_at is not None and chunk_ids:
+                done = vector_store.resume_point(chunk_ids)
+                logger.info(f"Resuming embeddings for document {document_id} at chunk {done}/{len(chunk_ids)}")
+                embed_start = time.time()
+                await self._embed_chunks(db, document_id, vector_store, done, len(chunk_ids))
+                timings = {"extract_chunk": 0.0, "insert": 0.0, "embed": time.time() - embed_start,
+                           "first_searchable": None, "chunks": len(chunk_ids)}
+            else:
+                timings = await self._stream_document(db, document, vector_store)
             
-            texts = [chunk.content for chunk in chunks_db]
-            metadata_list = [{
-                "chunk_id": chunk.id,
-                "document_id": document_id,
-                "chunk_index": chunk.chunk_index,
-                "page_number": chunk.page_number,
-                "token_count": chunk.token_count
-            } for chunk in chunks_db]
-            
-            # Process embeddings in parallel batches
-            vector_store = vector_store_manager.get_store(document_id)
-            vector_store.clear()
-            
-            # Batch embeddings by processing multiple chunks concurrently
-            batch_size = 10
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i+batch_size]
-                batch_metadata = metadata_list[i:i+batch_size]
-                vector_store.add_texts(batch_texts, batch_metadata)
+            # The compaction and global index update rewrite files: keep them off the event loop.
+            # A document deleted meanwhile must not leave store files or global index rows behind.
+            loop = asyncio.get_event_loop()
+            if not self._document_exists(db, document_id):
+                logger.info(f"Document {document_id} was deleted during processing, discarding its vector store")
+                await self._discard_deleted(db, document_id)
+                return
+            await loop.run_in_executor(executor, vector_store_manager.save_store, document_id)
+            if not self._document_exists(db, document_id):
+                logger.info(f"Document {document_id} was deleted while its vector store was saved, discarding it")
+                await self._discard_deleted(db, document_id)
+                return
             
-            vector_store.save()
-            embed_time = time.time() - embed_start
-            logger.info(f"Embedding creation completed in {embed_time:.2f}s")
+            if embedding_cache is not None:
+                cache_stats = embedding_cache.get_stats()
+                logger.info(f"Embedding cache: {cache_stats['hit_ratio']:.1%} hit ratio, {cache_stats['entries']} entries")
             
-            # Step 6: Mark embeddings as created
+            # Mark embeddings as created
             document.embeddings_created_at = datetime.utcnow()
             db.commit()
+            chat_service.invalidate_document(document_id)
             
             total_time = time.time() - start_time
+            first_searchable = timings["first_searchable"]
             logger.info(f"✅ Optimized async processing complete for document {document_id}")
-            logger.info(f"   Total time: {total_time:.2f}s | Extract: {extract_time:.2f}s | Chunk: {chunk_time:.2f}s | Insert: {insert_time:.2f}s | Embed: {embed_time:.2f}s")
-            logger.info(f"   Chunks: {len(chunks_db)}, Embeddings: created")
+            logger.info(f"   Total time: {total_time:.2f}s | Extract+chunk: {timings['extract_chunk']:.2f}s | "
+                        f"Insert: {timings['insert']:.2f}s | Embed: {timings['embed']:.2f}s | First searchable: "
+                        f"{f'{first_searchable:.2f}s' if first_searchable is not None else 'n/a'}")
+            logger.info(f"   Chunks: {timings['chunks']}, Embeddings: created")
             
         except Exception as e:
             logger.error(f"Error in async processing for document {document_id}: {e}", exc_info=True)
+            raise
+        finally:
+            db.close()
+            vector_store_manager.unpin(document_id)
+    
+    @staticmethod
+    def _document_exists(db, document_id: int) -> bool:
+        return db.query(Document.id).filter(Document.id == document_id).first() is not None
+    
+    async def _discard_deleted(self, db, document_id: int):
+        """Remove the chunks and vector store written for a document that no longer exists"""
+        db.rollback()
+        db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).delete()
+        db.commit()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(executor, vector_store_manager.delete_store, document_id)
+    
+    def resume_interrupted(self):
+        """Queue documents whose embeddings were never completed and that have no job yet.
+        
+        Called on startup. Interrupted jobs need nothing: their lease expires and
+        a worker claims them again, reusing chunks already in the database and
+        embedding batches already flushed to the vector store.
+        """
+        db = SessionLocal()
+        try:
+            queued = job_queue.enqueue_unprocessed(db)
+        finally:
+            db.close()
+        if queued:
+            logger.info(f"Queued processing for {queued} unprocessed documents")
+        self._run_inline()
+    
+    def start_processing(self, document_id: int, user_id: int) -> int:
+        """Queue background processing for a document; returns the job id"""
+        db = SessionLocal()
+        try:
+            job_id = job_queue.enqueue(db, document_id, user_id).id
         finally:
             db.close()
-            # Remove task from tracking
-            if document_id in self.processing_tasks:
-                del self.processing_tasks[document_id]
+        self._run_inline()
+        return job_id
     
-    def start_processing(self, document_id: int, user_id: int):
-        """Start background processing for a document"""
-        task = asyncio.create_task(self.process_document_async(document_id, user_id))
-        self.processing_tasks[document_id] = task
-        return task
+    def _run_inline(self):
+        """Make sure this process works the queue when jobs aren't left to run_worker.py"""
+        if settings.PROCESSING_MODE != "inline":
+            return
+        from app.services.processing_worker import processing_worker
+        processing_worker.start()
+        processing_worker.wake()
 
 # Global instance
 background_task_manager = BackgroundTaskManager()
\ No newline at end of file
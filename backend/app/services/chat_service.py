@@ -1,5 +1,12 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional, Generator
+import numpy as np
+from typing import List, Dict, Any, Optional, AsyncGenerator, Tuple
+from app.config import settings
+from app.services.answer_cache import answer_cache, normalize_query
+from app.services.context_packer import pack_context
+from app.services.semantic_cache import semantic_cache
+from app.services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -10,35 +17,132 @@ class ChatService:
             "i cannot find", "not in the document", "not mentioned", "unclear",
             "not certain", "unable to determine", "not specified", "insufficient information"
         ]
+        # Identical concurrent requests share one retrieval + generation
+        self.in_flight = SingleFlight()
         
-    def retrieve_context(self, document_id: int, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Retrieve relevant context from document"""
+    async def retrieve_context_async(self, document_id: int, query: str, top_k: int = 5,
+                                     mode: Optional[str] = None,
+                                     query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Retrieve relevant context from document.
+        
+        mode (default settings.RETRIEVAL_MODE): "dense" vector search, "sparse"
+        BM25 keyword search, or "hybrid" - both run in parallel worker threads and
+        are fused with reciprocal-rank fusion. Each chunk carries its per-source scores.
+        A precomputed query_embedding saves the dense search its embedding call.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
         try:
-            # Import inside method to avoid circular import
-            from app.utils.vector_store import vector_store_manager
-            vector_store = vector_store_manager.get_store(document_id)
-            results = vector_store.similarity_search(query, k=top_k, threshold=self.relevance_threshold)
-            
-            # Format results
-            context_chunks = []
-            for metadata, similarity in results:
-                # Use 'content' field if available, otherwise fall back to text_preview
-                text_content = metadata.get("content", metadata.get("text_preview", ""))
-                context_chunks.append({
-                    "chunk_id": metadata["chunk_id"],
-                    "chunk_index": metadata["chunk_index"],
-                    "page_number": metadata.get("page_number"),
-                    "text": text_content,
-                    "similarity_score": similarity
-                })
+            dense, sparse = await self._search_sources_async(document_id, query, top_k, mode, query_embedding)
+            context_chunks = self._fuse(dense, sparse, top_k)
             
-            logger.info(f"Retrieved {len(context_chunks)} context chunks for query: {query[:50]}...")
+            logger.info(f"Retrieved {len(context_chunks)} context chunks ({mode}) for query: {query[:50]}...")
             return context_chunks
             
         except Exception as e:
             logger.error(f"Error retrieving context: {e}")
             return []
     
+    async def retrieve_context_multi_async(self, document_ids: List[int], query: str, top_k: Optional[int] = None,
+                                           mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Retrieve from several documents concurrently and keep the global top-k.
+        
+        The query is embedded once. Each document's dense and sparse candidates
+        are merged into global rankings before fusion, so documents compete on
+        score instead of each getting a fixed share of the context.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        top_k = top_k or settings.MULTI_CHAT_TOP_K
+        query_embedding = await self._embed_query(query) if mode != "sparse" else None
+        
+        results = await asyncio.gather(*[
+            self._search_sources_async(document_id, query, top_k, mode, query_embedding)
+            for document_id in document_ids
+        ], return_exceptions=True)
+        
+        dense, sparse = [], []
+        for document_id, result in zip(document_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error retrieving context from document {document_id}: {result}")
+                continue
+            dense.extend(result[0])
+            sparse.extend(result[1])
+        
+        dense.sort(key=lambda item: item[1], reverse=True)
+        sparse.sort(key=lambda item: item[1], reverse=True)
+        context_chunks = self._fuse(dense, sparse, top_k)
+        
+        logger.info(
+            f"Retrieved {len(context_chunks)} context chunks ({mode}) from {len(document_ids)} documents "
+            f"for query: {query[:50]}..."
+        )
+        return context_chunks
+    
+    async def _search_sources_async(self, document_id: int, query: str, top_k: int, mode: str,
+                                    query_embedding: Optional[np.ndarray] = None
+                                    ) -> Tuple[List[Tuple[Dict[str, Any], float]], List[Tuple[Dict[str, Any], float]]]:
+        """(dense, sparse) results of one document, before fusion"""
+        from app.utils.vector_store import vector_store_manager
+        vector_store = await asyncio.to_thread(vector_store_manager.get_store, document_id)
+        
+        def dense_search(k: int):
+            if query_embedding is not None:
+                return vector_store.similarity_search_by_vector(query_embedding, k, self.relevance_threshold)
+            return vector_store.similarity_search(query, k, self.relevance_threshold)
+        
+        if mode == "dense":
+            return await asyncio.to_thread(dense_search, top_k), []
+        if mode == "sparse":
+            return [], await asyncio.to_thread(vector_store.keyword_search, query, top_k)
+        
+        candidates = max(top_k, settings.HYBRID_CANDIDATES)
+        return await asyncio.gather(
+            self._source_results_async(asyncio.to_thread(dense_search, candidates), "dense"),
+            self._source_results_async(asyncio.to_thread(
+                vector_store.keyword_search, query, candidates
+            ), "sparse")
+        )
+    
+    @staticmethod
+    async def _source_results_async(awaitable, source: str) -> List[Tuple[Dict[str, Any], float]]:
+        try:
+            return await awaitable
+        except Exception as e:
+            logger.warning(f"{source} retrieval failed: {e}")
+            return []
+    
+    def _fuse(self, dense: List[Tuple[Dict[str, Any], float]], sparse: List[Tuple[Dict[str, Any], float]],
+              top_k: int) -> List[Dict[str, Any]]:
+        """Reciprocal-rank fusion: score = sum over sources of 1 / (RRF_K + rank)"""
+        chunks: Dict[Tuple[Optional[int], int], Dict[str, Any]] = {}
+        for source, results in (("dense", dense), ("sparse", sparse)):
+            for rank, (metadata, score) in enumerate(results, 1):
+                key = (metadata.get("document_id"), metadata["chunk_index"])
+                chunk = chunks.get(key)
+                if chunk is None:
+                    # Use 'content' field if available, otherwise fall back to text_preview
+                    text_content = metadata.get("content", metadata.get("text_preview", ""))
+                    chunk = chunks[key] = {
+                        "document_id": metadata.get("document_id"),
+                        "chunk_id": metadata["chunk_id"],
+                        "chunk_index": metadata["chunk_index"],
+                        "page_number": metadata.get("page_number"),
+                        "text": text_content,
+                        "similarity_score": 0.0,
+                        "dense_score": None,
+                        "dense_rank": None,
+                        "sparse_score": None,
+                        "sparse_rank": None,
+                        "rrf_score": 0.0
+                    }
+                chunk[f"{source}_score"] = score
+                chunk[f"{source}_rank"] = rank
+                chunk["rrf_score"] += 1.0 / (settings.RRF_K + rank)
+                if source == "dense":
+                    chunk["similarity_score"] = score
+        
+        fused = sorted(chunks.values(), key=lambda c: c["rrf_score"], reverse=True)
+        return fused[:top_k]
+    
     def is_query_relevant(self, context_chunks: List[Dict[str, Any]]) -> bool:
         """Check if query is relevant to the document"""
         # Always return true - let the model decide relevance
@@ -66,99 +170,205 @@ class ChatService:
         
         return False
     
-    def format_prompt(self, query: str, context_chunks: List[Dict[str, Any]]) -> str:
-        """Format the prompt for RAG - optimized to prevent hallucination"""
-        
-        # Combine context chunks
-        context_text = ""
-        for i, chunk in enumerate(context_chunks, 1):
-            page_info = f" [Page {chunk['page_number']}]" if chunk.get('page_number') else ""
-            context_text += f"{chunk['text']}\n\n"
-        
-        # Strict prompt to prevent hallucination, with clear formatting
-        prompt = f"""You are an assistant that answers questions based ONLY on provided documents.
-
-CRITICAL RULES:
-1. ONLY use information explicitly stated in the document
-2. Do NOT use any external knowledge or training data
-3. Do NOT make assumptions, inferences, or extrapolations
-4. Provide a complete, detailed answer using the document content
-5. If information is not in the document, say: "I cannot find this information in the document."
-6. Be specific and quote relevant parts when applicable
-
-Document Content:
-{context_text}
-
-User Question: {query}
-
-Complete Answer (based ONLY on the document above):"""
+    async def generate_response_async(self, query: str, context_chunks: List[Dict[str, Any]],
+                                      packed_context: Optional[Dict[str, Any]] = None) -> AsyncGenerator[str, None]:
+        """Generate AI response based on context (packed to the prompt token budget unless already packed).
         
-        return prompt
-    
-    def generate_response(self, query: str, context_chunks: List[Dict[str, Any]]) -> Generator[str, None, None]:
-        """Generate AI response based on context"""
+        Tokens are awaited, never blocking the event loop; a failed LLM call raises.
+        """
         try:
             from app.services.gemini_service import GeminiChat
 
             if not context_chunks:
                 yield "I couldn't find information in the document to answer your question."
                 return
-            
-            # Build context text from all chunks
-            context_text = ""
-            for chunk in context_chunks:
-                context_text += f"{chunk['text']}\n\n"
 
-            logger.info(f"Generating response for: {query[:50]}... (using {len(context_chunks)} context chunks)")
+            packed_context = packed_context or pack_context(query, context_chunks)
+            logger.info(
+                f"Generating response for: {query[:50]}... (using {packed_context['chunks_used']} context chunks, "
+                f"~{packed_context['prompt_tokens']} prompt tokens)"
+            )
 
-            # Generate response using Gemini
-            response = GeminiChat.generate_response(
+            async for text in GeminiChat.stream_response_async(
                 query=query,
-                context_text=context_text,
+                context_text=packed_context["context_text"],
                 temperature=0.3,
                 max_tokens=1024
-            )
-            
-            # Yield the entire response at once (Gemini API returns full response)
-            yield response
+            ):
+                yield text
 
         except Exception as e:
+            # Raised, not yielded: error text must never reach the client as an answer
             logger.error(f"Error generating response: {e}", exc_info=True)
-            yield f"Error: {str(e)}"
+            raise
     
-    def get_chat_response(self, document_id: int, query: str, stream: bool = True) -> Dict[str, Any]:
-        """Main method to get chat response"""
+    async def get_chat_response_async(self, document_id: int, query: str, stream: bool = True,
+                                      document_version: Optional[str] = None) -> Dict[str, Any]:
+        """Main method to get chat response; "stream_generator" is an async generator.
         
-        # Retrieve context
-        context_chunks = self.retrieve_context(document_id, query)
+        Concurrent identical requests (same document, normalized query and version)
+        share one retrieval and one generation; metadata["coalesced"] marks the
+        requests that joined one already in flight.
+        """
+        key = (document_id, normalize_query(query), document_version)
+        return await self._coalesced_response(
+            key, query, stream, lambda: self._answer_stream(document_id, query, document_version)
+        )
+    
+    async def get_multi_chat_response_async(self, document_ids: List[int], query: str, stream: bool = True,
+                                            source_titles: Optional[Dict[int, str]] = None) -> Dict[str, Any]:
+        """One answer over several documents: concurrent retrieval, a global top-k
+        and a single LLM call whose context is tagged with each chunk's source.
+        
+        Not served from the answer caches (they are per document); identical
+        in-flight requests are still coalesced.
+        """
+        key = (tuple(sorted(document_ids)), normalize_query(query), None)
+        return await self._coalesced_response(
+            key, query, stream, lambda: self._multi_answer_stream(document_ids, query, source_titles)
+        )
+    
+    async def _coalesced_response(self, key, query: str, stream: bool, start) -> Dict[str, Any]:
+        """Join (or start) the flight for key: {"metadata", "stream_generator"} or {"metadata", "response"}"""
+        metadata, tokens, shared = await self.in_flight.join(key, start)
+        metadata = {**metadata, "query": query, "coalesced": shared}
         
+        if stream:
+            return {
+                "metadata": metadata,
+                "stream_generator": tokens
+            }
+        
+        response_text = ""
+        async for chunk in tokens:
+            response_text += chunk
+        
+        return {
+            "metadata": metadata,
+            "response": response_text.strip()
+        }
+    
+    async def _answer_stream(self, document_id: int, query: str,
+                             document_version: Optional[str]) -> Tuple[Dict[str, Any], AsyncGenerator[str, None]]:
+        """(metadata, token stream) for a query.
+        
+        With a document_version (the document's embeddings_created_at), answers are
+        served from and stored in the exact and semantic answer caches;
+        metadata["cached"] / ["cache_type"] tell which. The query is embedded at
+        most once, and only when dense retrieval or the semantic cache needs it.
+        """
+        cache_key = None
+        query_embedding = None
+        if document_version is not None:
+            if answer_cache is not None:
+                cache_key = answer_cache.make_key(document_id, query, document_version)
+                cached = answer_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"Answer cache hit for document {document_id}: {query[:50]}...")
+                    return self._cached_response(cached, query, cache_type="exact")
+            
+            if semantic_cache is not None and (settings.RETRIEVAL_MODE != "sparse"
+                                               or settings.SEMANTIC_CACHE_IN_SPARSE_MODE):
+                # The embedding is reused by the dense search on a miss
+                query_embedding = await self._embed_query(query)
+                match = semantic_cache.lookup(document_id, document_version, query_embedding) \
+                    if query_embedding is not None else None
+                if match is not None:
+                    cached, similarity = match
+                    logger.info(f"Semantic cache hit ({similarity:.3f}) for document {document_id}: {query[:50]}...")
+                    return self._cached_response(cached, query, cache_type="semantic",
+                                                 cache_similarity=similarity)
+        
+        context_chunks = await self.retrieve_context_async(document_id, query, query_embedding=query_embedding)
+        packed_context = pack_context(query, context_chunks)
+        metadata = self._response_metadata(document_id, query, context_chunks, packed_context)
+        metadata["cached"] = False
+        
+        def store(response_text: str):
+            if document_version is None or not context_chunks or not self._is_answer(response_text):
+                return
+            cached_metadata = {k: v for k, v in metadata.items() if k != "ttft_ms"}
+            if cache_key is not None:
+                answer_cache.put(cache_key, response_text.strip(), cached_metadata)
+            if semantic_cache is not None and query_embedding is not None:
+                semantic_cache.put(document_id, document_version, query_embedding,
+                                   response_text.strip(), cached_metadata)
+        
+        return metadata, self._cache_stream(store, self.generate_response_async(query, context_chunks, packed_context))
+    
+    async def _multi_answer_stream(self, document_ids: List[int], query: str,
+                                   source_titles: Optional[Dict[int, str]]
+                                   ) -> Tuple[Dict[str, Any], AsyncGenerator[str, None]]:
+        context_chunks = await self.retrieve_context_multi_async(document_ids, query)
+        packed_context = pack_context(query, context_chunks, source_titles=source_titles or {})
+        metadata = self._response_metadata(None, query, context_chunks, packed_context)
+        metadata["document_ids"] = document_ids
+        metadata["cached"] = False
+        return metadata, self.generate_response_async(query, context_chunks, packed_context)
+    
+    def _cached_response(self, cached: Dict[str, Any], query: str,
+                         **cache_info) -> Tuple[Dict[str, Any], AsyncGenerator[str, None]]:
+        metadata = {**cached["metadata"], "query": query, "cached": True, **cache_info}
+        return metadata, self._replay(cached["response"])
+    
+    @staticmethod
+    async def _embed_query(query: str) -> Optional[np.ndarray]:
+        from app.services.embedding_provider import get_embedding_provider
+        try:
+            return await asyncio.to_thread(get_embedding_provider().embed_query, query)
+        except Exception as e:
+            logger.warning(f"Query embedding failed: {e}")
+            return None
+    
+    @staticmethod
+    async def _replay(response: str) -> AsyncGenerator[str, None]:
+        yield response
+    
+    @staticmethod
+    async def _cache_stream(store, generator: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Pass tokens through; hand the full answer to `store` once the stream completes"""
+        response_text = ""
+        async for chunk in generator:
+            response_text += chunk
+            yield chunk
+        store(response_text)
+    
+    @staticmethod
+    def _is_answer(response_text: str) -> bool:
+        """Empty output is never cached (failed generations raise before store is called)"""
+        return bool(response_text.strip())
+    
+    def invalidate_document(self, document_id: int):
+        """Forget cached answers for a document (reprocessed or deleted)"""
+        if answer_cache is not None:
+            answer_cache.invalidate_document(document_id)
+        if semantic_cache is not None:
+            semantic_cache.invalidate_document(document_id)
+    
+    def _response_metadata(self, document_id: Optional[int], query: str, context_chunks: List[Dict[str, Any]],
+                           packed_context: Dict[str, Any]) -> Dict[str, Any]:
         # Check relevance
         is_relevant = self.is_query_relevant(context_chunks)
         
         # Prepare response metadata
-        metadata = {
+        return {
             "document_id": document_id,
             "query": query,
             "is_relevant": is_relevant,
             "context_chunks_retrieved": len(context_chunks),
-            "top_similarity_score": max([c["similarity_score"] for c in context_chunks]) if context_chunks else 0
+            "top_similarity_score": max([c["similarity_score"] for c in context_chunks]) if context_chunks else 0,
+            "retrieval_mode": settings.RETRIEVAL_MODE,
+            "context_chunks_used": packed_context["chunks_used"],
+            "prompt_tokens": packed_context["prompt_tokens"],
+            "chunk_scores": [{
+                "document_id": c.get("document_id"),
+                "chunk_index": c["chunk_index"],
+                "page_number": c["page_number"],
+                "dense_score": c["dense_score"],
+                "sparse_score": c["sparse_score"],
+                "rrf_score": c["rrf_score"]
+            } for c in context_chunks]
         }
-        
-        if stream:
-            return {
-                "metadata": metadata,
-                "stream_generator": self.generate_response(query, context_chunks)
-            }
-        else:
-            # For non-streaming, collect all generated text
-            response_text = ""
-            for chunk in self.generate_response(query, context_chunks):
-                response_text += chunk
-            
-            return {
-                "metadata": metadata,
-                "response": response_text.strip()
-            }
 
 # Global instance
 chat_service = ChatService()
\ No newline at end of file
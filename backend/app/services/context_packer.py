@@ -0,0 +1,197 @@
+"""
+Token-budgeted context packing for RAG prompts
+Turns retrieved chunks into the context text sent to the LLM:
+drops chunks that score far below the best, removes duplicates and
+chunks contained in others, merges neighbouring chunk_index runs
+(stripping the overlap at their seams) and fills a prompt token budget
+most relevant first, so prompt size - and LLM latency and cost - is
+bounded regardless of CHUNK_SIZE and top_k. With source titles (multi-document
+chat) every block is tagged with the document and pages it came from.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shortest shared text treated as overlap between neighbouring chunks
+MIN_OVERLAP_CHARS = 20
+SEPARATOR = "\n\n"
+# Budget reserved per chunk for its "[Source: ...]" tag
+SOURCE_TAG_TOKENS = 16
+
+
+def estimate_tokens(text: str) -> int:
+    """Same estimate used for DocumentChunk.token_count"""
+    from app.services.pdf_processor import pdf_processor
+    return pdf_processor.estimate_tokens(text) if text else 0
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _relevance(chunks: List[Dict[str, Any]]) -> List[float]:
+    """Per-chunk score relative to the best chunk of each retrieval source.
+
+    RRF scores are too flat to threshold, so each source's raw score is
+    scaled by that source's best and a chunk keeps its strongest source.
+    Chunks without any scores (e.g. handed in directly) count as relevant.
+    """
+    best = {}
+    for source in ("dense_score", "sparse_score"):
+        scores = [c[source] for c in chunks if c.get(source) is not None]
+        best[source] = max(scores) if scores else 0.0
+
+    relevance = []
+    for chunk in chunks:
+        scaled = [chunk[source] / best[source] for source in best
+                  if chunk.get(source) is not None and best[source] > 0]
+        relevance.append(max(scaled) if scaled else 1.0)
+    return relevance
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right"""
+    tail = left[-max(settings.CHUNK_OVERLAP * 8, MIN_OVERLAP_CHARS):]
+    probe = right[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = tail.find(probe)
+    while start != -1:
+        if right.startswith(tail[start:]):
+            return len(tail) - start
+        start = tail.find(probe, start + 1)
+    return 0
+
+
+def _source_tag(block: Dict[str, Any], source_titles: Dict[int, str]) -> str:
+    title = source_titles.get(block["document_id"]) or f"Document {block['document_id']}"
+    pages = sorted(set(block["page_numbers"]))
+    if not pages:
+        return f"[Source: {title}]\n"
+    page_range = f"p. {pages[0]}" if len(pages) == 1 else f"pp. {pages[0]}-{pages[-1]}"
+    return f"[Source: {title}, {page_range}]\n"
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens at a word boundary"""
+    words = text.split()
+    # estimate_tokens counts ~1.3 tokens per word
+    keep = int(max_tokens / 1.3)
+    return " ".join(words[:keep]) if keep < len(words) else text
+
+
+def pack_context(query: str, chunks: List[Dict[str, Any]],
+                 max_prompt_tokens: Optional[int] = None,
+                 min_relative_score: Optional[float] = None,
+                 source_titles: Optional[Dict[int, str]] = None) -> Dict[str, Any]:
+    """Pack retrieved chunks (best first) into a prompt token budget.
+
+    source_titles (document_id -> title), when given, turns on source tags.
+
+    Returns context_text, the packed blocks (merged chunks in prompt order),
+    prompt_tokens (system prompt + user prompt), context_tokens and the
+    number of chunks dropped as low-score, duplicate or over budget.
+    """
+    from app.services.gemini_service import GeminiChat
+
+    max_prompt_tokens = max_prompt_tokens or settings.CONTEXT_MAX_PROMPT_TOKENS
+    if min_relative_score is None:
+        min_relative_score = settings.CONTEXT_MIN_RELATIVE_SCORE
+
+    overhead = estimate_tokens(GeminiChat.SYSTEM_PROMPT) + estimate_tokens(GeminiChat.build_prompt(query, ""))
+    budget = max(max_prompt_tokens - overhead, 0)
+    stats = {"low_score": 0, "duplicate": 0, "over_budget": 0}
+
+    # 1. Trim low-score chunks, keep the rest in relevance order
+    candidates = []
+    for chunk, relevance in zip(chunks, _relevance(chunks)):
+        if not chunk.get("text"):
+            continue
+        if relevance < min_relative_score:
+            stats["low_score"] += 1
+            continue
+        candidates.append(chunk)
+
+    # 2. Dedupe: identical text, or text contained in a better chunk
+    kept: List[Dict[str, Any]] = []
+    kept_texts: List[str] = []
+    for chunk in candidates:
+        text = _normalize(chunk["text"])
+        if any(text in other for other in kept_texts):
+            stats["duplicate"] += 1
+            continue
+        kept.append(chunk)
+        kept_texts.append(text)
+
+    # 3. Fill the budget, most relevant first
+    selected = []
+    used = 0
+    for chunk in kept:
+        tag_tokens = SOURCE_TAG_TOKENS if source_titles is not None else 0
+        tokens = (chunk.get("token_count") or estimate_tokens(chunk["text"])) + tag_tokens
+        if used + tokens > budget:
+            if not selected and budget > tag_tokens:
+                # Never send an empty context because the best chunk is too long
+                chunk = {**chunk, "text": _truncate(chunk["text"], budget - tag_tokens)}
+                tokens = estimate_tokens(chunk["text"]) + tag_tokens
+            else:
+                stats["over_budget"] += 1
+                continue
+        selected.append((len(selected), chunk))
+        used += tokens
+
+    # 4. Merge runs of adjacent chunk_index (same document) into one block
+    blocks: List[Dict[str, Any]] = []
+    ordered = sorted(selected, key=lambda item: (
+        item[1].get("document_id") or 0,
+        item[1].get("chunk_index") if item[1].get("chunk_index") is not None else float("inf"),
+        item[0],
+    ))
+    for rank, chunk in ordered:
+        previous = blocks[-1] if blocks else None
+        index = chunk.get("chunk_index")
+        if (previous is not None and index is not None
+                and previous["document_id"] == chunk.get("document_id")
+                and previous["chunk_indexes"][-1] == index - 1):
+            overlap = _overlap(previous["text"], chunk["text"])
+            previous["text"] += chunk["text"][overlap:] if overlap else SEPARATOR + chunk["text"]
+            previous["chunk_indexes"].append(index)
+            previous["rank"] = min(previous["rank"], rank)
+            if chunk.get("page_number"):
+                previous["page_numbers"].append(chunk["page_number"])
+            continue
+        blocks.append({
+            "document_id": chunk.get("document_id"),
+            "chunk_indexes": [index] if index is not None else [],
+            "page_numbers": [chunk["page_number"]] if chunk.get("page_number") else [],
+            "text": chunk["text"],
+            "rank": rank,
+        })
+
+    # Blocks in the prompt follow the relevance of their best chunk
+    blocks.sort(key=lambda block: block["rank"])
+    if source_titles is not None:
+        for block in blocks:
+            block["text"] = _source_tag(block, source_titles) + block["text"]
+    context_text = "".join(f"{block['text']}{SEPARATOR}" for block in blocks)
+    context_tokens = estimate_tokens(context_text)
+
+    dropped = sum(stats.values())
+    if dropped or len(blocks) < len(selected):
+        logger.info(
+            f"Packed {len(selected)}/{len(chunks)} chunks into {len(blocks)} blocks, "
+            f"{context_tokens} context tokens (dropped: {stats})"
+        )
+
+    return {
+        "context_text": context_text,
+        "blocks": blocks,
+        "chunks_used": len(selected),
+        "chunks_dropped": dropped,
+        "context_tokens": context_tokens,
+        "prompt_tokens": overhead + context_tokens,
+    }
@@ -0,0 +1,65 @@
+"""
+Content-hash deduplication of uploaded documents
+A document whose file has the same SHA-256 as an already processed one gets
+a copy of that document's chunks and a hardlinked clone of its vector store
+instead of being extracted, chunked and embedded again.
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import insert, literal, select
+from sqlalchemy.orm import Session
+from app.models.document import Document, DocumentChunk
+from app.services.chat_service import chat_service
+from app.utils.vector_store import vector_store_manager
+
+logger = logging.getLogger(__name__)
+
+# Columns copied from the source document's chunks
+CHUNK_COLUMNS = ("chunk_index", "content", "page_number", "token_count", "embedding", "embedding_model")
+
+
+def find_duplicate(db: Session, document: Document) -> Optional[Document]:
+    """Oldest fully processed document with the same content, if any"""
+    if not document.content_hash:
+        return None
+    return db.query(Document).filter(
+        Document.content_hash == document.content_hash,
+        Document.id != document.id,
+        Document.embeddings_created_at.isnot(None)
+    ).order_by(Document.id).first()
+
+
+def clone_document(db: Session, source: Document, target: Document) -> int:
+    """Give target the chunks and vector store of source; returns the chunk count.
+
+    Chunks are copied with one INSERT ... SELECT and committed together with
+    the processed flags, so a failure leaves target unprocessed.
+    """
+    try:
+        db.query(DocumentChunk).filter(DocumentChunk.document_id == target.id).delete()
+        columns = [getattr(DocumentChunk, name) for name in CHUNK_COLUMNS]
+        db.execute(insert(DocumentChunk).from_select(
+            ["document_id", *CHUNK_COLUMNS],
+            select(literal(target.id), *columns).where(DocumentChunk.document_id == source.id)
+        ))
+        chunk_ids = dict(db.query(DocumentChunk.chunk_index, DocumentChunk.id).filter(
+            DocumentChunk.document_id == target.id
+        ).all())
+
+        vector_store_manager.clone_store(source.id, target.id, chunk_ids)
+
+        now = datetime.utcnow()
+        target.is_processed = True
+        target.processed_at = now
+        target.embeddings_created_at = now
+        db.commit()
+    except Exception:
+        db.rollback()
+        vector_store_manager.delete_store(target.id)
+        raise
+
+    chat_service.invalidate_document(target.id)
+    logger.info(f"Document {target.id} reuses the chunks and embeddings of document {source.id} ({len(chunk_ids)} chunks)")
+    return len(chunk_ids)
@@ -0,0 +1,164 @@
+"""
+Persistent content-addressed embedding cache
+Embeddings are keyed by SHA-256 of (model name, task type, text) and stored
+as float32 blobs in SQLite, so identical chunks are embedded once across
+documents, reprocessing and restarts. Least recently used entries are
+evicted once the cache grows past its byte budget.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Evict down to this fraction of max_bytes so eviction doesn't run on every insert
+EVICTION_TARGET = 0.9
+
+
+def cache_key(model_name: str, task_type: str, text: str) -> bytes:
+    """Content address of an embedding"""
+    digest = hashlib.sha256()
+    for part in (model_name, task_type, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with LRU eviction by size"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache at {path}: {self._total_bytes / 1024 / 1024:.1f} MB")
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        """Return the cached embeddings for whichever keys are present"""
+        found = {}
+        if not keys:
+            return found
+
+        with self._lock:
+            unique = list(set(keys))
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            hits = sum(1 for key in keys if key in found)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+
+        return found
+
+    def get(self, key: bytes) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[bytes, Sequence[float]]):
+        """Store embeddings, evicting least recently used entries if over budget"""
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, embedding in items.items():
+            vector = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((key, vector, len(vector), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            # Replaced keys are counted twice; _evict() re-syncs the total from the table
+            self._total_bytes += sum(row[2] for row in rows)
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def put(self, key: bytes, embedding: Sequence[float]):
+        self.put_many({key: embedding})
+
+    def _evict(self):
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        target = self.max_bytes * EVICTION_TARGET
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        evicted = 0
+        cursor = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used")
+        doomed = []
+        for key, size in cursor:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+            evicted += 1
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._conn.commit()
+        self.stats["evictions"] += evicted
+        logger.info(f"Evicted {evicted} embeddings from cache ({self._total_bytes / 1024 / 1024:.1f} MB left)")
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": entries,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Global cache instance (None when disabled)
+embedding_cache = (
+    EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_BYTES)
+    if settings.EMBEDDING_CACHE_ENABLED else None
+)
@@ -0,0 +1,87 @@
+"""
+Embedding providers used by VectorStore
+"gemini" calls the Gemini API (batched, cached on disk); "local" hashes
+n-grams on the CPU with no network calls. Vectors from different
+providers are not comparable, so a document must be reprocessed after
+switching EMBEDDING_PROVIDER.
+"""
+
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Type
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingProvider:
+    """Base class: turns texts into embedding vectors"""
+
+    name = ""
+
+    def get_dimension(self) -> int:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed chunk texts; returns an array of shape (len(texts), dimension)"""
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed a search query; returns an array of shape (dimension,)"""
+        raise NotImplementedError
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """Gemini API embeddings"""
+
+    name = "gemini"
+
+    def get_dimension(self) -> int:
+        from app.services.gemini_service import GeminiEmbeddings
+        return GeminiEmbeddings.get_dimension()
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        from app.services.gemini_service import GeminiEmbeddings
+        return np.array(GeminiEmbeddings.create_embeddings(texts), dtype=np.float32).reshape(len(texts), -1)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        from app.services.gemini_service import GeminiEmbeddings
+        return np.array(GeminiEmbeddings.create_embedding(text), dtype=np.float32)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """Offline hashing embeddings (FastEmbeddingService)"""
+
+    name = "local"
+
+    def __init__(self, embedding_dim: Optional[int] = None):
+        from app.services.fast_embeddings import FastEmbeddingService
+        self.service = FastEmbeddingService(embedding_dim or settings.LOCAL_EMBEDDING_DIM)
+
+    def get_dimension(self) -> int:
+        return self.service.get_embedding_dimension()
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self.service.create_embeddings(texts)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.service.create_single_embedding(text)
+
+
+PROVIDERS: Dict[str, Type[EmbeddingProvider]] = {
+    GeminiEmbeddingProvider.name: GeminiEmbeddingProvider,
+    LocalEmbeddingProvider.name: LocalEmbeddingProvider,
+}
+
+_providers: Dict[str, EmbeddingProvider] = {}
+
+
+def get_embedding_provider(name: Optional[str] = None) -> EmbeddingProvider:
+    """Shared provider instance by name (default: settings.EMBEDDING_PROVIDER)"""
+    name = name or settings.EMBEDDING_PROVIDER
+    if name not in _providers:
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown embedding provider: {name}")
+        _providers[name] = PROVIDERS[name]()
+        logger.info(f"Using {name} embedding provider ({_providers[name].get_dimension()} dims)")
+    return _providers[name]
@@ -4,9 +4,21 @@ Gemini Service - Handles embeddings and LLM chat via Google's Gemini API
 
 import google.generativeai as genai
 from functools import lru_cache
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Generator, List, Optional
+import asyncio
+import json
+import logging
 import os
+import random
+import threading
+import time
+import httpx
+import requests
 from app.config import settings
+from app.services.embedding_cache import embedding_cache, cache_key
+
+logger = logging.getLogger(__name__)
 
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", settings.gemini_api_key if hasattr(settings, 'gemini_api_key') else None)
@@ -19,6 +31,7 @@ class GeminiEmbeddings:
     
     MODEL_NAME = "models/embedding-001"
     DIMENSION = 768  # Gemini embedding dimension
+    TASK_TYPE = "retrieval_document"
     
     @staticmethod
     @lru_cache(maxsize=1024)
@@ -32,28 +45,224 @@ class GeminiEmbeddings:
         Returns:
             List of float values representing the embedding
         """
+        key = cache_key(GeminiEmbeddings.MODEL_NAME, GeminiEmbeddings.TASK_TYPE, text)
+        if embedding_cache is not None:
+            cached = embedding_cache.get(key)
+            if cached is not None:
+                return cached
+        
         try:
             result = genai.embed_content(
                 model=GeminiEmbeddings.MODEL_NAME,
                 content=text,
-                task_type="retrieval_document",
+                task_type=GeminiEmbeddings.TASK_TYPE,
                 title="Document"
             )
+            if embedding_cache is not None:
+                embedding_cache.put(key, result['embedding'])
             return result['embedding']
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
     
+    @staticmethod
+    def create_embeddings(texts: List[str]) -> List[List[float]]:
+        """
+        Create embeddings for many texts using batched, concurrent requests
+        
+        Args:
+            texts: The texts to embed
+            
+        Returns:
+            One embedding per text, in the same order
+        """
+        if embedding_cache is None:
+            return batch_embeddings.create_embeddings(texts)
+        
+        # Only texts missing from the on-disk cache go to the API
+        keys = [cache_key(GeminiEmbeddings.MODEL_NAME, GeminiEmbeddings.TASK_TYPE, text) for text in texts]
+        found = embedding_cache.get_many(keys)
+        
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        
+        if missing:
+            embeddings = batch_embeddings.create_embeddings(list(missing.values()))
+            new_entries = dict(zip(missing.keys(), embeddings))
+            embedding_cache.put_many(new_entries)
+            found.update(new_entries)
+        
+        return [found[key] for key in keys]
+    
     @staticmethod
     def get_dimension() -> int:
         """Get the dimension of Gemini embeddings"""
         return GeminiEmbeddings.DIMENSION
 
 
+class TokenBucket:
+    """Thread-safe token bucket: refills `rate` tokens per second up to `capacity`"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GeminiBatchEmbeddings:
+    """
+    Batch embedding client for the Gemini REST batchEmbedContents endpoint
+    
+    Texts are split into batches that are sent concurrently; every request
+    takes a token from a shared rate limiter, and 429/5xx responses are
+    retried with exponential backoff (honouring Retry-After).
+    """
+    
+    MAX_BATCH_SIZE = 100  # batchEmbedContents limit
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model_name: str = GeminiEmbeddings.MODEL_NAME,
+        batch_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        timeout: float = 60.0
+    ):
+        self.api_key = api_key if api_key is not None else GEMINI_API_KEY
+        self.base_url = (base_url or settings.GEMINI_API_BASE_URL).rstrip("/")
+        self.model_name = model_name
+        self.batch_size = min(batch_size or settings.EMBEDDING_BATCH_SIZE, self.MAX_BATCH_SIZE)
+        self.max_concurrency = max(1, max_concurrency or settings.EMBEDDING_CONCURRENCY)
+        self.max_retries = max_retries if max_retries is not None else settings.EMBEDDING_MAX_RETRIES
+        self.timeout = timeout
+        
+        rpm = requests_per_minute or settings.EMBEDDING_REQUESTS_PER_MINUTE
+        self.rate_limiter = TokenBucket(rate=rpm / 60.0, capacity=self.max_concurrency)
+        
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    @property
+    def endpoint(self) -> str:
+        return f"{self.base_url}/v1beta/{self.model_name}:batchEmbedContents"
+    
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed up to MAX_BATCH_SIZE texts with one request (retrying on rate limits)"""
+        payload = {
+            "requests": [{
+                "model": self.model_name,
+                "content": {"parts": [{"text": text}]},
+                "taskType": GeminiEmbeddings.TASK_TYPE.upper(),
+                "title": "Document"
+            } for text in texts]
+        }
+        
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.post(
+                    self.endpoint,
+                    headers={"x-goog-api-key": self.api_key or ""},
+                    json=payload,
+                    timeout=self.timeout
+                )
+            except requests.ConnectionError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Embedding request failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            
+            if response.status_code in self.RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"Embedding request returned {response.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            
+            response.raise_for_status()
+            embeddings = [item["values"] for item in response.json()["embeddings"]]
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            return embeddings
+    
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Exponential backoff with jitter, capped at 30s
+        return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+    
+    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed any number of texts; batches run concurrently, order is preserved"""
+        if not texts:
+            return []
+        
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self.embed_batch(batches[0])
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            results = pool.map(self.embed_batch, batches)
+            return [embedding for batch in results for embedding in batch]
+
+
+# Shared client so the rate limit applies across all callers in this process
+batch_embeddings = GeminiBatchEmbeddings()
+
+
 class GeminiChat:
     """Handle LLM chat responses using Google Gemini API"""
     
     MODEL_NAME = "gemini-1.5-flash"  # Fast model for quick responses
+    # Bump whenever SYSTEM_PROMPT or build_prompt() changes (part of the answer cache key)
+    PROMPT_VERSION = "2"
+    
+    SYSTEM_PROMPT = """You are a helpful assistant that answers questions based ONLY on the provided context. 
+If the answer is not in the context, clearly state that you don't have that information.
+Do not make up or hallucinate information.
+Provide accurate, concise answers directly from the context provided."""
+    
+    # Shared connection pools for streaming requests
+    session = requests.Session()
+    _async_client: Optional[httpx.AsyncClient] = None
+    _async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    @staticmethod
+    def build_prompt(query: str, context_text: str) -> str:
+        """User prompt: retrieved context followed by the question"""
+        return f"""Context from documents:
+{context_text}
+
+User Question: {query}
+
+Answer the question using ONLY the context provided above. If the answer is not in the context, say you don't have that information."""
     
     @staticmethod
     def generate_response(
@@ -75,21 +284,9 @@ class GeminiChat:
             The generated response as a string
         """
         try:
-            system_prompt = """You are a helpful assistant that answers questions based ONLY on the provided context. 
-If the answer is not in the context, clearly state that you don't have that information.
-Do not make up or hallucinate information.
-Provide accurate, concise answers directly from the context provided."""
-            
-            full_prompt = f"""Context from documents:
-{context_text}
-
-User Question: {query}
-
-Answer the question using ONLY the context provided above. If the answer is not in the context, say you don't have that information."""
-            
             model = genai.GenerativeModel(
                 model_name=GeminiChat.MODEL_NAME,
-                system_instruction=system_prompt,
+                system_instruction=GeminiChat.SYSTEM_PROMPT,
                 generation_config={
                     "temperature": temperature,
                     "top_p": 0.9,
@@ -98,7 +295,7 @@ Answer the question using ONLY the context provided above. If the answer is not
                 }
             )
             
-            response = model.generate_content(full_prompt)
+            response = model.generate_content(GeminiChat.build_prompt(query, context_text))
             
             if response.text:
                 return response.text
@@ -108,6 +305,122 @@ Answer the question using ONLY the context provided above. If the answer is not
         except Exception as e:
             print(f"Error generating response: {e}")
             raise
+    
+    @staticmethod
+    def stream_response(
+        query: str,
+        context_text: str,
+        temperature: float = 0.3,
+        max_tokens: int = 1024
+    ) -> Generator[str, None, None]:
+        """
+        Stream a response from the Gemini streamGenerateContent endpoint (SSE)
+        
+        Args:
+            query: The user's question
+            context_text: The retrieved context from documents
+            temperature: Controls randomness (0.0 to 1.0)
+            max_tokens: Maximum length of response
+            
+        Yields:
+            Text fragments as the model produces them
+        """
+        url, payload = GeminiChat._stream_request(query, context_text, temperature, max_tokens)
+        
+        with GeminiChat.session.post(
+            url,
+            params={"alt": "sse"},
+            headers={"x-goog-api-key": GEMINI_API_KEY or ""},
+            json=payload,
+            stream=True,
+            timeout=(10, 120)
+        ) as response:
+            response.raise_for_status()
+            # chunk_size=None: hand over each event as soon as it arrives instead of filling a buffer
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                yield from GeminiChat._parse_event(line)
+    
+    @staticmethod
+    async def stream_response_async(
+        query: str,
+        context_text: str,
+        temperature: float = 0.3,
+        max_tokens: int = 1024
+    ) -> AsyncGenerator[str, None]:
+        """
+        Async version of stream_response; waiting on the model never blocks the event loop
+        
+        Args:
+            query: The user's question
+            context_text: The retrieved context from documents
+            temperature: Controls randomness (0.0 to 1.0)
+            max_tokens: Maximum length of response
+            
+        Yields:
+            Text fragments as the model produces them
+        """
+        url, payload = GeminiChat._stream_request(query, context_text, temperature, max_tokens)
+        
+        async with GeminiChat._get_async_client().stream(
+            "POST",
+            url,
+            params={"alt": "sse"},
+            headers={"x-goog-api-key": GEMINI_API_KEY or ""},
+            json=payload
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                for text in GeminiChat._parse_event(line):
+                    yield text
+    
+    @staticmethod
+    def _stream_request(query: str, context_text: str, temperature: float, max_tokens: int):
+        """URL and JSON body of a streamGenerateContent call"""
+        url = f"{settings.GEMINI_API_BASE_URL.rstrip('/')}/v1beta/models/{GeminiChat.MODEL_NAME}:streamGenerateContent"
+        payload = {
+            "systemInstruction": {"parts": [{"text": GeminiChat.SYSTEM_PROMPT}]},
+            "contents": [{"role": "user", "parts": [{"text": GeminiChat.build_prompt(query, context_text)}]}],
+            "generationConfig": {
+                "temperature": temperature,
+                "topP": 0.9,
+                "topK": 30,
+                "maxOutputTokens": max_tokens,
+            }
+        }
+        return url, payload
+    
+    @staticmethod
+    def _parse_event(line: str) -> List[str]:
+        """Text parts of one SSE line ("data: {...}") of the first candidate"""
+        if not line or not line.startswith("data:"):
+            return []
+        event = json.loads(line[len("data:"):])
+        texts = []
+        for candidate in event.get("candidates", [])[:1]:
+            for part in candidate.get("content", {}).get("parts", []):
+                if part.get("text"):
+                    texts.append(part["text"])
+        return texts
+    
+    @staticmethod
+    def _get_async_client() -> httpx.AsyncClient:
+        """Shared async client; its connection pool is tied to the event loop that created it"""
+        loop = asyncio.get_running_loop()
+        if GeminiChat._async_client is None or GeminiChat._async_client_loop is not loop:
+            GeminiChat._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                limits=httpx.Limits(max_connections=settings.LLM_MAX_CONNECTIONS)
+            )
+            GeminiChat._async_client_loop = loop
+        return GeminiChat._async_client
+    
+    @staticmethod
+    async def aclose():
+        """Close the async client (application shutdown)"""
+        if GeminiChat._async_client is not None:
+            await GeminiChat._async_client.aclose()
+            GeminiChat._async_client = None
+            GeminiChat._async_client_loop = None
 
 
 # Convenience functions for backward compatibility
@@ -0,0 +1,207 @@
+"""
+Durable queue of document processing jobs
+Jobs live in the processing_jobs table, so they survive restarts and are
+shared by every worker process using the database. A worker claims a job
+with a compare-and-set UPDATE that grants it a lease, and renews the lease
+while the job runs; a job whose lease expired (its worker died) is claimed
+again. Failed jobs are retried with exponential backoff up to max_attempts.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.document import Document
+from app.models.processing_job import JobStatus, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = (JobStatus.QUEUED, JobStatus.RUNNING)
+# Claimable jobs examined per claim() call
+CLAIM_CANDIDATES = 10
+
+# (job_id, document_id, user_id, attempt)
+ClaimedJob = Tuple[int, int, Optional[int], int]
+
+
+class JobQueue:
+    """Enqueue, claim, renew and finish processing jobs"""
+
+    def __init__(self, lease_seconds: Optional[int] = None, max_attempts: Optional[int] = None,
+                 retry_delay_seconds: Optional[int] = None):
+        self.lease_seconds = lease_seconds or settings.PROCESSING_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.PROCESSING_MAX_ATTEMPTS
+        self.retry_delay_seconds = retry_delay_seconds or settings.PROCESSING_RETRY_DELAY_SECONDS
+
+    def enqueue(self, db: Session, document_id: int, user_id: Optional[int] = None) -> ProcessingJob:
+        """Queue processing of a document; returns its active job if it already has one.
+
+        The partial unique index on active jobs makes this atomic: when another
+        process inserts a job for the document between the check and the
+        insert, the insert fails and that job is returned.
+        """
+        job = self._active_job(db, document_id)
+        if job is not None:
+            return job
+
+        job = ProcessingJob(
+            document_id=document_id,
+            user_id=user_id,
+            status=JobStatus.QUEUED,
+            max_attempts=self.max_attempts,
+            run_after=datetime.utcnow()
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            job = self._active_job(db, document_id)
+            if job is None:
+                raise
+            return job
+        db.refresh(job)
+        logger.info(f"Queued processing job {job.id} for document {document_id}")
+        return job
+
+    @staticmethod
+    def _active_job(db: Session, document_id: int) -> Optional[ProcessingJob]:
+        return db.query(ProcessingJob).filter(
+            ProcessingJob.document_id == document_id,
+            ProcessingJob.status.in_(ACTIVE_STATUSES)
+        ).first()
+
+    def enqueue_unprocessed(self, db: Session) -> int:
+        """Queue documents without embeddings that never had a job (e.g. uploaded before the queue existed)"""
+        has_job = db.query(ProcessingJob.id).filter(ProcessingJob.document_id == Document.id).exists()
+        documents = db.query(Document.id, Document.uploaded_by_id).filter(
+            Document.embeddings_created_at.is_(None),
+            ~has_job
+        ).all()
+        for document_id, user_id in documents:
+            self.enqueue(db, document_id, user_id)
+        return len(documents)
+
+    def claim(self, db: Session, worker_id: str) -> Optional[ClaimedJob]:
+        """Lease the next runnable job to worker_id; None if there is none.
+
+        Runnable: queued and due, or running with an expired lease. The UPDATE
+        only matches if nobody claimed the job since it was read, so concurrent
+        workers never get the same job.
+        """
+        now = datetime.utcnow()
+        expired = and_(ProcessingJob.status == JobStatus.RUNNING, ProcessingJob.lease_expires_at < now)
+        candidates = db.query(ProcessingJob).filter(or_(
+            and_(ProcessingJob.status == JobStatus.QUEUED, ProcessingJob.run_after <= now),
+            expired
+        )).order_by(ProcessingJob.run_after, ProcessingJob.id).limit(CLAIM_CANDIDATES).all()
+
+        # Plain values: commit() expires the ORM objects
+        rows = [(job.id, job.document_id, job.user_id, job.attempts, job.max_attempts,
+                 job.status == JobStatus.RUNNING, job.leased_by) for job in candidates]
+
+        for job_id, document_id, user_id, attempts, max_attempts, abandoned, leased_by in rows:
+            unchanged = db.query(ProcessingJob).filter(
+                ProcessingJob.id == job_id,
+                ProcessingJob.attempts == attempts,
+                expired if abandoned else ProcessingJob.status == JobStatus.QUEUED
+            )
+            if abandoned and attempts >= max_attempts:
+                # Its worker died on the last attempt
+                unchanged.update({
+                    ProcessingJob.status: JobStatus.FAILED,
+                    ProcessingJob.last_error: f"Lease expired on attempt {attempts}/{max_attempts}",
+                    ProcessingJob.leased_by: None,
+                    ProcessingJob.lease_expires_at: None,
+                    ProcessingJob.finished_at: now
+                }, synchronize_session=False)
+                db.commit()
+                logger.error(f"Processing job {job_id} for document {document_id} failed: lease expired")
+                continue
+
+            claimed = unchanged.update({
+                ProcessingJob.status: JobStatus.RUNNING,
+                ProcessingJob.attempts: ProcessingJob.attempts + 1,
+                ProcessingJob.leased_by: worker_id,
+                ProcessingJob.lease_expires_at: now + timedelta(seconds=self.lease_seconds)
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                if abandoned:
+                    logger.warning(f"Reclaimed processing job {job_id} from {leased_by} (lease expired)")
+                return job_id, document_id, user_id, attempts + 1
+        return None
+
+    def renew(self, db: Session, job_id: int, worker_id: str) -> bool:
+        """Extend the lease of a running job; False if worker_id no longer holds it"""
+        renewed = db.query(ProcessingJob).filter(
+            ProcessingJob.id == job_id,
+            ProcessingJob.status == JobStatus.RUNNING,
+            ProcessingJob.leased_by == worker_id
+        ).update({
+            ProcessingJob.lease_expires_at: datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        }, synchronize_session=False)
+        db.commit()
+        return bool(renewed)
+
+    def complete(self, db: Session, job_id: int, worker_id: str) -> bool:
+        return self._finish(db, job_id, worker_id, {
+            ProcessingJob.status: JobStatus.COMPLETED,
+            ProcessingJob.last_error: None,
+            ProcessingJob.finished_at: datetime.utcnow()
+        })
+
+    def fail(self, db: Session, job_id: int, worker_id: str, error: str) -> bool:
+        """Queue the job again after a backoff, or mark it failed on its last attempt"""
+        job = db.query(ProcessingJob).filter(ProcessingJob.id == job_id).first()
+        if job is None:
+            return False
+        now = datetime.utcnow()
+        if job.attempts < job.max_attempts:
+            delay = self.retry_delay_seconds * 2 ** (job.attempts - 1)
+            logger.warning(f"Processing job {job_id} attempt {job.attempts}/{job.max_attempts} failed, "
+                           f"retrying in {delay}s: {error}")
+            values = {ProcessingJob.status: JobStatus.QUEUED, ProcessingJob.run_after: now + timedelta(seconds=delay)}
+        else:
+            logger.error(f"Processing job {job_id} failed after {job.attempts} attempts: {error}")
+            values = {ProcessingJob.status: JobStatus.FAILED, ProcessingJob.finished_at: now}
+        return self._finish(db, job_id, worker_id, {**values, ProcessingJob.last_error: error})
+
+    def release(self, db: Session, job_id: int, worker_id: str) -> bool:
+        """Give a job back without counting the attempt (worker shutting down)"""
+        return self._finish(db, job_id, worker_id, {
+            ProcessingJob.status: JobStatus.QUEUED,
+            ProcessingJob.attempts: ProcessingJob.attempts - 1,
+            ProcessingJob.run_after: datetime.utcnow()
+        })
+
+    def _finish(self, db: Session, job_id: int, worker_id: str, values: Dict[Any, Any]) -> bool:
+        """Apply values and drop the lease, if worker_id still holds it"""
+        updated = db.query(ProcessingJob).filter(
+            ProcessingJob.id == job_id,
+            ProcessingJob.status == JobStatus.RUNNING,
+            ProcessingJob.leased_by == worker_id
+        ).update({
+            **values,
+            ProcessingJob.leased_by: None,
+            ProcessingJob.lease_expires_at: None
+        }, synchronize_session=False)
+        db.commit()
+        if not updated:
+            logger.warning(f"Processing job {job_id} is no longer leased by {worker_id}")
+        return bool(updated)
+
+    def latest_job(self, db: Session, document_id: int) -> Optional[ProcessingJob]:
+        return db.query(ProcessingJob).filter(
+            ProcessingJob.document_id == document_id
+        ).order_by(ProcessingJob.id.desc()).first()
+
+    def get_stats(self, db: Session) -> Dict[str, int]:
+        counts = dict(db.query(ProcessingJob.status, func.count(ProcessingJob.id)).group_by(ProcessingJob.status).all())
+        return {status.value: counts.get(status, 0) for status in JobStatus}
+
+# Global instance
+job_queue = JobQueue()
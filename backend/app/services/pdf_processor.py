@@ -1,143 +1,229 @@
 import os
 import uuid
+import asyncio
+import hashlib
 import logging
+import multiprocessing
 import re
-from typing import List, Tuple, Optional
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple, Optional
 import PyPDF2
 import fitz  # PyMuPDF
 from app.config import settings
+from app.utils.pdf_pages import extract_page_range, iter_page_range
 
 logger = logging.getLogger(__name__)
 
 # Simple regex-based token counter (faster than character counting)
 TOKEN_PATTERN = re.compile(r'\b\w+\b')
 
+class FileTooLargeError(ValueError):
+    """Upload exceeded settings.MAX_UPLOAD_SIZE"""
+
+
 class PDFProcessor:
     def __init__(self):
         self.upload_dir = settings.UPLOAD_DIR
         os.makedirs(self.upload_dir, exist_ok=True)
+        self._extraction_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
     
-    def save_uploaded_file(self, file, filename: str) -> Tuple[str, str]:
-        """Save uploaded file with unique filename"""
+    async def save_uploaded_file(self, upload, filename: str,
+                                 max_size: Optional[int] = None) -> Tuple[str, str, int, str]:
+        """Stream an upload to disk with a unique filename.
+        
+        Reads UPLOAD_CHUNK_SIZE at a time, so memory stays constant per upload;
+        the size limit is enforced and the SHA-256 computed as bytes arrive, and
+        the file only appears under its final name once complete (temp file +
+        rename). Returns (unique_filename, file_path, file_size, sha256).
+        """
+        max_size = max_size or settings.MAX_UPLOAD_SIZE
+        
         # Generate unique filename
         file_ext = os.path.splitext(filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_ext}"
         file_path = os.path.join(self.upload_dir, unique_filename)
+        tmp_path = f"{file_path}.part"
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            buffer.write(file.read())
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
+        digest = hashlib.sha256()
+        file_size = 0
+        try:
+            buffer = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                while True:
+                    chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    file_size += len(chunk)
+                    if file_size > max_size:
+                        raise FileTooLargeError(f"File size exceeds {max_size // (1024 * 1024)}MB limit")
+                    # Hashing and disk I/O stay off the event loop
+                    await asyncio.to_thread(self._write_chunk, buffer, digest, chunk)
+            finally:
+                await asyncio.to_thread(buffer.close)
+            os.replace(tmp_path, file_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
         
-        logger.info(f"Saved uploaded file: {unique_filename} ({file_size} bytes)")
-        return unique_filename, file_path, file_size
+        sha256 = digest.hexdigest()
+        logger.info(f"Saved uploaded file: {unique_filename} ({file_size} bytes, sha256 {sha256[:12]})")
+        return unique_filename, file_path, file_size, sha256
+    
+    @staticmethod
+    def _write_chunk(buffer, digest, chunk: bytes):
+        digest.update(chunk)
+        buffer.write(chunk)
     
     def extract_text_from_pdf(self, file_path: str) -> Tuple[str, List[Tuple[str, int]]]:
         """Extract text from PDF with page numbers - optimized"""
-        text_parts = []
-        
+        text_parts = list(self.iter_pages(file_path))
+        full_text = "\n\n".join([text for text, _ in text_parts])
+        return full_text, text_parts
+    
+    def iter_pages(self, file_path: str) -> Iterator[Tuple[str, int]]:
+        """Yield (text, page_num) of the non-empty pages, in order, as they are extracted"""
+        page_total = 0
         try:
             # Try PyMuPDF first (faster and more accurate)
-            doc = fitz.open(file_path)
-            for page_num, page in enumerate(doc, start=1):
-                # Use faster text extraction without OCR
-                text = page.get_text("text", sort=False).strip()
-                if text:
-                    text_parts.append((text, page_num))
-            doc.close()
-            
-            if text_parts:
-                logger.info(f"Extracted text from PDF using PyMuPDF: {len(text_parts)} pages")
-                full_text = "\n\n".join([text for text, _ in text_parts])
-                return full_text, text_parts
+            with fitz.open(file_path) as doc:
+                page_count = doc.page_count
+            for part in self._iter_fitz_pages(file_path, page_count):
+                page_total += 1
+                yield part
         except Exception as e:
+            if page_total:
+                # Pages already handed downstream can't be taken back
+                raise
             logger.warning(f"PyMuPDF failed, trying PyPDF2: {e}")
         
+        if page_total:
+            logger.info(f"Extracted text from PDF using PyMuPDF: {page_total} pages")
+            return
+        
         # Fallback to PyPDF2
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                text_parts = []
                 
                 for page_num, page in enumerate(pdf_reader.pages, start=1):
                     text = page.extract_text().strip() if hasattr(page, 'extract_text') else ""
                     if text:
-                        text_parts.append((text, page_num))
+                        page_total += 1
+                        yield text, page_num
                 
-                if text_parts:
-                    logger.info(f"Extracted text from PDF using PyPDF2: {len(text_parts)} pages")
-                    full_text = "\n\n".join([text for text, _ in text_parts])
-                    return full_text, text_parts
-                else:
+                if not page_total:
                     raise ValueError("No text could be extracted from PDF")
+                logger.info(f"Extracted text from PDF using PyPDF2: {page_total} pages")
         except Exception as e:
             logger.error(f"Failed to extract text from PDF: {e}")
             raise
     
+    def _iter_fitz_pages(self, file_path: str, page_count: int) -> Iterator[Tuple[str, int]]:
+        """Yield pages in order; large PDFs are split into page ranges extracted ahead by worker processes"""
+        workers = min(
+            settings.PDF_EXTRACTION_WORKERS,
+            page_count // max(settings.PDF_EXTRACTION_MIN_PAGES_PER_WORKER, 1)
+        )
+        if workers <= 1:
+            yield from iter_page_range(file_path, 0, page_count)
+            return
+        
+        # A few ranges per worker keeps them busy when some pages are much heavier
+        ranges = min(workers * 4, page_count // max(settings.PDF_EXTRACTION_MIN_PAGES_PER_WORKER, 1))
+        bounds = [page_count * i // ranges for i in range(ranges + 1)]
+        # Only a window of ranges is extracted ahead of the consumer, bounding memory
+        window = workers * 2
+        pending = deque()
+        submitted = 0
+        try:
+            while True:
+                try:
+                    pool = self._get_extraction_pool()
+                    while submitted < ranges and len(pending) < window:
+                        start, end = bounds[submitted], bounds[submitted + 1]
+                        pending.append((start, pool.submit(extract_page_range, file_path, start, end)))
+                        submitted += 1
+                    if not pending:
+                        break
+                    # Ranges are consumed in submission order, so pages stay in order
+                    text_parts = pending[0][1].result()
+                    pending.popleft()
+                except Exception as e:
+                    resume_at = pending[0][0] if pending else bounds[submitted]
+                    logger.warning(f"Parallel extraction failed, extracting in-process from page {resume_at + 1}: {e}")
+                    self.shutdown()
+                    yield from iter_page_range(file_path, resume_at, page_count)
+                    return
+                yield from text_parts
+        finally:
+            for _, future in pending:
+                future.cancel()
+        
+        logger.info(f"Extracted {page_count} pages in {ranges} ranges across {workers} worker processes")
+    
+    def _get_extraction_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._extraction_pool is None:
+                # spawn: forking a process that runs an event loop and thread pools is unsafe
+                self._extraction_pool = ProcessPoolExecutor(
+                    max_workers=settings.PDF_EXTRACTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._extraction_pool
+    
+    def shutdown(self):
+        """Stop the extraction worker processes (recreated on next use)"""
+        with self._pool_lock:
+            pool, self._extraction_pool = self._extraction_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
     def chunk_text(self, text: str, page_parts: List[Tuple[str, int]] = None, max_overlap: int = 50) -> List[Tuple[str, Optional[int]]]:
         """Split text into chunks for embedding - optimized with overlap"""
-        chunks = []
+        # If we have page parts, try to keep page boundaries
+        chunks = list(self.iter_chunks(page_parts or [(text, None)]))
+        logger.info(f"Created {len(chunks)} text chunks (optimized)")
+        return chunks
+    
+    def iter_chunks(self, pages: Iterable[Tuple[str, Optional[int]]]) -> Iterator[Tuple[str, Optional[int]]]:
+        """Yield (chunk_text, page_num) as soon as each chunk is complete.
+        
+        Consumes pages lazily, so chunks of the first pages are available while
+        later pages are still being extracted.
+        """
         chunk_size = settings.CHUNK_SIZE
+        current_chunk = ""
+        current_page = None
+        current_token_count = 0
         
-        # If we have page parts, try to keep page boundaries
-        if page_parts:
-            current_chunk = ""
-            current_page = None
-            current_token_count = 0
-            
-            for page_text, page_num in page_parts:
-                # Split page text by paragraphs (more efficient split)
-                paragraphs = [p.strip() for p in page_text.split('\n\n') if p.strip()]
-                
-                for paragraph in paragraphs:
-                    para_tokens = self.estimate_tokens(paragraph)
-                    
-                    # If adding this paragraph would exceed chunk size, start new chunk
-                    if current_token_count + para_tokens > chunk_size:
-                        if current_chunk:
-                            chunks.append((current_chunk.strip(), current_page))
-                        current_chunk = paragraph
-                        current_page = page_num
-                        current_token_count = para_tokens
-                    else:
-                        if current_chunk:
-                            current_chunk += "\n\n" + paragraph
-                        else:
-                            current_chunk = paragraph
-                            current_page = page_num
-                        current_token_count += para_tokens
-            
-            # Add the last chunk
-            if current_chunk:
-                chunks.append((current_chunk.strip(), current_page))
-        else:
-            # Fallback: simple splitting by paragraphs
-            paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-            current_chunk = ""
-            current_tokens = 0
+        for page_text, page_num in pages:
+            # Split page text by paragraphs (more efficient split)
+            paragraphs = [p.strip() for p in page_text.split('\n\n') if p.strip()]
             
             for paragraph in paragraphs:
                 para_tokens = self.estimate_tokens(paragraph)
                 
-                if current_tokens + para_tokens > chunk_size:
+                # If adding this paragraph would exceed chunk size, start new chunk
+                if current_token_count + para_tokens > chunk_size:
                     if current_chunk:
-                        chunks.append((current_chunk.strip(), None))
+                        yield current_chunk.strip(), current_page
                     current_chunk = paragraph
-                    current_tokens = para_tokens
+                    current_page = page_num
+                    current_token_count = para_tokens
                 else:
                     if current_chunk:
                         current_chunk += "\n\n" + paragraph
                     else:
                         current_chunk = paragraph
-                    current_tokens += para_tokens
-            
-            if current_chunk:
-                chunks.append((current_chunk.strip(), None))
+                        current_page = page_num
+                    current_token_count += para_tokens
         
-        logger.info(f"Created {len(chunks)} text chunks (optimized)")
-        return chunks
+        # Add the last chunk
+        if current_chunk:
+            yield current_chunk.strip(), current_page
     
     def estimate_tokens(self, text: str) -> int:
         """Fast token estimation using regex (more accurate than char count)"""
@@ -0,0 +1,138 @@
+"""
+Processing worker: runs document processing jobs from the durable job queue
+Runs inside the API process (PROCESSING_MODE=inline) or standalone via
+run_worker.py (PROCESSING_MODE=worker), in which case ingestion scales with
+the number of worker processes, independently of the API workers.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Dict, Optional
+from app.config import settings
+from app.database import SessionLocal
+from app.services.job_queue import ClaimedJob, job_queue
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingWorker:
+    """Claims jobs and processes their documents, PROCESSING_CONCURRENCY at a time"""
+
+    def __init__(self, worker_id: Optional[str] = None, concurrency: Optional[int] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency or settings.PROCESSING_CONCURRENCY
+        self.running: Dict[int, asyncio.Task] = {}  # job_id -> task
+        self.stats = {"completed": 0, "failed": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def start(self) -> asyncio.Task:
+        """Run the worker loop in the current event loop (no-op if it already runs there)"""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._stopping = False
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self.run())
+        return self._task
+
+    def wake(self):
+        """Check for new jobs now instead of at the next poll"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        logger.info(f"Processing worker {self.worker_id} started (concurrency {self.concurrency})")
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                while len(self.running) < self.concurrency and not self._stopping:
+                    job = await asyncio.to_thread(self._call, job_queue.claim, self.worker_id)
+                    if job is None:
+                        break
+                    if self._stopping:
+                        # stop() was called while claiming
+                        await asyncio.to_thread(self._call, job_queue.release, job[0], self.worker_id)
+                        break
+                    self._start_job(job)
+            except Exception as e:
+                logger.error(f"Processing worker {self.worker_id} could not claim jobs: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.PROCESSING_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        logger.info(f"Processing worker {self.worker_id} stopped")
+
+    async def stop(self):
+        """Stop claiming; jobs still running are released so another worker picks them up"""
+        self._stopping = True
+        self.wake()
+        # Let the loop finish first, so no job starts after the running ones are cancelled
+        if self._task is not None and not self._task.done() and self._task.get_loop() is asyncio.get_running_loop():
+            await self._task
+        for task in list(self.running.values()):
+            task.cancel()
+        await asyncio.gather(*self.running.values(), return_exceptions=True)
+
+    def _start_job(self, job: ClaimedJob):
+        job_id = job[0]
+        task = asyncio.create_task(self._run_job(*job))
+        self.running[job_id] = task
+
+        def finished(_):
+            self.running.pop(job_id, None)
+            self.wake()
+
+        task.add_done_callback(finished)
+
+    async def _run_job(self, job_id: int, document_id: int, user_id: Optional[int], attempt: int):
+        from app.services.background_tasks import background_task_manager
+
+        logger.info(f"Worker {self.worker_id} running job {job_id} (document {document_id}, attempt {attempt})")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await background_task_manager.process_document_async(document_id, user_id)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self._call, job_queue.release, job_id, self.worker_id)
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            await asyncio.to_thread(self._call, job_queue.fail, job_id, self.worker_id, str(e) or type(e).__name__)
+        else:
+            self.stats["completed"] += 1
+            await asyncio.to_thread(self._call, job_queue.complete, job_id, self.worker_id)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: int):
+        """Renew the lease well before it expires"""
+        while True:
+            await asyncio.sleep(max(settings.PROCESSING_LEASE_SECONDS / 3, 1))
+            try:
+                if not await asyncio.to_thread(self._call, job_queue.renew, job_id, self.worker_id):
+                    # Another worker may have claimed it; stop rather than process the document twice
+                    logger.warning(f"Worker {self.worker_id} lost the lease of job {job_id}, stopping it")
+                    self.running[job_id].cancel()
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of job {job_id}: {e}")
+
+    @staticmethod
+    def _call(method, *args):
+        """Run a job_queue method in its own session (called from a worker thread)"""
+        db = SessionLocal()
+        try:
+            return method(db, *args)
+        finally:
+            db.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "running": len(self.running)}
+
+# In-process worker used when PROCESSING_MODE is "inline"
+processing_worker = ProcessingWorker()
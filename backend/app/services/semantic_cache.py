@@ -0,0 +1,136 @@
+"""
+Semantic answer cache
+Keeps the embeddings of past queries per document in a small in-memory
+matrix, for at most max_documents documents (least recently used evicted);
+a new query whose embedding is close enough to a cached one
+(cosine >= SEMANTIC_CACHE_THRESHOLD) gets the earlier answer, so
+paraphrased questions skip retrieval and generation.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.utils.ann_index import normalize_rows
+from app.utils.storage import GrowableArray
+
+logger = logging.getLogger(__name__)
+
+# Log the hit ratio every this many lookups
+STATS_LOG_INTERVAL = 100
+
+
+class _DocumentEntries:
+    """Cached query embeddings and answers of one document version"""
+
+    def __init__(self, version: Tuple, embedding_dim: int):
+        self.version = version
+        self.embeddings = GrowableArray(np.empty((0, embedding_dim), dtype=np.float32))
+        self.answers: List[Dict[str, Any]] = []
+        self.stored_at: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.answers)
+
+    def drop_oldest(self, count: int):
+        view = self.embeddings.view
+        self.embeddings = GrowableArray(np.ascontiguousarray(view[count:]))
+        del self.answers[:count]
+        del self.stored_at[:count]
+
+
+class SemanticCache:
+    """Per-document nearest-neighbour lookup over past query embeddings"""
+
+    def __init__(self, threshold: float, max_per_document: int, ttl_seconds: float, max_documents: int):
+        self.threshold = threshold
+        self.max_per_document = max_per_document
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self._documents: "OrderedDict[int, _DocumentEntries]" = OrderedDict()  # LRU first
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _version(document_version: str) -> Tuple:
+        from app.services.embedding_provider import get_embedding_provider
+        from app.services.gemini_service import GeminiChat
+        return (document_version, GeminiChat.MODEL_NAME, GeminiChat.PROMPT_VERSION, get_embedding_provider().name)
+
+    def lookup(self, document_id: int, document_version: str,
+               query_embedding: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Closest cached answer above the threshold, with its similarity"""
+        query = normalize_rows(np.asarray(query_embedding).reshape(-1))
+        version = self._version(document_version)
+
+        with self._lock:
+            entries = self._documents.get(document_id)
+            match = None
+            if entries is not None and entries.version == version and len(entries):
+                self._documents.move_to_end(document_id)
+                similarities = entries.embeddings.view @ query
+                # Expired entries can't match
+                expired = time.monotonic() - np.asarray(entries.stored_at) > self.ttl_seconds
+                similarities[expired] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    match = (entries.answers[best], float(similarities[best]))
+
+            self.stats["hits" if match else "misses"] += 1
+            lookups = self.stats["hits"] + self.stats["misses"]
+
+        if lookups % STATS_LOG_INTERVAL == 0:
+            logger.info(f"Semantic cache: {self.stats['hits']}/{lookups} hits ({self.stats['hits'] / lookups:.1%})")
+        return match
+
+    def put(self, document_id: int, document_version: str, query_embedding: np.ndarray,
+            response: str, metadata: Dict[str, Any]):
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))
+        version = self._version(document_version)
+
+        with self._lock:
+            entries = self._documents.get(document_id)
+            if entries is None or entries.version != version or entries.embeddings.view.shape[1] != query.shape[1]:
+                entries = self._documents[document_id] = _DocumentEntries(version, query.shape[1])
+            self._documents.move_to_end(document_id)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+                self.stats["evictions"] += 1
+
+            if len(entries) >= self.max_per_document:
+                entries.drop_oldest(len(entries) - self.max_per_document + 1)
+
+            entries.embeddings.append(query)
+            entries.answers.append({"response": response, "metadata": dict(metadata)})
+            entries.stored_at.append(time.monotonic())
+
+    def invalidate_document(self, document_id: int):
+        with self._lock:
+            self._documents.pop(document_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": self.stats["hits"] / lookups if lookups else 0.0,
+                "documents": len(self._documents),
+                "max_documents": self.max_documents,
+                "entries": sum(len(entries) for entries in self._documents.values()),
+                "threshold": self.threshold,
+            }
+
+
+# Global cache instance (None when disabled)
+semantic_cache = (
+    SemanticCache(settings.SEMANTIC_CACHE_THRESHOLD, settings.SEMANTIC_CACHE_MAX_PER_DOCUMENT,
+                  settings.ANSWER_CACHE_TTL_SECONDS, settings.SEMANTIC_CACHE_MAX_DOCUMENTS)
+    if settings.SEMANTIC_CACHE_ENABLED else None
+)
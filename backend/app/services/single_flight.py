@@ -0,0 +1,100 @@
+"""
+Single-flight coalescing of identical in-flight chat requests
+The first request for a key starts the work in a background task; requests
+for the same key that arrive while it is running subscribe to it instead of
+starting their own. Every subscriber gets the shared metadata and replays
+the token stream from the first token, then follows it live.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# start() returns (metadata, token stream)
+FlightResult = Tuple[Dict[str, Any], AsyncGenerator[str, None]]
+
+
+class _Flight:
+    """One running request: its metadata and the tokens produced so far"""
+
+    def __init__(self):
+        self.metadata: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+
+    async def notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.tokens) or self.done)
+            while position < len(self.tokens):
+                yield self.tokens[position]
+                position += 1
+            if self.done and position == len(self.tokens):
+                break
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """Share one execution among concurrent callers with the same key"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        # Strong references so running flights aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"flights": 0, "coalesced": 0}
+
+    async def join(self, key: Hashable,
+                   start: Callable[[], Awaitable[FlightResult]]) -> Tuple[Dict[str, Any], AsyncGenerator[str, None], bool]:
+        """(metadata, token stream, shared) for key; shared is True if another request started the work"""
+        # Flights (futures, conditions) belong to the loop that started them
+        key = (asyncio.get_running_loop(), key)
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            task = asyncio.create_task(self._run(key, flight, start))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            self.stats["flights"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            logger.info(f"Coalesced request into in-flight key {key[1]!r} ({flight.subscribers + 1} subscribers)")
+        flight.subscribers += 1
+
+        # A subscriber timing out must not cancel the flight for the others
+        metadata = await asyncio.shield(flight.metadata)
+        return metadata, flight.subscribe(), shared
+
+    async def _run(self, key: Hashable, flight: _Flight, start: Callable[[], Awaitable[FlightResult]]):
+        """Runs to completion even if every subscriber disconnects, so caches still get the answer"""
+        try:
+            metadata, tokens = await start()
+            flight.metadata.set_result(metadata)
+            async for token in tokens:
+                flight.tokens.append(token)
+                await flight.notify()
+        except Exception as e:
+            logger.error(f"In-flight request {key[1]!r} failed: {e}")
+            flight.error = e
+            if not flight.metadata.done():
+                flight.metadata.set_exception(e)
+        finally:
+            # Later requests start a fresh flight (and usually hit the answer cache)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.done = True
+            await flight.notify()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._flights)}
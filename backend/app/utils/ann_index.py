@@ -0,0 +1,186 @@
+"""
+Approximate nearest neighbour indexes for VectorStore
+Pure NumPy - no faiss/hnswlib dependency
+"""
+
+import logging
+import numpy as np
+from typing import Dict, Any, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows, leaving all-zero rows untouched"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class ANNIndex:
+    """Base class for candidate-generating indexes.
+
+    An index only narrows the search down to candidate row ids; the vector
+    store still scores those candidates exactly.
+    """
+
+    index_type = "flat"
+
+    def build(self, embeddings: np.ndarray):
+        raise NotImplementedError
+
+    def search(self, query_embedding: np.ndarray, k: int) -> np.ndarray:
+        """Return candidate row ids for a query"""
+        raise NotImplementedError
+
+    def get_params(self) -> Dict[str, Any]:
+        return {}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        raise NotImplementedError
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], **params) -> "ANNIndex":
+        raise NotImplementedError
+
+    def save(self, f):
+        """Persist the index as an .npz archive to an open binary file"""
+        np.savez(f, index_type=np.array(self.index_type), **self.to_arrays())
+
+    @property
+    def size(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(array.nbytes for array in self.to_arrays().values()))
+
+
+class IVFFlatIndex(ANNIndex):
+    """Inverted file index with flat (exact) scoring inside each list.
+
+    Vectors are clustered with spherical k-means; a query only visits the
+    `nprobe` lists whose centroids are closest to it.
+    """
+
+    index_type = "ivf_flat"
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, n_iter: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+        """Assign each vector to its nearest centroid (in batches to bound memory)"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size]
+            assignments[start:start + batch_size] = np.argmax(batch @ centroids.T, axis=1)
+        return assignments
+
+    def build(self, embeddings: np.ndarray):
+        """Train centroids and build the inverted lists"""
+        vectors = normalize_rows(embeddings)
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+
+        # Train on a sample - k-means quality saturates well before using every row
+        sample_size = min(n, nlist * 64)
+        sample = vectors[rng.choice(n, size=sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+
+            # Re-seed empty lists with random sample rows
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assignments = self._assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=nlist)
+
+        self.nlist = nlist
+        self.centroids = centroids.astype(np.float32)
+        self.list_ids = order.astype(np.int64)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        logger.info(f"Built IVF-flat index: {n} vectors, {nlist} lists")
+        return self
+
+    def search(self, query_embedding: np.ndarray, k: int) -> np.ndarray:
+        """Return the row ids stored in the `nprobe` closest lists"""
+        query = normalize_rows(np.asarray(query_embedding).reshape(-1))
+        nprobe = min(self.nprobe, self.nlist)
+
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.nlist)
+
+        return np.concatenate([
+            self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probe
+        ])
+
+    def get_params(self) -> Dict[str, Any]:
+        return {"nlist": self.nlist, "nprobe": self.nprobe}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "list_ids": self.list_ids,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], nprobe: int = 8, **params) -> "IVFFlatIndex":
+        params.pop("nlist", None)  # fixed by the persisted centroids
+        index = cls(nlist=len(arrays["centroids"]), nprobe=nprobe, **params)
+        index.centroids = arrays["centroids"]
+        index.list_offsets = arrays["list_offsets"]
+        index.list_ids = arrays["list_ids"]
+        return index
+
+    @property
+    def size(self) -> int:
+        return len(self.list_ids)
+
+
+# Registry of available index types (keyed by ANN_INDEX_TYPE setting)
+INDEX_TYPES: Dict[str, Type[ANNIndex]] = {
+    IVFFlatIndex.index_type: IVFFlatIndex,
+}
+
+
+def create_index(index_type: str, **params) -> ANNIndex:
+    """Create an empty index of the given type"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown ANN index type: {index_type}")
+    return INDEX_TYPES[index_type](**params)
+
+
+def load_index(path: str, **params) -> Optional[ANNIndex]:
+    """Load a persisted index, dispatching on its stored type.
+
+    `params` are search-time settings (e.g. nprobe) that are not persisted.
+    """
+    with np.load(path) as data:
+        arrays = {key: data[key] for key in data.files}
+    index_type = str(arrays.pop("index_type"))
+    if index_type not in INDEX_TYPES:
+        logger.warning(f"Ignoring ANN index with unknown type '{index_type}': {path}")
+        return None
+    return INDEX_TYPES[index_type].from_arrays(arrays, **params)
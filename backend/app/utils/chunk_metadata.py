@@ -0,0 +1,150 @@
+"""
+Columnar chunk metadata for VectorStore
+Fixed-width fields live in a NumPy structured array, chunk text in an
+offsets + blob pair; all three files can be memory-mapped and text is
+only decoded for the rows a search actually returns.
+"""
+
+import logging
+import os
+import numpy as np
+from typing import List, Dict, Any, Optional, Iterator
+from app.utils.storage import atomic_write, GrowableArray
+
+logger = logging.getLogger(__name__)
+
+COLUMNS_DTYPE = np.dtype([
+    ("chunk_id", np.int64),
+    ("chunk_index", np.int64),
+    ("page_number", np.int32),
+    ("token_count", np.int32),
+])
+
+# Stored in place of None for optional integer fields
+MISSING = -1
+
+
+class ChunkMetadata:
+    """Per-chunk metadata, one row per stored embedding"""
+
+    def __init__(self, document_id: int):
+        self.document_id = document_id
+        self._columns = GrowableArray(np.empty(0, dtype=COLUMNS_DTYPE))
+        self._text_offsets = GrowableArray(np.zeros(1, dtype=np.int64))
+        self.text_blob = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    @property
+    def columns(self) -> np.ndarray:
+        return self._columns.view
+
+    @property
+    def text_offsets(self) -> np.ndarray:
+        return self._text_offsets.view
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        """Materialize one row as a dict (the shape callers used to get from the pickle)"""
+        record = self.columns[row]
+        return {
+            "chunk_id": self._optional(record["chunk_id"]),
+            "document_id": self.document_id,
+            "chunk_index": int(record["chunk_index"]),
+            "page_number": self._optional(record["page_number"]),
+            "token_count": self._optional(record["token_count"]),
+            "content": self.text(row),
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self[row]
+
+    @staticmethod
+    def _optional(value) -> Optional[int]:
+        value = int(value)
+        return None if value == MISSING else value
+
+    def text(self, row: int) -> str:
+        """Decode the text of a single chunk"""
+        start, end = int(self.text_offsets[row]), int(self.text_offsets[row + 1])
+        return bytes(self.text_blob[start:end]).decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._columns.nbytes + self._text_offsets.nbytes + len(self.text_blob))
+
+    def chunk_indexes(self) -> np.ndarray:
+        return np.asarray(self.columns["chunk_index"])
+
+    def extend(self, metadata_list: List[Dict[str, Any]], texts: Optional[List[str]] = None):
+        """Append rows; text comes from `texts` or each entry's "content" key"""
+        new_columns = np.empty(len(metadata_list), dtype=COLUMNS_DTYPE)
+        for name in COLUMNS_DTYPE.names:
+            new_columns[name] = [
+                MISSING if m.get(name) is None else m[name]
+                for m in metadata_list
+            ]
+
+        if texts is None:
+            texts = [m.get("content", "") for m in metadata_list]
+        encoded = [text.encode("utf-8") for text in texts]
+
+        lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+        self._append(new_columns, lengths, b"".join(encoded))
+
+    def _append(self, columns: np.ndarray, text_lengths: np.ndarray, text: bytes):
+        # A memory-mapped blob is read-only; copy it once before appending
+        if not isinstance(self.text_blob, bytearray):
+            self.text_blob = bytearray(self.text_blob)
+        self.text_blob.extend(text)
+
+        self._text_offsets.append(self.text_offsets[-1] + np.cumsum(text_lengths))
+        self._columns.append(columns)
+
+    def segment_arrays(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        """Rows [start, end) as plain arrays, for an append-only segment file"""
+        offsets = self.text_offsets[start:end + 1]
+        text = bytes(self.text_blob[int(offsets[0]):int(offsets[-1])])
+        return {
+            "columns": np.asarray(self.columns[start:end]),
+            "text_lengths": np.diff(offsets),
+            "text": np.frombuffer(text, dtype=np.uint8),
+        }
+
+    def append_segment(self, arrays: Dict[str, np.ndarray]):
+        """Append rows previously produced by segment_arrays()"""
+        self._append(arrays["columns"], arrays["text_lengths"], arrays["text"].tobytes())
+
+    def save(self, columns_path: str, offsets_path: str, blob_path: str):
+        # Columns last: load() treats them as the marker of a complete write
+        atomic_write(blob_path, lambda f: f.write(self.text_blob))
+        atomic_write(offsets_path, lambda f: np.save(f, np.asarray(self.text_offsets)))
+        atomic_write(columns_path, lambda f: np.save(f, np.asarray(self.columns)))
+
+    @classmethod
+    def load(cls, document_id: int, columns_path: str, offsets_path: str, blob_path: str,
+             mmap: bool = True) -> "ChunkMetadata":
+        mmap_mode = "r" if mmap else None
+        metadata = cls(document_id)
+        metadata._columns = GrowableArray(np.load(columns_path, mmap_mode=mmap_mode))
+        metadata._text_offsets = GrowableArray(np.load(offsets_path, mmap_mode=mmap_mode))
+
+        # np.memmap cannot map an empty file
+        if mmap and os.path.getsize(blob_path) > 0:
+            metadata.text_blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            with open(blob_path, "rb") as f:
+                metadata.text_blob = bytearray(f.read())
+
+        if len(metadata.text_offsets) != len(metadata.columns) + 1:
+            raise ValueError(f"Chunk metadata files for document {document_id} are inconsistent")
+        return metadata
+
+    @classmethod
+    def from_records(cls, document_id: int, metadata_list: List[Dict[str, Any]]) -> "ChunkMetadata":
+        """Build from the legacy list-of-dicts format"""
+        metadata = cls(document_id)
+        if metadata_list:
+            metadata.extend(metadata_list)
+        return metadata
@@ -0,0 +1,205 @@
+"""
+Cross-document vector index
+Sharded by document id so updating one document only rewrites one shard
+"""
+
+import logging
+import os
+import threading
+import numpy as np
+from typing import List, Optional, Tuple, Iterable
+from app.utils.ann_index import normalize_rows
+from app.utils.storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# (document_id, chunk_index) for every row in a shard
+ROW_DTYPE = np.dtype([("document_id", np.int64), ("chunk_index", np.int64)])
+
+
+class GlobalIndexShard:
+    """One shard: normalized float32 embeddings plus a (document_id, chunk_index) row table"""
+
+    def __init__(self, store_dir: str, shard_id: int):
+        self.shard_id = shard_id
+        self.embeddings_path = os.path.join(store_dir, f"global_shard_{shard_id}_embeddings.npy")
+        self.rows_path = os.path.join(store_dir, f"global_shard_{shard_id}_rows.npy")
+        self.lock = threading.RLock()
+        # (embeddings, rows, rows file mtime), replaced as a whole so readers never mix versions
+        self._view: Optional[Tuple[Optional[np.ndarray], np.ndarray, Optional[int]]] = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.rows_path)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.rows_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """(embeddings, rows) of the shard, reloaded if it was rewritten since we last read it.
+
+        Reloads happen under the lock, so they never read this process's files
+        between the two writes of an update.
+        """
+        view = self._view
+        if view is not None and view[2] == self._mtime():
+            return view[0], view[1]
+
+        with self.lock:
+            view = self._view
+            mtime = self._mtime()
+            if view is not None and view[2] == mtime:
+                return view[0], view[1]
+            if mtime is None:
+                view = (None, np.empty(0, dtype=ROW_DTYPE), None)
+            else:
+                embeddings = np.load(self.embeddings_path, mmap_mode="r")
+                rows = np.load(self.rows_path, mmap_mode="r")
+                if len(embeddings) != len(rows):
+                    # Another process caught mid-rewrite; keep the previous view and retry next time
+                    logger.warning(f"Global index shard {self.shard_id} is being rewritten, using previous view")
+                    if view is None:
+                        return None, np.empty(0, dtype=ROW_DTYPE)
+                    return view[0], view[1]
+                view = (embeddings, rows, mtime)
+            self._view = view
+            return view[0], view[1]
+
+    def _write(self, embeddings: np.ndarray, rows: np.ndarray):
+        # Rows are written last: readers use them as the "shard is complete" marker
+        atomic_write(self.embeddings_path, lambda f: np.save(f, embeddings))
+        atomic_write(self.rows_path, lambda f: np.save(f, rows))
+        self._view = (
+            np.load(self.embeddings_path, mmap_mode="r"),
+            np.load(self.rows_path, mmap_mode="r"),
+            self._mtime()
+        )
+
+    def upsert_document(self, document_id: int, embeddings: np.ndarray, chunk_indexes: Iterable[int]):
+        """Replace all rows of a document with new embeddings"""
+        with self.lock:
+            current_embeddings, current_rows = self.load()
+            keep = current_rows["document_id"] != document_id
+
+            new_rows = np.empty(len(embeddings), dtype=ROW_DTYPE)
+            new_rows["document_id"] = document_id
+            new_rows["chunk_index"] = np.fromiter(chunk_indexes, dtype=np.int64, count=len(embeddings))
+            new_embeddings = normalize_rows(embeddings)
+
+            if current_embeddings is not None and current_embeddings.shape[1] != new_embeddings.shape[1]:
+                # Embedding provider changed: rows of other documents are in a different space
+                logger.warning(f"Global index shard {self.shard_id} dimension changed, dropping stale rows")
+                keep[:] = False
+
+            if current_embeddings is not None and keep.any():
+                new_embeddings = np.vstack([current_embeddings[keep], new_embeddings])
+                new_rows = np.concatenate([current_rows[keep], new_rows])
+
+            self._write(new_embeddings, new_rows)
+
+    def remove_document(self, document_id: int):
+        """Drop all rows of a document"""
+        with self.lock:
+            embeddings, rows = self.load()
+            keep = rows["document_id"] != document_id
+            if keep.all():
+                return
+            dim = embeddings.shape[1]
+            embeddings = embeddings[keep] if keep.any() else np.empty((0, dim), dtype=np.float32)
+            self._write(np.ascontiguousarray(embeddings), np.ascontiguousarray(rows[keep]))
+
+    def search(self, query: np.ndarray, k: int, document_ids: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, rows) within this shard, optionally limited to some documents"""
+        embeddings, rows = self.load()
+        if embeddings is None or len(rows) == 0 or embeddings.shape[1] != len(query):
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=ROW_DTYPE)
+
+        if document_ids is not None:
+            mask = np.isin(rows["document_id"], document_ids)
+            if not mask.any():
+                return np.empty(0, dtype=np.float32), np.empty(0, dtype=ROW_DTYPE)
+            row_ids = np.flatnonzero(mask)
+            scores = embeddings[row_ids] @ query
+        else:
+            row_ids = np.arange(len(rows))
+            scores = embeddings @ query
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            scores, row_ids = scores[top], row_ids[top]
+        return scores, np.asarray(rows[row_ids])
+
+
+class GlobalVectorIndex:
+    """Sharded index over the embeddings of every document"""
+
+    def __init__(self, store_dir: str, num_shards: int):
+        self.store_dir = store_dir
+        self.num_shards = num_shards
+        self.shards = [GlobalIndexShard(store_dir, i) for i in range(num_shards)]
+
+    def shard_for(self, document_id: int) -> GlobalIndexShard:
+        return self.shards[document_id % self.num_shards]
+
+    def exists(self) -> bool:
+        return any(shard.exists() for shard in self.shards)
+
+    def upsert_document(self, document_id: int, embeddings: np.ndarray, chunk_indexes: Iterable[int]):
+        if len(embeddings) == 0:
+            self.remove_document(document_id)
+            return
+        self.shard_for(document_id).upsert_document(document_id, embeddings, chunk_indexes)
+
+    def remove_document(self, document_id: int):
+        self.shard_for(document_id).remove_document(document_id)
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = 5,
+        document_ids: Optional[List[int]] = None,
+        threshold: float = 0.0
+    ) -> List[Tuple[int, int, float]]:
+        """One top-k query across all (or the given) documents.
+
+        Returns (document_id, chunk_index, similarity) tuples, best first.
+        """
+        query = normalize_rows(np.asarray(query_embedding).reshape(-1))
+
+        allowed = None
+        shards = self.shards
+        if document_ids is not None:
+            if not document_ids:
+                return []
+            allowed = np.asarray(document_ids, dtype=np.int64)
+            shard_ids = set(int(doc_id) % self.num_shards for doc_id in document_ids)
+            shards = [self.shards[i] for i in sorted(shard_ids)]
+
+        # Per-shard top-k, then merge
+        all_scores, all_rows = [], []
+        for shard in shards:
+            scores, rows = shard.search(query, k, allowed)
+            all_scores.append(scores)
+            all_rows.append(rows)
+
+        if not all_scores:
+            return []
+        scores = np.concatenate(all_scores)
+        rows = np.concatenate(all_rows)
+
+        order = np.argsort(-scores)[:k]
+        return [
+            (int(rows[i]["document_id"]), int(rows[i]["chunk_index"]), float(scores[i]))
+            for i in order
+            if scores[i] >= threshold
+        ]
+
+    def get_stats(self):
+        counts = [len(shard.load()[1]) for shard in self.shards]
+        return {
+            "num_shards": self.num_shards,
+            "vector_count": int(sum(counts)),
+            "shard_sizes": counts
+        }
@@ -0,0 +1,24 @@
+"""
+Page-range PDF text extraction
+Kept free of app imports beyond PyMuPDF: this is the function extraction
+worker processes run, and spawned workers import its module from scratch.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+import fitz  # PyMuPDF
+
+
+def iter_page_range(file_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[str, int]]:
+    """Yield (text, page_num) of the non-empty pages in [start, end), 0-based; opens the file itself"""
+    with fitz.open(file_path) as doc:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        for page_index in range(start, end):
+            # Use faster text extraction without OCR
+            text = doc[page_index].get_text("text", sort=False).strip()
+            if text:
+                yield text, page_index + 1
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[str, int]]:
+    """(text, page_num) of the non-empty pages in [start, end), 0-based"""
+    return list(iter_page_range(file_path, start, end))
@@ -0,0 +1,64 @@
+"""
+Quantized embedding storage for VectorStore
+Symmetric int8 with a per-vector scale: 1 byte/dim, 4x smaller than float32.
+Scoring runs BLAS over small blocks of rows converted to float32, which reads a
+quarter of the memory of a float32 scan and is faster than it (numpy's integer
+matmul has no SIMD kernel and is slower than either). float16 is not offered:
+numpy scores it several times slower than float32.
+"""
+
+import numpy as np
+from typing import Optional, Tuple
+from app.utils.ann_index import normalize_rows
+
+# Storage formats VectorStore understands
+FULL_PRECISION = "float32"
+QUANTIZED_DTYPES = ("int8",)
+SUPPORTED_DTYPES = (FULL_PRECISION,) + QUANTIZED_DTYPES
+
+# Rows converted to float32 per block while scoring; small enough for the block to
+# stay in cache between conversion and dot product (larger blocks are slower than
+# a float32 scan)
+SCORE_BLOCK_SIZE = 256
+
+
+def is_quantized(dtype: str) -> bool:
+    return dtype in QUANTIZED_DTYPES
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Quantize vectors (L2-normalized first) to the given storage dtype.
+
+    Returns (codes, scales), where value ~= code * scale.
+    """
+    vectors = normalize_rows(vectors)
+
+    if dtype == "int8":
+        max_abs = np.abs(vectors).max(axis=1)
+        scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+
+    raise ValueError(f"Unsupported quantized dtype: {dtype}")
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+    """Convert quantized rows back to float32"""
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales)[:, None]
+    return vectors
+
+
+def dot_scores(codes: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+    """Dot products between a float32 query and quantized rows, block by block"""
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    scores = np.empty(len(codes), dtype=np.float32)
+
+    for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+        block = np.asarray(codes[start:start + SCORE_BLOCK_SIZE], dtype=np.float32)
+        scores[start:start + SCORE_BLOCK_SIZE] = block @ query
+
+    if scales is not None:
+        scores *= scales
+    return scores
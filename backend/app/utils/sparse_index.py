@@ -0,0 +1,129 @@
+"""
+BM25 keyword index for VectorStore
+Term weights are precomputed at build time into a term-major CSR matrix
+(one row of postings per term), so scoring a query is a sparse row sum
+over the query's terms: no embedding call, no per-chunk Python loop.
+"""
+
+import json
+import logging
+import re
+import numpy as np
+import scipy.sparse as sp
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from app.utils.storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and identifiers such as "AB-1234", "v2.1" or "part_no"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+SPLIT_PATTERN = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens without stop words; compound identifiers are also indexed by their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in ENGLISH_STOP_WORDS:
+            continue
+        tokens.append(token)
+        parts = SPLIT_PATTERN.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over the chunks of one document"""
+
+    def __init__(self, weights: sp.csr_matrix, vocabulary: Dict[str, int], k1: float, b: float):
+        # weights[term, chunk] = idf(term) * saturated tf(term, chunk)
+        self.weights = weights
+        self.vocabulary = vocabulary
+        self.k1 = k1
+        self.b = b
+
+    @property
+    def size(self) -> int:
+        """Number of indexed chunks"""
+        return self.weights.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.weights.data.nbytes + self.weights.indices.nbytes + self.weights.indptr.nbytes)
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        rows, cols, counts = [], [], []
+        lengths = []
+
+        for chunk, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                rows.append(vocabulary.setdefault(term, len(vocabulary)))
+                cols.append(chunk)
+                counts.append(count)
+
+        n_chunks = len(lengths)
+        tf = sp.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=(len(vocabulary), n_chunks)
+        )
+        if tf.nnz == 0:
+            return cls(tf, vocabulary, k1, b)
+
+        lengths = np.asarray(lengths, dtype=np.float32)
+        avg_length = lengths.mean() if lengths.mean() > 0 else 1.0
+        doc_freq = np.diff(tf.indptr).astype(np.float32)
+        idf = np.log1p((n_chunks - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        # Saturate term frequencies in place, one nonzero at a time (vectorized over all of them)
+        term_of_entry = np.repeat(np.arange(tf.shape[0]), np.diff(tf.indptr))
+        norm = k1 * (1 - b + b * lengths[tf.indices] / avg_length)
+        tf.data = (idf[term_of_entry] * tf.data * (k1 + 1) / (tf.data + norm)).astype(np.float32)
+        return cls(tf, vocabulary, k1, b)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for the query"""
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        if not term_ids:
+            return np.zeros(self.size, dtype=np.float32)
+        return np.asarray(self.weights[term_ids].sum(axis=0)).ravel()
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (rows, scores), best first; chunks without any query term are left out"""
+        scores = self.scores(query)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = np.argsort(-scores[candidates], kind="stable")
+        rows = candidates[order]
+        return rows, scores[rows]
+
+    def save(self, matrix_path: str, vocabulary_path: str):
+        # Matrix last: load() treats it as the marker of a complete write
+        atomic_write(vocabulary_path, lambda f: f.write(json.dumps(self.vocabulary).encode("utf-8")))
+        atomic_write(matrix_path, lambda f: np.savez(
+            f,
+            data=self.weights.data,
+            indices=self.weights.indices,
+            indptr=self.weights.indptr,
+            shape=np.asarray(self.weights.shape),
+            params=np.asarray([self.k1, self.b])
+        ))
+
+    @classmethod
+    def load(cls, matrix_path: str, vocabulary_path: str) -> "BM25Index":
+        with np.load(matrix_path) as arrays:
+            weights = sp.csr_matrix(
+                (arrays["data"], arrays["indices"], arrays["indptr"]),
+                shape=tuple(arrays["shape"])
+            )
+            k1, b = (float(value) for value in arrays["params"])
+        with open(vocabulary_path, "r", encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        return cls(weights, vocabulary, k1, b)
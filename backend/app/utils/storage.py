@@ -0,0 +1,86 @@
+"""
+Storage helpers shared by the vector store and its indexes
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+# Process umask (it can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(path: str, writer):
+    """Write a file via a temp file + rename.
+    
+    Readers that memory-mapped the previous version keep a valid mapping,
+    since the old inode stays alive until they drop it. The temp file has a
+    unique name, so concurrent writers (threads or processes) never share one.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory or ".")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # mkstemp creates the file 0600; give it the permissions open() would
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            writer(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def link_or_copy(source: str, destination: str):
+    """Share a file's data under a second name (hardlink, or a copy where links aren't supported).
+    
+    Safe because store files are never modified in place: atomic_write()
+    replaces the name with a new inode, so a rewrite of either name leaves
+    the other untouched (copy-on-write at file granularity).
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class GrowableArray:
+    """Array with amortized O(1) appends along the first axis.
+    
+    Capacity doubles when full, so appending N rows in batches costs O(N)
+    instead of the O(N^2) of repeated np.vstack. A read-only (memory-mapped)
+    array is copied into a writable buffer on the first append.
+    """
+    
+    def __init__(self, initial: np.ndarray):
+        self._data = initial
+        self._size = len(initial)
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    @property
+    def view(self) -> np.ndarray:
+        """The filled part of the buffer"""
+        return self._data[:self._size]
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes held, including spare capacity"""
+        return int(self._data.nbytes)
+    
+    def append(self, rows: np.ndarray):
+        rows = np.asarray(rows, dtype=self._data.dtype)
+        needed = self._size + len(rows)
+        
+        if needed > len(self._data) or not self._data.flags.writeable:
+            capacity = max(needed, 2 * len(self._data), 16)
+            grown = np.empty((capacity,) + self._data.shape[1:], dtype=self._data.dtype)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+        
+        self._data[self._size:needed] = rows
+        self._size = needed
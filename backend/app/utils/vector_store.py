@@ -1,11 +1,20 @@
 import numpy as np
 import pickle
 import os
+import re
 import logging
+import threading
+from collections import OrderedDict
 from typing import List, Tuple, Optional, Dict, Any
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
 from app.config import settings
+from app.services.embedding_provider import get_embedding_provider
+from app.utils.chunk_metadata import ChunkMetadata
+from app.utils.ann_index import ANNIndex, create_index, load_index, normalize_rows
+from app.utils.global_index import GlobalVectorIndex
+from app.utils.sparse_index import BM25Index
+from app.utils.quantization import is_quantized, quantize, dequantize, dot_scores, SUPPORTED_DTYPES
+from app.utils.storage import atomic_write, link_or_copy, GrowableArray
 
 logger = logging.getLogger(__name__)
 
@@ -16,26 +25,93 @@ class VectorStore:
         self.document_id = document_id
         self.store_dir = settings.VECTOR_STORE_DIR
         self.embeddings_path = os.path.join(self.store_dir, f"doc_{document_id}_embeddings.npy")
-        self.metadata_path = os.path.join(self.store_dir, f"doc_{document_id}_metadata.pkl")
+        # Columnar chunk metadata (the pickle is only read to migrate old stores)
+        self.columns_path = os.path.join(self.store_dir, f"doc_{document_id}_chunks.npy")
+        self.text_offsets_path = os.path.join(self.store_dir, f"doc_{document_id}_text_offsets.npy")
+        self.text_path = os.path.join(self.store_dir, f"doc_{document_id}_text.bin")
+        self.legacy_metadata_path = os.path.join(self.store_dir, f"doc_{document_id}_metadata.pkl")
+        self.index_path = os.path.join(self.store_dir, f"doc_{document_id}_ann.npz")
+        # Quantized stores: per-vector int8 scales and optional full-precision copy for re-ranking
+        self.scales_path = os.path.join(self.store_dir, f"doc_{document_id}_scales.npy")
+        self.full_embeddings_path = os.path.join(self.store_dir, f"doc_{document_id}_embeddings_full.npy")
+        # BM25 keyword index: term-major CSR weights + vocabulary
+        self.bm25_path = os.path.join(self.store_dir, f"doc_{document_id}_bm25.npz")
+        self.bm25_vocab_path = os.path.join(self.store_dir, f"doc_{document_id}_bm25_vocab.json")
+        # Rewritten after every flush/save, so other processes can tell their copy is stale
+        self.version_path = os.path.join(self.store_dir, f"doc_{document_id}_version")
         
         os.makedirs(self.store_dir, exist_ok=True)
         
-        self.embeddings = None
-        self.metadata = []
+        # Growable buffers; the embeddings/scales/full_embeddings properties expose the filled rows
+        self._embeddings: Optional[GrowableArray] = None
+        self._scales: Optional[GrowableArray] = None
+        self._full_embeddings: Optional[GrowableArray] = None
+        self.dtype = settings.VECTOR_STORE_DTYPE
+        self.metadata = ChunkMetadata(document_id)
+        self.ann_index: Optional[ANNIndex] = None
+        self.sparse_index: Optional[BM25Index] = None
+        # Serializes lazy index builds by concurrent searches
+        self._index_lock = threading.Lock()
+        # Rows already on disk (base files + segments); later rows only live in memory
+        self._persisted_count = 0
+        self._loaded_version = None
         self.load()
     
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embeddings.view
+    
+    @property
+    def scales(self) -> Optional[np.ndarray]:
+        return self._scales.view if self._scales is not None else None
+    
+    @property
+    def full_embeddings(self) -> Optional[np.ndarray]:
+        return self._full_embeddings.view if self._full_embeddings is not None else None
+    
+    def __len__(self) -> int:
+        return len(self._embeddings)
+    
     def load(self):
         """Load existing vector store if it exists"""
-        if os.path.exists(self.embeddings_path) and os.path.exists(self.metadata_path):
+        # Read before the files: a write racing with this load makes the store stale
+        self._loaded_version = self._disk_version()
+        has_metadata = os.path.exists(self.columns_path) or os.path.exists(self.legacy_metadata_path)
+        has_base = os.path.exists(self.embeddings_path) and has_metadata
+        segments = self._segment_files()
+        if has_base or segments:
             try:
                 logger.info(f"Loading vector store for document {self.document_id}")
                 
-                # Load embeddings
-                self.embeddings = np.load(self.embeddings_path)
+                if has_base:
+                    self._load_base()
+                else:
+                    # Only flushed segments so far (embedding was interrupted before save())
+                    with np.load(segments[0][1]) as segment:
+                        embedding_dim = segment["embeddings"].shape[1]
+                        dtype = str(segment["embeddings"].dtype)
+                    if dtype == "float16":
+                        # No longer supported: the segments are replayed as float32
+                        dtype = "float32"
+                    self._reset(embedding_dim, dtype)
+                
+                self._load_segments(segments)
+                self._persisted_count = len(self)
+                
+                # Load ANN index if one was built for this store
+                self.ann_index = None
+                if os.path.exists(self.index_path):
+                    self.ann_index = load_index(self.index_path, **self._ann_params())
+                    if self.ann_index is not None and self.ann_index.size != len(self.embeddings):
+                        logger.warning(f"Stale ANN index for document {self.document_id}, ignoring it")
+                        self.ann_index = None
                 
-                # Load metadata
-                with open(self.metadata_path, 'rb') as f:
-                    self.metadata = pickle.load(f)
+                # Load BM25 index (rebuilt lazily by keyword_search() if missing or stale)
+                self.sparse_index = None
+                if os.path.exists(self.bm25_path):
+                    self.sparse_index = BM25Index.load(self.bm25_path, self.bm25_vocab_path)
+                    if self.sparse_index.size != len(self.metadata):
+                        self.sparse_index = None
                 
                 logger.info(f"Loaded vector store with {len(self.metadata)} vectors")
                 
@@ -45,74 +121,299 @@ class VectorStore:
         else:
             self._initialize_new_store()
     
+    def _load_base(self):
+        """Load the compacted files written by save()"""
+        # Load embeddings (memory-mapped: O(1) open, pages shared via the OS page cache)
+        mmap_mode = "r" if settings.VECTOR_STORE_MMAP else None
+        embeddings = np.load(self.embeddings_path, mmap_mode=mmap_mode)
+        
+        # Stores written before embeddings were pre-normalized, or in the float16 format that
+        # is no longer supported (from its exact float32 re-rank copy if it has one): upgrade
+        # once in place
+        if embeddings.dtype in (np.float64, np.float16):
+            legacy_float16 = embeddings.dtype == np.float16
+            if legacy_float16 and os.path.exists(self.full_embeddings_path):
+                normalized = normalize_rows(np.load(self.full_embeddings_path))
+            else:
+                normalized = normalize_rows(embeddings)
+            atomic_write(self.embeddings_path, lambda f: np.save(f, normalized))
+            if legacy_float16 and os.path.exists(self.full_embeddings_path):
+                os.remove(self.full_embeddings_path)
+            embeddings = np.load(self.embeddings_path, mmap_mode=mmap_mode)
+            logger.info(f"Upgraded vector store for document {self.document_id} to normalized float32")
+        
+        # The format on disk wins over the configured one
+        self._embeddings = GrowableArray(embeddings)
+        self.dtype = str(embeddings.dtype)
+        self._scales = None
+        self._full_embeddings = None
+        if os.path.exists(self.scales_path):
+            self._scales = GrowableArray(np.load(self.scales_path, mmap_mode=mmap_mode))
+        if os.path.exists(self.full_embeddings_path):
+            self._full_embeddings = GrowableArray(np.load(self.full_embeddings_path, mmap_mode=mmap_mode))
+        
+        # Load metadata
+        if not os.path.exists(self.columns_path):
+            self._migrate_legacy_metadata()
+        self.metadata = ChunkMetadata.load(
+            self.document_id, self.columns_path, self.text_offsets_path, self.text_path,
+            mmap=settings.VECTOR_STORE_MMAP
+        )
+    
+    def _segment_path(self, start: int) -> str:
+        return os.path.join(self.store_dir, f"doc_{self.document_id}_seg_{start:08d}.npz")
+    
+    def _segment_files(self) -> List[Tuple[int, str]]:
+        """(start row, path) of every flushed segment, in order"""
+        pattern = re.compile(rf"^doc_{self.document_id}_seg_(\d+)\.npz$")
+        segments = [
+            (int(match.group(1)), os.path.join(self.store_dir, match.group(0)))
+            for match in map(pattern.match, os.listdir(self.store_dir))
+            if match
+        ]
+        return sorted(segments)
+    
+    def _load_segments(self, segments: List[Tuple[int, str]]):
+        """Replay append-only segments on top of the base files"""
+        for start, path in segments:
+            with np.load(path) as segment:
+                arrays = {key: segment[key] for key in segment.files}
+            rows = len(arrays["embeddings"])
+            
+            if start + rows <= len(self):
+                # Already compacted into the base files by save()
+                os.remove(path)
+                continue
+            if start != len(self):
+                logger.warning(f"Gap in vector store segments for document {self.document_id} at row {start}, "
+                               f"keeping the first {len(self)} rows")
+                break
+            
+            self._embeddings.append(arrays["embeddings"])
+            if self._scales is not None:
+                self._scales.append(arrays["scales"])
+            if self._full_embeddings is not None:
+                if "full_embeddings" in arrays:
+                    self._full_embeddings.append(arrays["full_embeddings"])
+                else:
+                    self._full_embeddings = None
+            self.metadata.append_segment(arrays)
+    
+    def _migrate_legacy_metadata(self):
+        """Convert a pickled list-of-dicts metadata file to the columnar format"""
+        with open(self.legacy_metadata_path, 'rb') as f:
+            records = pickle.load(f)
+        metadata = ChunkMetadata.from_records(self.document_id, records)
+        metadata.save(self.columns_path, self.text_offsets_path, self.text_path)
+        os.remove(self.legacy_metadata_path)
+        logger.info(f"Migrated metadata for document {self.document_id} to columnar format")
+    
     def _initialize_new_store(self):
         """Initialize a new empty vector store"""
-        # Import here to avoid circular imports
-        from app.services.gemini_service import GeminiEmbeddings
-        
-        # Initialize with correct dimension
-        embedding_dim = GeminiEmbeddings.get_dimension()
-        self.embeddings = np.array([]).reshape(0, embedding_dim)
-        self.metadata = []
+        # Initialize with the configured provider's dimension
+        self._reset(get_embedding_provider().get_dimension())
         
         logger.info(f"Initialized new vector store for document {self.document_id}")
     
-    def add_embeddings(self, embeddings: np.ndarray, metadata_list: List[Dict[str, Any]]):
-        """Add embeddings and their metadata to the vector store"""
+    def _reset(self, embedding_dim: int, dtype: Optional[str] = None):
+        """Reset to an empty store in the given (default: configured) storage format"""
+        dtype = dtype or settings.VECTOR_STORE_DTYPE
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported VECTOR_STORE_DTYPE: {dtype}")
+        
+        self.dtype = dtype
+        self._embeddings = GrowableArray(np.empty((0, embedding_dim), dtype=self.dtype))
+        self._scales = GrowableArray(np.empty(0, dtype=np.float32)) if self.dtype == "int8" else None
+        self._full_embeddings = None
+        if is_quantized(self.dtype) and settings.VECTOR_STORE_RERANK:
+            self._full_embeddings = GrowableArray(np.empty((0, embedding_dim), dtype=np.float32))
+        self.metadata = ChunkMetadata(self.document_id)
+        self.ann_index = None
+        self.sparse_index = None
+        self._persisted_count = 0
+    
+    def add_embeddings(self, embeddings: np.ndarray, metadata_list: List[Dict[str, Any]],
+                       texts: Optional[List[str]] = None):
+        """Add embeddings and their metadata to the vector store.
+        
+        Chunk text comes from `texts`, or from each metadata entry's "content" key.
+        """
         if len(embeddings) != len(metadata_list):
             raise ValueError("Number of embeddings must match number of metadata entries")
         
-        if self.embeddings.size == 0:
-            self.embeddings = embeddings
+        # Rows become visible to searches running concurrently (e.g. while a document
+        # is still being ingested) once the embeddings are appended, so they go last
+        self.metadata.extend(metadata_list, texts)
+        
+        if is_quantized(self.dtype):
+            codes, scales = quantize(embeddings, self.dtype)
+            if scales is not None:
+                self._scales.append(scales)
+            if self._full_embeddings is not None:
+                self._full_embeddings.append(normalize_rows(embeddings))
+            self._embeddings.append(codes)
         else:
-            self.embeddings = np.vstack([self.embeddings, embeddings])
+            # Normalized at write time so search is a plain dot product
+            self._embeddings.append(normalize_rows(embeddings))
         
-        self.metadata.extend(metadata_list)
+        # The ANN index no longer covers every row; it is rebuilt on save(). The BM25
+        # index keeps serving the rows it covers (see keyword_search())
+        self.ann_index = None
         
         logger.info(f"Added {len(embeddings)} vectors to document {self.document_id}")
     
     def add_texts(self, texts: List[str], metadata_list: List[Dict[str, Any]]):
         """Add texts by creating embeddings and storing them"""
-        from app.services.gemini_service import GeminiEmbeddings
-        
-        embeddings = np.array([GeminiEmbeddings.create_embedding(text) for text in texts])
-        self.add_embeddings(embeddings, metadata_list)
+        embeddings = get_embedding_provider().embed_documents(texts)
+        self.add_embeddings(embeddings, metadata_list, texts)
     
     def similarity_search(self, query: str, k: int = 5, threshold: float = 0.5) -> List[Tuple[Dict[str, Any], float]]:
         """Search for similar texts using cosine similarity"""
         if len(self.embeddings) == 0:
             return []
         
-        from app.services.gemini_service import GeminiEmbeddings
-        
         # Create embedding for query
-        query_embedding = GeminiEmbeddings.create_embedding(query)
-        query_embedding = np.array(query_embedding).reshape(1, -1)
+        query_embedding = get_embedding_provider().embed_query(query)
+        results = self.similarity_search_by_vector(query_embedding, k=k, threshold=threshold)
         
-        # Calculate cosine similarity
-        similarities = cosine_similarity(query_embedding, self.embeddings)[0]
+        logger.info(f"Found {len(results)} similar texts for query: '{query[:50]}...'")
+        return results
+    
+    def similarity_search_by_vector(self, query_embedding: np.ndarray, k: int = 5, threshold: float = 0.5) -> List[Tuple[Dict[str, Any], float]]:
+        """Search with a precomputed query embedding"""
+        if len(self.embeddings) == 0:
+            return []
         
-        # Get top k results above threshold
-        top_indices = np.argsort(similarities)[::-1][:k]
+        query = normalize_rows(np.asarray(query_embedding).reshape(-1))
+        if len(query) != self.embeddings.shape[1]:
+            logger.warning(f"Query dimension {len(query)} does not match document {self.document_id} "
+                           f"({self.embeddings.shape[1]}); reprocess it with the current embedding provider")
+            return []
         
-        results = []
-        for idx in top_indices:
-            similarity = float(similarities[idx])
-            if similarity >= threshold:
-                results.append((self.metadata[idx], similarity))
+        # Narrow the search to ANN candidates for large stores
+        rows = None
+        if self.ann_index is not None:
+            rows = self.ann_index.search(query, k)
+            rows = np.sort(rows) if len(rows) >= k else None
         
-        logger.info(f"Found {len(results)} similar texts for query: '{query[:50]}...'")
-        return results
+        # Stored rows are unit length, so the dot product is the cosine similarity
+        if is_quantized(self.dtype):
+            similarities = self._quantized_similarities(query, rows, k)
+        elif rows is not None:
+            similarities = self.embeddings[rows] @ query
+        else:
+            similarities = self.embeddings @ query
+        
+        top = self._top_k(similarities, k, threshold)
+        if rows is not None:
+            top_rows = rows[top]
+        else:
+            top_rows = top
+        
+        return [
+            (self.metadata[row], float(similarities[i]))
+            for i, row in zip(top, top_rows)
+        ]
+    
+    @staticmethod
+    def _top_k(similarities: np.ndarray, k: int, threshold: float) -> np.ndarray:
+        """Positions of the k best scores above threshold, best first (no full sort)"""
+        candidates = np.flatnonzero(similarities >= threshold)
+        if len(candidates) > k:
+            part = np.argpartition(-similarities[candidates], k - 1)[:k]
+            candidates = candidates[part]
+        return candidates[np.argsort(-similarities[candidates], kind="stable")]
+    
+    def _quantized_similarities(self, query: np.ndarray, rows: Optional[np.ndarray], k: int) -> np.ndarray:
+        """Cosine similarities against the quantized matrix, with optional exact re-rank"""
+        if rows is None:
+            # Score the stored (possibly memory-mapped) matrix in place instead of gathering a copy
+            codes = self.embeddings
+            scales = self.scales[:len(codes)] if self.scales is not None else None
+        else:
+            codes = self.embeddings[rows]
+            scales = self.scales[rows] if self.scales is not None else None
+        similarities = dot_scores(codes, scales, query)
+        
+        # Re-score the best candidates against the full-precision vectors
+        if self.full_embeddings is not None and len(self.full_embeddings) >= len(self.embeddings):
+            n_rerank = min(len(similarities), k * settings.VECTOR_STORE_RERANK_FACTOR)
+            top = np.argpartition(-similarities, n_rerank - 1)[:n_rerank]
+            candidates = top if rows is None else rows[top]
+            exact = np.full(len(similarities), -np.inf, dtype=np.float32)
+            exact[top] = np.asarray(self.full_embeddings[candidates], dtype=np.float32) @ query
+            similarities = exact
+        
+        return similarities
+    
+    def flush(self):
+        """Persist rows added since the last flush/save as an append-only segment.
+        
+        Costs O(new rows), so a document can be flushed after every embedding batch;
+        a store reloaded after an interruption resumes from the flushed rows.
+        """
+        start, end = self._persisted_count, len(self)
+        if end == start:
+            return
+        
+        arrays = {"embeddings": np.asarray(self.embeddings[start:end])}
+        if self.scales is not None:
+            arrays["scales"] = np.asarray(self.scales[start:end])
+        if self.full_embeddings is not None:
+            arrays["full_embeddings"] = np.asarray(self.full_embeddings[start:end])
+        arrays.update(self.metadata.segment_arrays(start, end))
+        
+        atomic_write(self._segment_path(start), lambda f: np.savez(f, **arrays))
+        self._persisted_count = end
+        self._mark_written()
+        logger.info(f"Flushed {end - start} vectors for document {self.document_id} (segment at row {start})")
+    
+    def _disk_version(self):
+        try:
+            stat = os.stat(self.version_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
+    def _mark_written(self):
+        atomic_write(self.version_path, lambda f: f.write(str(len(self)).encode()))
+        self._loaded_version = self._disk_version()
+    
+    def is_stale(self) -> bool:
+        """True if another process changed the store on disk since this copy was loaded or written"""
+        return self._disk_version() != self._loaded_version
+    
+    def resume_point(self, chunk_ids: List[int]) -> int:
+        """How many of `chunk_ids` (in order) are already embedded.
+        
+        If the stored rows are not a prefix of `chunk_ids` the store is cleared.
+        """
+        stored = np.asarray(self.metadata.columns["chunk_id"])
+        if len(stored) <= len(chunk_ids) and np.array_equal(stored, chunk_ids[:len(stored)]):
+            return len(stored)
+        self.clear()
+        return 0
     
     def save(self):
-        """Save the vector store to disk"""
+        """Save (compact) the vector store to disk"""
         try:
             # Save embeddings
-            np.save(self.embeddings_path, self.embeddings)
+            atomic_write(self.embeddings_path, lambda f: np.save(f, np.asarray(self.embeddings)))
+            self._save_optional(self.scales_path, self.scales)
+            self._save_optional(self.full_embeddings_path, self.full_embeddings)
             
             # Save metadata
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            self.metadata.save(self.columns_path, self.text_offsets_path, self.text_path)
+            
+            # Segments are now part of the base files
+            for _, path in self._segment_files():
+                os.remove(path)
+            self._persisted_count = len(self)
+            
+            # Build ANN index for large stores, drop it for small ones
+            self.build_index()
+            self.build_sparse_index()
+            self._mark_written()
             
             logger.info(f"Saved vector store for document {self.document_id}")
             
@@ -120,6 +421,67 @@ class VectorStore:
             logger.error(f"Error saving vector store: {e}")
             raise
     
+    @staticmethod
+    def _save_optional(path: str, array: Optional[np.ndarray]):
+        """Save a sidecar array, or remove a stale one if the store no longer has it"""
+        if array is not None:
+            atomic_write(path, lambda f: np.save(f, np.asarray(array)))
+        elif os.path.exists(path):
+            os.remove(path)
+    
+    @staticmethod
+    def _ann_params() -> Dict[str, Any]:
+        """Index parameters from settings"""
+        return {"nlist": settings.ANN_IVF_NLIST, "nprobe": settings.ANN_IVF_NPROBE}
+    
+    def build_index(self):
+        """Build and persist the ANN index if the store is above the size threshold"""
+        if len(self.embeddings) < settings.ANN_INDEX_MIN_VECTORS:
+            self.ann_index = None
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            return
+        
+        params = self._ann_params()
+        index = create_index(settings.ANN_INDEX_TYPE, **params)
+        index.build(self.embeddings)
+        atomic_write(self.index_path, index.save)
+        self.ann_index = index
+        logger.info(f"Built {index.index_type} index for document {self.document_id}")
+    
+    def build_sparse_index(self, persist: bool = True):
+        """Build the BM25 keyword index from the stored chunk text (and persist it)"""
+        sparse_index = BM25Index.build(
+            (self.metadata.text(row) for row in range(len(self.metadata))),
+            k1=settings.BM25_K1,
+            b=settings.BM25_B
+        )
+        if persist:
+            sparse_index.save(self.bm25_path, self.bm25_vocab_path)
+        self.sparse_index = sparse_index
+    
+    def keyword_search(self, query: str, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """BM25 keyword search; no embedding call, so exact identifiers match cheaply.
+        
+        A missing index is built in memory only (save() persists it). While a
+        document is being ingested the index covers the rows that existed when it
+        was built, and is rebuilt once the store has doubled since, so lazy
+        rebuilds cost O(total rows) over an ingestion.
+        """
+        if len(self.metadata) == 0:
+            return []
+        
+        sparse_index = self.sparse_index
+        if sparse_index is None or 2 * sparse_index.size < len(self.metadata):
+            with self._index_lock:
+                sparse_index = self.sparse_index
+                if sparse_index is None or 2 * sparse_index.size < len(self.metadata):
+                    self.build_sparse_index(persist=False)
+                    sparse_index = self.sparse_index
+        
+        rows, scores = sparse_index.search(query, k)
+        return [(self.metadata[int(row)], float(score)) for row, score in zip(rows, scores)]
+    
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store"""
         embedding_dim = self.embeddings.shape[1] if self.embeddings.size > 0 else 0
@@ -127,59 +489,218 @@ class VectorStore:
             "document_id": self.document_id,
             "vector_count": len(self.metadata),
             "embedding_dimension": embedding_dim,
-            "index_type": "numpy array with cosine similarity",
+            "index_type": self.ann_index.index_type if self.ann_index else "flat",
+            "index_params": self.ann_index.get_params() if self.ann_index else {},
+            "ann_min_vectors": settings.ANN_INDEX_MIN_VECTORS,
+            "storage_dtype": self.dtype,
+            "storage_bytes": int(self.embeddings.nbytes + (self.scales.nbytes if self.scales is not None else 0)),
+            "rerank": self.full_embeddings is not None,
+            "memory_mapped": isinstance(self.embeddings, np.memmap),
+            "bm25_terms": len(self.sparse_index.vocabulary) if self.sparse_index else 0,
             "last_updated": datetime.now().isoformat()
         }
     
+    def memory_bytes(self) -> int:
+        """Approximate memory held by this store (used for the manager's cache budget).
+        
+        Memory-mapped arrays (embeddings, scales, the full-precision copy, metadata)
+        count at their full size, like in-memory ones: the budget bounds what a
+        cached store can page in, even where only part of a mapping is resident.
+        """
+        total = self._embeddings.nbytes + self.metadata.nbytes
+        if self._scales is not None:
+            total += self._scales.nbytes
+        if self._full_embeddings is not None:
+            total += self._full_embeddings.nbytes
+        if self.ann_index is not None:
+            total += self.ann_index.nbytes
+        if self.sparse_index is not None:
+            total += self.sparse_index.nbytes
+        return int(total)
+    
     def clear(self):
         """Clear the vector store"""
-        from app.services.gemini_service import GeminiEmbeddings
-        
-        embedding_dim = GeminiEmbeddings.get_dimension()
-        self.embeddings = np.array([]).reshape(0, embedding_dim)
-        self.metadata = []
+        self._reset(get_embedding_provider().get_dimension())
         
         # Remove saved files
-        if os.path.exists(self.embeddings_path):
-            os.remove(self.embeddings_path)
-        if os.path.exists(self.metadata_path):
-            os.remove(self.metadata_path)
+        for path in (self.embeddings_path, self.columns_path, self.text_offsets_path, self.text_path,
+                     self.legacy_metadata_path, self.index_path, self.scales_path, self.full_embeddings_path,
+                     self.bm25_path, self.bm25_vocab_path, self.version_path):
+            if os.path.exists(path):
+                os.remove(path)
+        for _, path in self._segment_files():
+            os.remove(path)
+        self._loaded_version = None
         
         logger.info(f"Cleared vector store for document {self.document_id}")
 
 
 class VectorStoreManager:
-    """Manager for multiple vector stores"""
+    """Manager for multiple vector stores.
+    
+    Loaded stores are kept in an LRU cache bounded by VECTOR_STORE_CACHE_MAX_BYTES;
+    pinned documents are never evicted.
+    """
     
     def __init__(self):
         self.store_dir = settings.VECTOR_STORE_DIR
         os.makedirs(self.store_dir, exist_ok=True)
-        self.stores = {}  # document_id -> VectorStore
+        self.stores: "OrderedDict[int, VectorStore]" = OrderedDict()  # document_id -> VectorStore, LRU first
+        self.global_index = GlobalVectorIndex(self.store_dir, settings.GLOBAL_INDEX_SHARDS)
+        self.max_bytes = settings.VECTOR_STORE_CACHE_MAX_BYTES
+        self.pinned = set(settings.VECTOR_STORE_PINNED_DOCUMENTS)
+        self._lock = threading.RLock()
+        self.cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "evicted_bytes": 0}
     
     def get_store(self, document_id: int) -> VectorStore:
         """Get or create vector store for a document"""
-        if document_id not in self.stores:
-            self.stores[document_id] = VectorStore(document_id)
-        return self.stores[document_id]
+        with self._lock:
+            store = self.stores.get(document_id)
+            if store is not None and not store.is_stale():
+                self.cache_stats["hits"] += 1
+                self.stores.move_to_end(document_id)
+                return store
+            if store is not None:
+                # Another process (e.g. a run_worker.py ingestion worker) wrote it since we loaded it
+                logger.info(f"Vector store for document {document_id} changed on disk, reloading")
+            
+            self.cache_stats["misses"] += 1
+            store = VectorStore(document_id)
+            self.stores[document_id] = store
+            self._evict(keep=document_id)
+            return store
+    
+    def _evict(self, keep: Optional[int] = None):
+        """Drop least recently used, unpinned stores until the cache fits the budget"""
+        sizes = {doc_id: store.memory_bytes() for doc_id, store in self.stores.items()}
+        total = sum(sizes.values())
+        
+        for doc_id in list(self.stores):
+            if total <= self.max_bytes:
+                break
+            if doc_id == keep or doc_id in self.pinned:
+                continue
+            del self.stores[doc_id]
+            total -= sizes[doc_id]
+            self.cache_stats["evictions"] += 1
+            self.cache_stats["evicted_bytes"] += sizes[doc_id]
+            logger.info(f"Evicted vector store for document {doc_id} ({sizes[doc_id]} bytes)")
+    
+    def pin(self, document_id: int):
+        """Keep a document's store resident regardless of the cache budget"""
+        with self._lock:
+            self.pinned.add(document_id)
+    
+    def unpin(self, document_id: int):
+        with self._lock:
+            self.pinned.discard(document_id)
+            self._evict()
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Cache occupancy and eviction metrics"""
+        with self._lock:
+            lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+            return {
+                **self.cache_stats,
+                "hit_ratio": self.cache_stats["hits"] / lookups if lookups else 0.0,
+                "cached_stores": len(self.stores),
+                "cached_bytes": sum(store.memory_bytes() for store in self.stores.values()),
+                "max_bytes": self.max_bytes,
+                "pinned": sorted(self.pinned)
+            }
+    
+    def save_store(self, document_id: int):
+        """Save a document's vector store and sync it into the global index"""
+        store = self.get_store(document_id)
+        store.save()
+        self.global_index.upsert_document(
+            document_id,
+            store.embeddings,
+            store.metadata.chunk_indexes()
+        )
     
     def save_all(self):
         """Save all vector stores"""
-        for store in self.stores.values():
-            store.save()
+        with self._lock:
+            document_ids = list(self.stores)
+        for document_id in document_ids:
+            self.save_store(document_id)
+    
+    def rebuild_global_index(self):
+        """Rebuild the global index from every per-document store on disk"""
+        pattern = re.compile(r"^doc_(\d+)_embeddings\.npy$")
+        document_ids = [
+            int(match.group(1))
+            for match in map(pattern.match, os.listdir(self.store_dir))
+            if match
+        ]
+        for document_id in document_ids:
+            # Don't pull every store into the cache just to index it
+            store = self.stores.get(document_id) or VectorStore(document_id)
+            self.global_index.upsert_document(
+                document_id,
+                store.embeddings,
+                store.metadata.chunk_indexes()
+            )
+        logger.info(f"Rebuilt global index from {len(document_ids)} vector stores")
+    
+    def search_all(
+        self,
+        query: str,
+        k: int = 5,
+        document_ids: Optional[List[int]] = None,
+        threshold: float = 0.0
+    ) -> List[Tuple[int, int, float]]:
+        """Single top-k search across documents; returns (document_id, chunk_index, similarity)"""
+        if not self.global_index.exists():
+            self.rebuild_global_index()
+        
+        query_embedding = get_embedding_provider().embed_query(query)
+        return self.global_index.search(query_embedding, k=k, document_ids=document_ids, threshold=threshold)
+    
+    def clone_store(self, source_id: int, target_id: int, chunk_ids: Dict[int, int]):
+        """Give target_id the saved store of source_id (same document content).
+        
+        Embeddings, text and indexes are hardlinked rather than copied; only the
+        chunk columns are rewritten, with the target's chunk ids
+        (chunk_ids maps chunk_index -> chunk id).
+        """
+        source = self.get_store(source_id)
+        if source._segment_files() or source._persisted_count != len(source) or not os.path.exists(source.columns_path):
+            raise ValueError(f"Vector store for document {source_id} is not saved")
+        
+        columns = np.array(source.metadata.columns)
+        columns["chunk_id"] = [chunk_ids[int(index)] for index in columns["chunk_index"]]
+        
+        self.delete_store(target_id)
+        target = VectorStore(target_id)  # empty after delete_store(); used for its file paths
+        for name in ("embeddings_path", "scales_path", "full_embeddings_path", "text_offsets_path",
+                     "text_path", "index_path", "bm25_path", "bm25_vocab_path"):
+            if os.path.exists(getattr(source, name)):
+                link_or_copy(getattr(source, name), getattr(target, name))
+        # Columns last: load() treats them as the marker of a complete store
+        atomic_write(target.columns_path, lambda f: np.save(f, columns))
+        target._mark_written()
+        
+        with self._lock:
+            self.stores.pop(target_id, None)
+        self.global_index.upsert_document(target_id, source.embeddings, source.metadata.chunk_indexes())
+        logger.info(f"Cloned vector store of document {source_id} to document {target_id} ({len(columns)} vectors)")
     
     def get_all_stats(self) -> Dict[int, Dict[str, Any]]:
         """Get statistics for all vector stores"""
-        stats = {}
-        for doc_id, store in self.stores.items():
-            stats[doc_id] = store.get_stats()
-        return stats
+        with self._lock:
+            stores = list(self.stores.items())
+        return {doc_id: store.get_stats() for doc_id, store in stores}
     
     def delete_store(self, document_id: int):
         """Delete vector store for a document"""
-        if document_id in self.stores:
-            self.stores[document_id].clear()
-            del self.stores[document_id]
-            logger.info(f"Deleted vector store for document {document_id}")
+        with self._lock:
+            store = self.stores.pop(document_id, None)
+        store = store or VectorStore(document_id)
+        store.clear()
+        self.global_index.remove_document(document_id)
+        logger.info(f"Deleted vector store for document {document_id}")
 
 # Global instance
 vector_store_manager = VectorStoreManager()
\ No newline at end of file
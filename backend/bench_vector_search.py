@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark: VectorStore similarity search vs the old
+cosine_similarity + full argsort implementation
+"""
+
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getcwd())
+
+from app.config import settings
+
+DIM = 768
+K = 5
+THRESHOLD = 0.0
+QUERIES = 50
+
+
+def legacy_search(embeddings: np.ndarray, query: np.ndarray):
+    """The previous similarity_search: re-normalizes the matrix and sorts every score"""
+    similarities = cosine_similarity(query.reshape(1, -1), embeddings)[0]
+    top_indices = np.argsort(similarities)[::-1][:K]
+    return [int(i) for i in top_indices if similarities[i] >= THRESHOLD]
+
+
+def time_per_query(fn, queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    settings.VECTOR_STORE_DIR = tempfile.mkdtemp(prefix="bench_vectors_")
+    settings.ANN_INDEX_MIN_VECTORS = sys.maxsize  # measure the exact scan only
+    from app.utils.vector_store import VectorStore
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} | {'legacy ms':>10} | {'new ms':>8} | {'speedup':>7} | same top-k")
+    print("-" * 56)
+
+    for n_rows in (10_000, 100_000):
+        embeddings = rng.standard_normal((n_rows, DIM))
+        queries = rng.standard_normal((QUERIES, DIM))
+
+        store = VectorStore(document_id=0)
+        store.clear()
+        store.add_embeddings(embeddings, [{"chunk_index": i} for i in range(n_rows)])
+
+        def new_search(query):
+            return [m["chunk_index"] for m, _ in store.similarity_search_by_vector(query, k=K, threshold=THRESHOLD)]
+
+        same = all(legacy_search(embeddings, q) == new_search(q) for q in queries[:10])
+        legacy_ms = time_per_query(lambda q: legacy_search(embeddings, q), queries)
+        new_ms = time_per_query(new_search, queries)
+        print(f"{n_rows:>8} | {legacy_ms:>10.2f} | {new_ms:>8.2f} | {legacy_ms / new_ms:>6.1f}x | {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Run a document processing worker (use with PROCESSING_MODE=worker on the API server)"""
+
+import os
+import sys
+import asyncio
+import argparse
+import logging
+import signal
+
+# Ensure we're in the right directory
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def main(concurrency: int, worker_id: str):
+    from app.database import engine, Base, add_missing_columns
+    # Import all models to ensure they're registered with Base
+    from app.models import user, document, chat_history, processing_job
+    from app.database import SessionLocal
+    from app.services.job_queue import job_queue
+    from app.services.pdf_processor import pdf_processor
+    from app.services.processing_worker import ProcessingWorker
+
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+    db = SessionLocal()
+    try:
+        job_queue.enqueue_unprocessed(db)
+    finally:
+        db.close()
+
+    worker = ProcessingWorker(worker_id=worker_id, concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(worker.stop()))
+        except NotImplementedError:
+            # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+
+    try:
+        await worker.start()
+    finally:
+        await worker.stop()
+        pdf_processor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Jobs processed at once (default: PROCESSING_CONCURRENCY)")
+    parser.add_argument("--worker-id", default=None,
+                        help="Name recorded on leased jobs (default: host:pid:random)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(main(args.concurrency, args.worker_id))
+    except KeyboardInterrupt:
+        sys.exit(0)
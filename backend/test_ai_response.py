@@ -1,4 +1,5 @@
 """Test script to verify AI is working with context"""
+import asyncio
 import requests
 import json
 import time
@@ -17,7 +18,7 @@ print("\n" + "=" * 70)
 # Step 1: Retrieve context
 print("\n1️⃣  RETRIEVING CONTEXT FROM VECTOR STORE")
 print("-" * 70)
-context = chat_service.retrieve_context(document_id, query, top_k=5)
+context = asyncio.run(chat_service.retrieve_context_async(document_id, query, top_k=5))
 
 if not context:
     print("❌ ERROR: No context retrieved!")
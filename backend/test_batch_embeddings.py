@@ -0,0 +1,208 @@
+"""
+Test script for the batched Gemini embedding client
+Runs against a local fake batchEmbedContents server (no API key needed)
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+DIMENSION = 8
+
+
+def fake_embedding(text: str):
+    """Deterministic embedding so results can be checked for order"""
+    return [float(len(text) + i) for i in range(DIMENSION)]
+
+
+class FakeEmbeddingServer:
+    """Local stand-in for the batchEmbedContents endpoint"""
+
+    def __init__(self, rate_limited_requests: int = 0, latency: float = 0.05):
+        self.rate_limited_requests = rate_limited_requests
+        self.latency = latency
+        self.requests = 0
+        self.batch_sizes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.requests += 1
+                    rate_limited = server.requests <= server.rate_limited_requests
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+
+                time.sleep(server.latency)
+
+                if rate_limited:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0.1")
+                    self.end_headers()
+                else:
+                    texts = [r["content"]["parts"][0]["text"] for r in body["requests"]]
+                    with server.lock:
+                        server.batch_sizes.append(len(texts))
+                    data = json.dumps({"embeddings": [{"values": fake_embedding(t)} for t in texts]}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+                with server.lock:
+                    server.in_flight -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_client(server, **kwargs):
+    from app.services.gemini_service import GeminiBatchEmbeddings
+    params = {"api_key": "test", "base_url": server.url, "batch_size": 10,
+              "max_concurrency": 4, "requests_per_minute": 60000, "max_retries": 3}
+    params.update(kwargs)
+    return GeminiBatchEmbeddings(**params)
+
+
+def test_batching_and_order():
+    """Texts are split into batches and results come back in input order"""
+    print("\n=== Testing Batching and Order ===")
+
+    texts = [f"chunk {'x' * i}" for i in range(95)]
+    with FakeEmbeddingServer() as server:
+        embeddings = make_client(server).create_embeddings(texts)
+
+    if embeddings != [fake_embedding(t) for t in texts]:
+        print("❌ Embeddings missing or out of order")
+        return False
+    if sorted(server.batch_sizes) != [5] + [10] * 9:
+        print(f"❌ Unexpected batch sizes: {server.batch_sizes}")
+        return False
+
+    print(f"✓ {len(texts)} texts embedded with {server.requests} requests")
+    return True
+
+
+def test_concurrency():
+    """Batches run concurrently, bounded by max_concurrency"""
+    print("\n=== Testing Concurrency ===")
+
+    texts = [f"text {i}" for i in range(200)]
+    with FakeEmbeddingServer(latency=0.2) as server:
+        start = time.time()
+        make_client(server, max_concurrency=4).create_embeddings(texts)
+        elapsed = time.time() - start
+
+    if not 1 < server.max_in_flight <= 4:
+        print(f"❌ Max in-flight requests was {server.max_in_flight}, expected 2-4")
+        return False
+
+    print(f"✓ 20 batches in {elapsed:.2f}s with up to {server.max_in_flight} concurrent requests")
+    return True
+
+
+def test_retry_on_429():
+    """Rate-limited requests are retried until they succeed"""
+    print("\n=== Testing Retry on 429 ===")
+
+    texts = [f"text {i}" for i in range(10)]
+    with FakeEmbeddingServer(rate_limited_requests=2) as server:
+        embeddings = make_client(server).create_embeddings(texts)
+
+    if len(embeddings) != len(texts) or server.requests != 3:
+        print(f"❌ Expected 3 requests (2 rate limited), got {server.requests}")
+        return False
+
+    print("✓ Succeeded after 2 rate-limited attempts")
+    return True
+
+
+def test_retries_exhausted():
+    """A persistent 429 surfaces as an error once retries run out"""
+    print("\n=== Testing Retries Exhausted ===")
+
+    import requests
+    with FakeEmbeddingServer(rate_limited_requests=100) as server:
+        try:
+            make_client(server, max_retries=1).create_embeddings(["text"])
+        except requests.HTTPError as e:
+            print(f"✓ Raised after {server.requests} attempts: {e.response.status_code}")
+            return server.requests == 2
+
+    print("❌ No error raised")
+    return False
+
+
+def test_rate_limiter():
+    """The token bucket spaces out requests beyond the burst capacity"""
+    print("\n=== Testing Rate Limiter ===")
+
+    from app.services.gemini_service import TokenBucket
+
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.time()
+    for _ in range(6):
+        bucket.acquire()
+    elapsed = time.time() - start
+
+    # 2 tokens are available immediately, the other 4 arrive at 20/s
+    if elapsed < 0.18:
+        print(f"❌ 6 acquisitions took only {elapsed:.2f}s")
+        return False
+
+    print(f"✓ 6 acquisitions at 20/s (burst 2) took {elapsed:.2f}s")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Batch Embedding Client Test Suite")
+    print("=" * 60)
+
+    results = {
+        "Batching and order": test_batching_and_order(),
+        "Concurrency": test_concurrency(),
+        "Retry on 429": test_retry_on_429(),
+        "Retries exhausted": test_retries_exhausted(),
+        "Rate limiter": test_rate_limiter(),
+    }
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+
+    for test_name, result in results.items():
+        status = "✓ Passed" if result else "❌ Failed"
+        print(f"{test_name:.<40} {status}")
+
+    passed = sum(1 for r in results.values() if r)
+    print(f"\nTotal: {passed}/{len(results)} tests passed")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
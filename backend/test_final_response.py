@@ -1,11 +1,12 @@
 from app.services.chat_service import chat_service
+import asyncio
 import time
 
 query = 'What is AI?'
 print(f'Question: {query}')
 print()
 
-context = chat_service.retrieve_context(1, query)
+context = asyncio.run(chat_service.retrieve_context_async(1, query))
 print(f'Context chunks: {len(context)}')
 print()
 
@@ -13,9 +14,13 @@ print('AI Response:')
 print('=' * 70)
 start = time.time()
 response = []
-for token in chat_service.generate_response(query, context):
-    response.append(token)
-    print(token, end='', flush=True)
+
+async def stream():
+    async for token in chat_service.generate_response_async(query, context):
+        response.append(token)
+        print(token, end='', flush=True)
+
+asyncio.run(stream())
 
 elapsed = time.time() - start
 full_response = ''.join(response)
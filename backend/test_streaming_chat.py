@@ -0,0 +1,283 @@
+"""
+Test script for token-level chat streaming
+Runs against a local fake streamGenerateContent server (no API key needed)
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+TOKENS = ["The warranty ", "covers parts ", "and labour ", "for two years."]
+TOKEN_DELAY = 0.2
+
+
+class FakeStreamingServer:
+    """Local stand-in for the streamGenerateContent SSE endpoint"""
+
+    def __init__(self, tokens=TOKENS, delay: float = TOKEN_DELAY, status: int = 200):
+        self.tokens = tokens
+        self.delay = delay
+        self.status = status
+        self.requests = []
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Chunked transfer encoding, like the real endpoint
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append((self.path, body))
+
+                self.send_response(server.status)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Connection", "close")
+                self.end_headers()
+
+                if server.status == 200:
+                    for token in server.tokens:
+                        event = {"candidates": [{"content": {"role": "model", "parts": [{"text": token}]}}]}
+                        self.write_chunk(f"data: {json.dumps(event)}\r\n\r\n".encode())
+                        time.sleep(server.delay)
+                self.write_chunk(b"")
+
+            def write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # listen() backlog for bursts of concurrent connections (read at bind time)
+            request_queue_size = 256
+
+        self.httpd = Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        from app.config import settings
+        self._previous_url = settings.GEMINI_API_BASE_URL
+        settings.GEMINI_API_BASE_URL = self.url
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        from app.config import settings
+        settings.GEMINI_API_BASE_URL = self._previous_url
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def collect(generator):
+    """Drain a token generator, recording when each token arrived"""
+    start = time.time()
+    tokens, arrivals = [], []
+    for token in generator:
+        tokens.append(token)
+        arrivals.append(time.time() - start)
+    return tokens, arrivals
+
+
+def collect_async(generator):
+    """collect() for an async token generator"""
+    import asyncio
+
+    async def drain():
+        start = time.time()
+        tokens, arrivals = [], []
+        async for token in generator:
+            tokens.append(token)
+            arrivals.append(time.time() - start)
+        return tokens, arrivals
+
+    return asyncio.run(drain())
+
+
+def test_stream_response():
+    """GeminiChat.stream_response yields tokens as the server sends them"""
+    print("\n=== Testing GeminiChat.stream_response ===")
+
+    from app.services.gemini_service import GeminiChat
+
+    with FakeStreamingServer() as server:
+        tokens, arrivals = collect(GeminiChat.stream_response("How long is the warranty?", "context"))
+
+    if tokens != TOKENS:
+        print(f"❌ Unexpected tokens: {tokens}")
+        return False
+
+    path, body = server.requests[0]
+    if ":streamGenerateContent" not in path or "alt=sse" not in path:
+        print(f"❌ Unexpected request path: {path}")
+        return False
+    if "How long is the warranty?" not in body["contents"][0]["parts"][0]["text"]:
+        print("❌ Query missing from prompt")
+        return False
+
+    # First token must arrive well before the last one
+    if arrivals[0] > arrivals[-1] - TOKEN_DELAY * (len(TOKENS) - 2):
+        print(f"❌ Tokens were not streamed: arrivals {arrivals}")
+        return False
+
+    print(f"✓ {len(tokens)} tokens, first after {arrivals[0] * 1000:.0f}ms, last after {arrivals[-1] * 1000:.0f}ms")
+    return True
+
+
+def test_chat_service_streaming():
+    """ChatService.generate_response_async passes tokens through without buffering"""
+    print("\n=== Testing ChatService.generate_response_async ===")
+
+    from app.services.chat_service import chat_service
+
+    context = [{"text": "The warranty covers parts and labour for two years."}]
+    with FakeStreamingServer():
+        tokens, arrivals = collect_async(chat_service.generate_response_async("How long is the warranty?", context))
+
+    if "".join(tokens) != "".join(TOKENS) or len(tokens) != len(TOKENS):
+        print(f"❌ Unexpected tokens: {tokens}")
+        return False
+    if arrivals[0] > arrivals[-1] - TOKEN_DELAY * (len(TOKENS) - 2):
+        print(f"❌ Tokens were buffered: arrivals {arrivals}")
+        return False
+
+    print(f"✓ Time to first token {arrivals[0] * 1000:.0f}ms of {arrivals[-1] * 1000:.0f}ms total")
+    return True
+
+
+def test_async_streaming():
+    """The async pipeline streams concurrent chats without serializing them"""
+    print("\n=== Testing Async Streaming ===")
+
+    import asyncio
+    from app.services.chat_service import chat_service
+
+    context = [{"text": "The warranty covers parts and labour for two years."}]
+    concurrent_chats = 50
+
+    async def one_chat():
+        start = time.time()
+        tokens, first = [], None
+        async for token in chat_service.generate_response_async("How long is the warranty?", context):
+            if first is None:
+                first = time.time() - start
+            tokens.append(token)
+        return tokens, first
+
+    async def run():
+        start = time.time()
+        results = await asyncio.gather(*[one_chat() for _ in range(concurrent_chats)])
+        return results, time.time() - start
+
+    with FakeStreamingServer():
+        results, elapsed = asyncio.run(run())
+
+    if any(tokens != TOKENS for tokens, _ in results):
+        print("❌ Some chats returned unexpected tokens")
+        return False
+
+    # Serialized chats would take concurrent_chats * (len(TOKENS) * TOKEN_DELAY)
+    single_chat = len(TOKENS) * TOKEN_DELAY
+    if elapsed > single_chat * 4:
+        print(f"❌ {concurrent_chats} chats took {elapsed:.2f}s (one chat takes {single_chat:.2f}s)")
+        return False
+
+    first_tokens = sorted(first for _, first in results)
+    print(f"✓ {concurrent_chats} concurrent chats in {elapsed:.2f}s, median TTFT {first_tokens[len(first_tokens) // 2] * 1000:.0f}ms")
+    return True
+
+
+def test_request_coalescing():
+    """Identical concurrent requests share one LLM generation and all get every token"""
+    print("\n=== Testing Request Coalescing ===")
+
+    import asyncio
+    from app.services.gemini_service import GeminiChat
+    from app.services.single_flight import SingleFlight
+
+    in_flight = SingleFlight()
+    subscribers = 20
+
+    async def start():
+        return {"document_id": 1}, GeminiChat.stream_response_async("How long is the warranty?", "context")
+
+    async def one_request(delay: float):
+        # Later requests join mid-stream and must still replay from the first token
+        await asyncio.sleep(delay)
+        metadata, tokens, shared = await in_flight.join((1, "how long is the warranty"), start)
+        return [token async for token in tokens], shared
+
+    async def run():
+        return await asyncio.gather(*[one_request(i * TOKEN_DELAY / 10) for i in range(subscribers)])
+
+    with FakeStreamingServer() as server:
+        results = asyncio.run(run())
+
+    if len(server.requests) != 1:
+        print(f"❌ {len(server.requests)} LLM requests for {subscribers} identical queries")
+        return False
+    if any(tokens != TOKENS for tokens, _ in results):
+        print("❌ Some subscribers missed tokens")
+        return False
+    if sum(shared for _, shared in results) != subscribers - 1:
+        print(f"❌ Unexpected coalescing: {in_flight.get_stats()}")
+        return False
+
+    print(f"✓ {subscribers} requests served by 1 generation ({in_flight.get_stats()})")
+    return True
+
+
+def test_stream_error():
+    """An HTTP error from the LLM is raised instead of hanging the stream or posing as an answer"""
+    print("\n=== Testing Stream Error ===")
+
+    from app.services.chat_service import chat_service
+
+    with FakeStreamingServer(status=500):
+        try:
+            tokens, _ = collect_async(chat_service.generate_response_async("question", [{"text": "context"}]))
+        except Exception as e:
+            print(f"✓ Error surfaced: {str(e)[:60]}")
+            return True
+
+    print(f"❌ Unexpected output: {tokens}")
+    return False
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Streaming Chat Test Suite")
+    print("=" * 60)
+
+    results = {
+        "Stream response": test_stream_response(),
+        "Chat service streaming": test_chat_service_streaming(),
+        "Async streaming": test_async_streaming(),
+        "Request coalescing": test_request_coalescing(),
+        "Stream error": test_stream_error(),
+    }
+
+    print("\n" + "=" * 60)
+    print("Test Summary")
+    print("=" * 60)
+
+    for test_name, result in results.items():
+        status = "✓ Passed" if result else "❌ Failed"
+        print(f"{test_name:.<40} {status}")
+
+    passed = sum(1 for r in results.values() if r)
+    print(f"\nTotal: {passed}/{len(results)} tests passed")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Shared fixtures for the backend test suite
+Tests run against a scratch SQLite database and the local embedding provider,
+and each test gets its own working directory, so uploads, vector stores and
+global index shards never leak between tests.
+"""
+
+import os
+import sys
+import tempfile
+
+# Configure the app before anything imports app.config
+_WORKDIR = tempfile.mkdtemp(prefix="artikle-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_WORKDIR, 'test.db')}"
+os.environ["EMBEDDING_PROVIDER"] = "local"
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+os.environ["PDF_EXTRACTION_WORKERS"] = "1"
+os.chdir(_WORKDIR)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import pytest
+from app.database import Base, SessionLocal, engine
+from app.models import Document, User  # registers every model with Base
+from app.utils.global_index import GlobalVectorIndex
+from app.utils.vector_store import vector_store_manager
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Fresh working directory and empty in-memory stores for every test"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("uploads", exist_ok=True)
+    os.makedirs("vector_stores", exist_ok=True)
+    vector_store_manager.stores.clear()
+    monkeypatch.setattr(vector_store_manager, "global_index",
+                        GlobalVectorIndex(vector_store_manager.store_dir, vector_store_manager.global_index.num_shards))
+    yield tmp_path
+    vector_store_manager.stores.clear()
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def user(db):
+    user = User(email="reader@example.com", username="reader", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def make_pdf(workdir):
+    """Write a PDF with the given page texts; returns its path"""
+    def make(pages, name="document.pdf"):
+        path = os.path.join("uploads", name)
+        pdf = fitz.open()
+        for text in pages:
+            page = pdf.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+        pdf.save(path)
+        pdf.close()
+        return path
+    return make
+
+
+@pytest.fixture
+def make_document(db, user):
+    def make(file_path, content_hash=None, title="Document"):
+        document = Document(
+            filename=os.path.basename(file_path),
+            original_filename=os.path.basename(file_path),
+            file_path=file_path,
+            file_size=os.path.getsize(file_path),
+            content_hash=content_hash,
+            title=title,
+            uploaded_by_id=user.id
+        )
+        db.add(document)
+        db.commit()
+        return document
+    return make
@@ -0,0 +1,144 @@
+import asyncio
+import importlib
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.answer_cache import AnswerCache, normalize_query
+from app.services.semantic_cache import SemanticCache
+
+# app.services re-exports the chat_service instance under the module's name
+chat_service_module = importlib.import_module("app.services.chat_service")
+
+
+def test_answer_cache_normalizes_questions():
+    assert normalize_query("  What is the\tRevenue?? ") == "what is the revenue"
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    cache.put(cache.make_key(1, "What is the revenue?", "v1"), "12M", {"sources": [4]})
+
+    assert cache.get(cache.make_key(1, "what is the REVENUE", "v1")) == {"response": "12M", "metadata": {"sources": [4]}}
+    assert cache.get(cache.make_key(2, "What is the revenue?", "v1")) is None
+    # Reprocessed document: new embeddings version, no stale answer
+    assert cache.get(cache.make_key(1, "What is the revenue?", "v2")) is None
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_answer_cache_lru_and_ttl():
+    cache = AnswerCache(max_entries=2, ttl_seconds=60)
+    keys = [cache.make_key(1, f"question {i}", "v1") for i in range(3)]
+    cache.put(keys[0], "a0", {})
+    cache.put(keys[1], "a1", {})
+    assert cache.get(keys[0]) is not None  # keys[1] is now the least recently used
+    cache.put(keys[2], "a2", {})
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0])["response"] == "a0"
+    assert cache.get_stats()["evictions"] == 1
+
+    cache = AnswerCache(max_entries=2, ttl_seconds=-1)
+    cache.put(keys[0], "a0", {})
+    assert cache.get(keys[0]) is None
+    assert cache.get_stats()["expirations"] == 1
+
+
+def test_answer_cache_invalidate_document():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    cache.put(cache.make_key(1, "q", "v1"), "one", {})
+    cache.put(cache.make_key(2, "q", "v1"), "two", {})
+    cache.invalidate_document(1)
+    assert cache.get(cache.make_key(1, "q", "v1")) is None
+    assert cache.get(cache.make_key(2, "q", "v1"))["response"] == "two"
+
+
+def embedding(seed: int, dim: int = 32) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def semantic_cache(**overrides) -> SemanticCache:
+    params = {"threshold": 0.9, "max_per_document": 3, "ttl_seconds": 60, "max_documents": 2}
+    return SemanticCache(**{**params, **overrides})
+
+
+def test_semantic_cache_matches_paraphrases():
+    cache = semantic_cache()
+    query = embedding(1)
+    cache.put(1, "v1", query, "Revenue grew 12%.", {"sources": [3]})
+
+    paraphrase = query + 0.05 * embedding(2)
+    answer, similarity = cache.lookup(1, "v1", paraphrase)
+    assert answer["response"] == "Revenue grew 12%."
+    assert similarity >= 0.9
+    assert cache.lookup(1, "v1", embedding(3)) is None
+    # Another document, or a reprocessed one, never matches
+    assert cache.lookup(2, "v1", query) is None
+    assert cache.lookup(1, "v2", query) is None
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_semantic_cache_bounds_entries_per_document():
+    cache = semantic_cache()
+    for seed in range(5):
+        cache.put(1, "v1", embedding(seed), f"answer {seed}", {})
+    assert cache.get_stats()["entries"] == 3
+    assert cache.lookup(1, "v1", embedding(0)) is None
+    assert cache.lookup(1, "v1", embedding(4))[0]["response"] == "answer 4"
+
+
+def test_semantic_cache_evicts_least_recently_used_documents():
+    cache = semantic_cache()
+    cache.put(1, "v1", embedding(1), "one", {})
+    cache.put(2, "v1", embedding(2), "two", {})
+    assert cache.lookup(1, "v1", embedding(1)) is not None  # document 1 is now the most recent
+    cache.put(3, "v1", embedding(3), "three", {})
+
+    stats = cache.get_stats()
+    assert stats["documents"] == 2
+    assert stats["evictions"] == 1
+    assert cache.lookup(2, "v1", embedding(2)) is None
+    assert cache.lookup(1, "v1", embedding(1))[0]["response"] == "one"
+    assert cache.lookup(3, "v1", embedding(3))[0]["response"] == "three"
+
+
+def test_semantic_cache_expiry_and_invalidation():
+    cache = semantic_cache(ttl_seconds=-1)
+    cache.put(1, "v1", embedding(1), "stale", {})
+    assert cache.lookup(1, "v1", embedding(1)) is None
+
+    cache = semantic_cache()
+    cache.put(1, "v1", embedding(1), "answer", {})
+    cache.invalidate_document(1)
+    assert cache.lookup(1, "v1", embedding(1)) is None
+
+
+@pytest.mark.parametrize("mode, sparse_mode_cache, embeddings", [
+    ("sparse", False, 0),
+    ("sparse", True, 1),
+    ("hybrid", False, 1),
+    ("dense", False, 1),
+])
+def test_query_is_embedded_only_when_needed(monkeypatch, mode, sparse_mode_cache, embeddings):
+    answers = AnswerCache(max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr(chat_service_module, "answer_cache", answers)
+    monkeypatch.setattr(chat_service_module, "semantic_cache", semantic_cache())
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", mode)
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_IN_SPARSE_MODE", sparse_mode_cache)
+    service = chat_service_module.ChatService()
+    embedded, retrieved = [], []
+
+    async def embed_query(query):
+        embedded.append(embedding(len(embedded)))
+        return embedded[-1]
+
+    async def retrieve_context_async(document_id, query, query_embedding=None, **kwargs):
+        retrieved.append(query_embedding)
+        return []
+
+    monkeypatch.setattr(service, "_embed_query", embed_query)
+    monkeypatch.setattr(service, "retrieve_context_async", retrieve_context_async)
+
+    answers.put(answers.make_key(1, "cached question", "v1"), "cached answer", {})
+    asyncio.run(service._answer_stream(1, "Cached question", "v1"))
+    assert embedded == [] and retrieved == []
+
+    asyncio.run(service._answer_stream(1, "What changed?", "v1"))
+    assert len(embedded) == embeddings
+    # Retrieval reuses the cache's embedding instead of computing its own
+    assert retrieved[0] is (embedded[0] if embedded else None)
@@ -0,0 +1,80 @@
+import asyncio
+import importlib
+import json
+import time
+import pytest
+from app.api import chat
+from app.services.answer_cache import AnswerCache
+from app.services.gemini_service import GeminiChat
+
+# app.services re-exports the chat_service instance under the module's name
+chat_service_module = importlib.import_module("app.services.chat_service")
+
+
+async def token_stream(tokens, error=None):
+    for token in tokens:
+        yield token
+    if error is not None:
+        raise error
+
+
+def stream_events(stream_generator, monkeypatch):
+    saved = []
+    monkeypatch.setattr(chat, "save_chat", lambda **kwargs: saved.append(kwargs))
+    response = chat.chat_event_response(
+        {"metadata": {"top_similarity_score": 0.9}, "stream_generator": stream_generator},
+        time.time(), user_id=1, document_ids=[7], question="What changed?"
+    )
+
+    async def collect():
+        return [json.loads(event[len("data: "):]) async for event in response.body_iterator]
+
+    return asyncio.run(collect()), saved
+
+
+def test_complete_stream_is_saved(monkeypatch):
+    events, saved = stream_events(token_stream(["Revenue ", "grew."]), monkeypatch)
+    assert [event["type"] for event in events] == ["metadata", "text", "text", "complete"]
+    assert "ttft_ms" in events[0]["data"]
+    assert [(s["document_id"], s["response"]) for s in saved] == [(7, "Revenue grew.")]
+
+
+@pytest.mark.parametrize("error", [RuntimeError("LLM unavailable"), None], ids=["first-token-error", "empty"])
+def test_stream_without_tokens_reports_error(monkeypatch, error):
+    events, saved = stream_events(token_stream([], error), monkeypatch)
+    assert [event["type"] for event in events] == ["metadata", "error"]
+    assert saved == []
+
+
+def test_error_mid_stream_is_not_saved(monkeypatch):
+    events, saved = stream_events(token_stream(["Revenue "], RuntimeError("connection reset")), monkeypatch)
+    assert [event["type"] for event in events] == ["metadata", "text", "error"]
+    assert saved == []
+
+
+def test_failed_generation_is_an_error_not_an_answer(monkeypatch):
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr(chat_service_module, "answer_cache", cache)
+    monkeypatch.setattr(chat_service_module, "semantic_cache", None)
+    service = chat_service_module.ChatService()
+
+    async def retrieve_context_async(document_id, query, **kwargs):
+        return [{"document_id": document_id, "chunk_index": 0, "page_number": 1, "text": "Revenue grew 12%.",
+                 "similarity_score": 0.8, "dense_score": 0.8, "sparse_score": 0.0, "rrf_score": 0.02}]
+
+    async def stream_response_async(**kwargs):
+        raise RuntimeError("429 quota exceeded")
+        yield
+
+    monkeypatch.setattr(service, "retrieve_context_async", retrieve_context_async)
+    monkeypatch.setattr(GeminiChat, "stream_response_async", staticmethod(stream_response_async))
+
+    result = asyncio.run(service.get_chat_response_async(7, "What changed?", document_version="v1"))
+    events, saved = stream_events(result["stream_generator"], monkeypatch)
+    assert [event["type"] for event in events] == ["metadata", "error"]
+    assert "quota" not in json.dumps(events)
+    assert saved == []
+    assert cache.get(cache.make_key(7, "What changed?", "v1")) is None
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(service.get_chat_response_async(7, "What changed?", stream=False, document_version="v1"))
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import numpy as np
+from app.models.document import DocumentChunk
+from app.services.background_tasks import background_task_manager
+from app.services.deduplication import find_duplicate
+from app.utils.vector_store import VectorStore, vector_store_manager
+
+CONTENT_HASH = "ab" * 32
+
+
+def chunk_ids(db, document_id):
+    return [chunk_id for chunk_id, in db.query(DocumentChunk.id).filter(
+        DocumentChunk.document_id == document_id
+    ).order_by(DocumentChunk.chunk_index).all()]
+
+
+def test_reupload_reuses_chunks_and_vector_store(db, make_pdf, make_document, monkeypatch):
+    path = make_pdf([f"Section {page}: the warranty covers parts and labour for two years." for page in range(5)])
+    source = make_document(path, content_hash=CONTENT_HASH)
+    copy = make_document(path, content_hash=CONTENT_HASH, title="Copy")
+    unrelated = make_document(path, content_hash="cd" * 32)
+
+    # Nothing to reuse until the first upload is processed
+    assert find_duplicate(db, copy) is None
+    asyncio.run(background_task_manager.process_document_async(source.id))
+    db.refresh(source)
+    assert find_duplicate(db, copy).id == source.id
+    assert find_duplicate(db, unrelated) is None
+
+    def no_embedding(self, texts, metadata_list):
+        raise AssertionError("a duplicate must not be embedded again")
+
+    monkeypatch.setattr(VectorStore, "add_texts", no_embedding)
+    asyncio.run(background_task_manager.process_document_async(copy.id))
+
+    db.refresh(copy)
+    assert copy.is_processed and copy.embeddings_created_at is not None
+    source_chunks, copy_chunks = chunk_ids(db, source.id), chunk_ids(db, copy.id)
+    assert len(copy_chunks) == len(source_chunks) > 0
+    assert not set(copy_chunks) & set(source_chunks)
+
+    source_store, copy_store = VectorStore(source.id), VectorStore(copy.id)
+    assert list(copy_store.metadata.columns["chunk_id"]) == copy_chunks
+    np.testing.assert_array_equal(copy_store.embeddings, source_store.embeddings)
+    # Embeddings are shared on disk, not copied
+    assert os.stat(copy_store.embeddings_path).st_ino == os.stat(source_store.embeddings_path).st_ino
+    results = vector_store_manager.global_index.search(source_store.embeddings[0], k=10, document_ids=[copy.id])
+    assert len(results) == len(copy_chunks)
+    assert results[0][0] == copy.id and results[0][2] > 0.99
+
+    # Deleting the original leaves the copy intact
+    vector_store_manager.delete_store(source.id)
+    copy_store = VectorStore(copy.id)
+    assert len(copy_store) == len(copy_chunks)
+    assert copy_store.keyword_search("warranty", k=1)[0][0]["chunk_id"] in copy_chunks
@@ -0,0 +1,55 @@
+import threading
+import numpy as np
+from app.utils.global_index import GlobalVectorIndex
+
+
+def unit_vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_upsert_search_remove(workdir):
+    index = GlobalVectorIndex(str(workdir), num_shards=2)
+    first, second = unit_vectors(5, seed=1), unit_vectors(4, seed=2)
+    index.upsert_document(1, first, range(5))
+    index.upsert_document(2, second, range(4))
+
+    assert index.search(second[3], k=1)[0][:2] == (2, 3)
+    assert {doc_id for doc_id, _, _ in index.search(first[0], k=9, document_ids=[1])} == {1}
+
+    index.remove_document(2)
+    assert index.search(second[3], k=9, document_ids=[2]) == []
+    # Another process (a fresh index over the same files) sees the same shards
+    assert GlobalVectorIndex(str(workdir), num_shards=2).get_stats()["vector_count"] == 5
+
+
+def test_search_during_upserts_sees_consistent_shards(workdir):
+    index = GlobalVectorIndex(str(workdir), num_shards=1)
+    vectors = unit_vectors(40, seed=3)
+    index.upsert_document(1, vectors[:20], range(20))
+    errors = []
+    stop = threading.Event()
+
+    def search():
+        while not stop.is_set():
+            try:
+                for doc_id, chunk_index, score in index.search(vectors[0], k=3):
+                    assert doc_id in (1, 2)
+                    assert -1.001 <= score <= 1.001
+                    if doc_id == 1:
+                        assert 0 <= chunk_index < 20
+            except Exception as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=search) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for size in range(1, 21):
+        index.upsert_document(2, vectors[20:20 + size], range(size))
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert index.get_stats()["vector_count"] == 40
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import pytest
+from app.config import settings
+from app.database import SessionLocal
+from app.models.document import Document, DocumentChunk
+from app.models.processing_job import ProcessingJob
+from app.services.background_tasks import background_task_manager
+from app.utils.vector_store import VectorStore, vector_store_manager
+
+
+def page_text(page: int) -> str:
+    return " ".join(f"Page {page} sentence {i} describes section {page}.{i} of the manual." for i in range(12))
+
+
+def test_resume_after_failed_round_does_not_reembed(db, make_pdf, make_document, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_SIZE", 5)
+    monkeypatch.setattr(settings, "EMBEDDING_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "CHUNK_SIZE", 40)
+    document = make_document(make_pdf([page_text(page) for page in range(30)]))
+
+    add_texts = VectorStore.add_texts
+    calls = {"count": 0}
+
+    def flaky_add_texts(self, texts, metadata_list):
+        calls["count"] += 1
+        if calls["count"] == 3:
+            raise RuntimeError("embedding service unavailable")
+        return add_texts(self, texts, metadata_list)
+
+    monkeypatch.setattr(VectorStore, "add_texts", flaky_add_texts)
+    with pytest.raises(RuntimeError):
+        asyncio.run(background_task_manager.process_document_async(document.id))
+    asyncio.run(background_task_manager.process_document_async(document.id))
+
+    chunk_ids = [chunk_id for chunk_id, in db.query(DocumentChunk.id).filter(
+        DocumentChunk.document_id == document.id
+    ).order_by(DocumentChunk.chunk_index).all()]
+    assert len(chunk_ids) > 15
+
+    for store in (vector_store_manager.get_store(document.id), VectorStore(document.id)):
+        stored_ids = list(store.metadata.columns["chunk_id"])
+        assert len(store) == len(chunk_ids)
+        assert len(set(stored_ids)) == len(stored_ids)
+        assert stored_ids == chunk_ids
+
+    db.refresh(document)
+    assert document.embeddings_created_at is not None
+
+
+def delete_document(document_id: int):
+    """What the delete endpoint does: rows first, then the vector store"""
+    db = SessionLocal()
+    try:
+        db.query(ProcessingJob).filter(ProcessingJob.document_id == document_id).delete()
+        db.delete(db.query(Document).filter(Document.id == document_id).one())
+        db.commit()
+    finally:
+        db.close()
+    vector_store_manager.delete_store(document_id)
+
+
+@pytest.mark.parametrize("deleted", ["before-save", "during-save"])
+def test_document_deleted_during_processing_leaves_nothing_behind(db, make_pdf, make_document, monkeypatch,
+                                                                   workdir, deleted):
+    document = make_document(make_pdf([page_text(page) for page in range(3)]))
+    document_id = document.id
+    if deleted == "before-save":
+        stream_document = background_task_manager._stream_document
+
+        async def stream_then_delete(*args):
+            timings = await stream_document(*args)
+            delete_document(document_id)
+            return timings
+
+        monkeypatch.setattr(background_task_manager, "_stream_document", stream_then_delete)
+    else:
+        save_store = vector_store_manager.save_store
+
+        def delete_then_save(doc_id):
+            # The endpoint's cleanup ran before this worker's save wrote the files
+            delete_document(doc_id)
+            save_store(doc_id)
+
+        monkeypatch.setattr(vector_store_manager, "save_store", delete_then_save)
+
+    asyncio.run(background_task_manager.process_document_async(document_id))
+
+    db.expire_all()
+    assert db.query(DocumentChunk).filter(DocumentChunk.document_id == document_id).count() == 0
+    assert not [name for name in os.listdir(workdir / "vector_stores") if name.startswith(f"doc_{document_id}_")]
+    assert vector_store_manager.global_index.get_stats()["vector_count"] == 0
@@ -0,0 +1,164 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database import SessionLocal
+from app.models.document import DocumentChunk
+from app.models.processing_job import JobStatus, ProcessingJob
+from app.services.job_queue import JobQueue, job_queue
+from app.services.processing_worker import ProcessingWorker
+from app.utils.vector_store import VectorStore, vector_store_manager
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(lease_seconds=60, max_attempts=2, retry_delay_seconds=10)
+
+
+@pytest.fixture
+def document(make_pdf, make_document):
+    return make_document(make_pdf(["Quarterly report: revenue grew in every region."] * 3))
+
+
+def get_job(db, job_id) -> ProcessingJob:
+    db.expire_all()
+    return db.query(ProcessingJob).filter(ProcessingJob.id == job_id).one()
+
+
+def test_enqueue_returns_active_job(db, queue, document):
+    job = queue.enqueue(db, document.id)
+    assert queue.enqueue(db, document.id).id == job.id
+
+    # The index rejects a second active job that bypasses the check
+    db.add(ProcessingJob(document_id=document.id, status=JobStatus.QUEUED, max_attempts=1,
+                         run_after=datetime.utcnow()))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+
+def test_concurrent_enqueue_creates_one_job(db, queue, document):
+    barrier = threading.Barrier(6)
+    job_ids = []
+
+    def enqueue():
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            job_ids.append(queue.enqueue(session, document.id).id)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=enqueue) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(job_ids)) == 1
+    assert db.query(ProcessingJob).count() == 1
+
+
+def test_claim_leases_job_to_one_worker(db, queue, document):
+    job = queue.enqueue(db, document.id)
+
+    assert queue.claim(db, "worker-a") == (job.id, document.id, None, 1)
+    assert queue.claim(db, "worker-b") is None
+    claimed = get_job(db, job.id)
+    assert claimed.status == JobStatus.RUNNING
+    assert claimed.leased_by == "worker-a"
+
+    assert queue.renew(db, job.id, "worker-a")
+    assert not queue.renew(db, job.id, "worker-b")
+    assert queue.complete(db, job.id, "worker-a")
+    assert get_job(db, job.id).status == JobStatus.COMPLETED
+    # Completed jobs don't block a new one
+    assert queue.enqueue(db, document.id).id != job.id
+
+
+def test_expired_lease_is_reclaimed(db, queue, document):
+    job = queue.enqueue(db, document.id)
+    queue.claim(db, "worker-a")
+    db.query(ProcessingJob).filter(ProcessingJob.id == job.id).update(
+        {ProcessingJob.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+    assert queue.claim(db, "worker-b") == (job.id, document.id, None, 2)
+    # The worker that lost its lease can no longer finish the job
+    assert not queue.complete(db, job.id, "worker-a")
+    assert get_job(db, job.id).leased_by == "worker-b"
+
+    # Abandoned on its last attempt: failed instead of claimed again
+    db.query(ProcessingJob).filter(ProcessingJob.id == job.id).update(
+        {ProcessingJob.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert queue.claim(db, "worker-c") is None
+    assert get_job(db, job.id).status == JobStatus.FAILED
+
+
+def test_failed_job_is_retried_after_backoff(db, queue, document):
+    job = queue.enqueue(db, document.id)
+    queue.claim(db, "worker-a")
+    assert queue.fail(db, job.id, "worker-a", "embedding service unavailable")
+
+    retried = get_job(db, job.id)
+    assert retried.status == JobStatus.QUEUED
+    assert retried.last_error == "embedding service unavailable"
+    assert retried.run_after > datetime.utcnow() + timedelta(seconds=5)
+    assert queue.claim(db, "worker-a") is None
+
+    db.query(ProcessingJob).filter(ProcessingJob.id == job.id).update({ProcessingJob.run_after: datetime.utcnow()})
+    db.commit()
+    assert queue.claim(db, "worker-b") == (job.id, document.id, None, 2)
+    assert queue.fail(db, job.id, "worker-b", "still unavailable")
+    assert get_job(db, job.id).status == JobStatus.FAILED
+
+
+def test_worker_retries_failed_job(db, document, monkeypatch):
+    monkeypatch.setattr(settings, "PROCESSING_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(job_queue, "retry_delay_seconds", 0)
+    add_texts = VectorStore.add_texts
+    calls = {"count": 0}
+
+    def flaky_add_texts(self, texts, metadata_list):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise RuntimeError("embedding service unavailable")
+        return add_texts(self, texts, metadata_list)
+
+    monkeypatch.setattr(VectorStore, "add_texts", flaky_add_texts)
+    job_id = job_queue.enqueue(db, document.id).id
+    worker = ProcessingWorker(worker_id="test-worker", concurrency=1)
+
+    async def run_until_finished():
+        worker.start()
+        try:
+            for _ in range(200):
+                session = SessionLocal()
+                try:
+                    status = session.query(ProcessingJob.status).filter(ProcessingJob.id == job_id).scalar()
+                finally:
+                    session.close()
+                if status in (JobStatus.COMPLETED, JobStatus.FAILED):
+                    return
+                await asyncio.sleep(0.05)
+        finally:
+            await worker.stop()
+
+    asyncio.run(run_until_finished())
+
+    job = get_job(db, job_id)
+    assert job.status == JobStatus.COMPLETED
+    assert job.attempts == 2
+    assert job.last_error is None
+    assert worker.stats == {"completed": 1, "failed": 1}
+
+    db.refresh(document)
+    assert document.embeddings_created_at is not None
+    chunk_ids = [chunk_id for chunk_id, in db.query(DocumentChunk.id).filter(
+        DocumentChunk.document_id == document.id
+    ).order_by(DocumentChunk.chunk_index).all()]
+    store = vector_store_manager.get_store(document.id)
+    assert list(store.metadata.columns["chunk_id"]) == chunk_ids
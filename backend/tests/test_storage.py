@@ -0,0 +1,60 @@
+import os
+import stat
+import threading
+import numpy as np
+import pytest
+from app.utils.storage import GrowableArray, atomic_write
+
+
+def test_atomic_write_from_concurrent_threads(tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    path = str(directory / "shared.npy")
+    errors = []
+
+    def write(value):
+        try:
+            for _ in range(20):
+                atomic_write(path, lambda f: np.save(f, np.full(1000, value)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(value,)) for value in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    data = np.load(path)
+    assert len(set(data.tolist())) == 1
+    assert os.listdir(directory) == ["shared.npy"]
+    umask = os.umask(0)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    path = str(directory / "data.bin")
+    atomic_write(path, lambda f: f.write(b"old"))
+
+    def failing_writer(f):
+        f.write(b"partial")
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        atomic_write(path, failing_writer)
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(directory) == ["data.bin"]
+
+
+def test_growable_array_appends():
+    array = GrowableArray(np.empty((0, 3), dtype=np.float32))
+    for i in range(10):
+        array.append(np.full((i + 1, 3), i, dtype=np.float32))
+    assert len(array) == 55
+    assert array.view.shape == (55, 3)
+    assert array.view[-1].tolist() == [9, 9, 9]
@@ -0,0 +1,220 @@
+import os
+import threading
+import numpy as np
+import pytest
+from app.config import settings
+from app.services.embedding_provider import get_embedding_provider
+from app.utils.vector_store import VectorStore
+
+
+def unit_vectors(count: int, seed: int = 0) -> np.ndarray:
+    dim = get_embedding_provider().get_dimension()
+    vectors = np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def chunk_metadata(document_id: int, start: int, count: int):
+    return [{
+        "chunk_id": 1000 * document_id + i,
+        "document_id": document_id,
+        "chunk_index": i,
+        "page_number": i // 10 + 1,
+        "token_count": 8,
+        "content": f"chunk {i} of document {document_id}"
+    } for i in range(start, start + count)]
+
+
+def make_store(monkeypatch, document_id: int, vectors: np.ndarray, dtype: str = "float32",
+               rerank: bool = False) -> VectorStore:
+    monkeypatch.setattr(settings, "VECTOR_STORE_DTYPE", dtype)
+    monkeypatch.setattr(settings, "VECTOR_STORE_RERANK", rerank)
+    store = VectorStore(document_id)
+    store.add_embeddings(vectors, chunk_metadata(document_id, 0, len(vectors)))
+    return store
+
+
+def search(store: VectorStore, query: np.ndarray, k: int = 5):
+    return [(metadata["chunk_index"], score)
+            for metadata, score in store.similarity_search_by_vector(query, k=k, threshold=-1.0)]
+
+
+@pytest.mark.parametrize("rerank", [True, False])
+def test_quantized_search(workdir, monkeypatch, rerank):
+    dtype = "int8"
+    vectors = unit_vectors(300)
+    exact = make_store(monkeypatch, 1, vectors)
+    store = make_store(monkeypatch, 2, vectors, dtype=dtype, rerank=rerank)
+    assert store.dtype == dtype
+    assert (store.full_embeddings is not None) == rerank
+
+    rng = np.random.default_rng(1)
+    queries = vectors[:20] + 0.3 * rng.standard_normal((20, vectors.shape[1])).astype(np.float32)
+    for query in queries:
+        expected, results = search(exact, query), search(store, query)
+        assert results[0][0] == expected[0][0]
+        if rerank:
+            # Re-ranked scores are exact float32 cosine similarities
+            assert [row for row, _ in results] == [row for row, _ in expected]
+            np.testing.assert_allclose([s for _, s in results], [s for _, s in expected], atol=1e-5)
+        else:
+            np.testing.assert_allclose(results[0][1], expected[0][1], atol=0.01)
+
+    # Same results from the memory-mapped files after a save and reload
+    store.save()
+    reloaded = VectorStore(2)
+    assert reloaded.dtype == dtype
+    assert isinstance(reloaded.embeddings, np.memmap)
+    for query in queries[:5]:
+        assert search(reloaded, query) == search(store, query)
+
+
+def test_int8_store_is_smaller_without_rerank(workdir, monkeypatch):
+    vectors = unit_vectors(200)
+    exact = make_store(monkeypatch, 1, vectors)
+    quantized = make_store(monkeypatch, 2, vectors, dtype="int8")
+    assert quantized.full_embeddings is None
+    exact.save()
+    quantized.save()
+
+    assert os.path.getsize(quantized.embeddings_path) < os.path.getsize(exact.embeddings_path) / 3
+    assert not os.path.exists(quantized.full_embeddings_path)
+    exact, quantized = VectorStore(1), VectorStore(2)
+    assert quantized.memory_bytes() - quantized.metadata.nbytes < (exact.memory_bytes() - exact.metadata.nbytes) / 3
+
+
+@pytest.mark.parametrize("full_copy", [True, False])
+def test_float16_store_is_upgraded_to_float32(workdir, monkeypatch, full_copy):
+    vectors = unit_vectors(50)
+    store = make_store(monkeypatch, 8, vectors)
+    store.save()
+    # A store written in the float16 format that is no longer supported
+    np.save(store.embeddings_path, vectors.astype(np.float16))
+    if full_copy:
+        np.save(store.full_embeddings_path, vectors)
+
+    upgraded = VectorStore(8)
+    assert upgraded.dtype == "float32"
+    assert upgraded.full_embeddings is None
+    assert not os.path.exists(upgraded.full_embeddings_path)
+    np.testing.assert_allclose(upgraded.embeddings, vectors, atol=1e-6 if full_copy else 1e-3)
+    assert search(upgraded, vectors[7], k=1)[0][0] == 7
+
+
+def add_texts(store: VectorStore, texts):
+    start = len(store)
+    metadata = chunk_metadata(store.document_id, start, len(texts))
+    store.add_embeddings(unit_vectors(len(texts), seed=start), metadata, texts)
+
+
+def test_keyword_search_recalls_identifiers(workdir, monkeypatch):
+    store = make_store(monkeypatch, 3, unit_vectors(0))
+    filler = [f"General notes on section {i}: the service restarts cleanly after updates." for i in range(40)]
+    add_texts(store, filler[:20] + [
+        "Error ERR-4021 means the upload exceeded MAX_UPLOAD_SIZE.",
+        "Set config.max_retries to 5 when upgrading to v2.3.1.",
+    ] + filler[20:])
+
+    assert store.keyword_search("ERR-4021", k=1)[0][0]["chunk_index"] == 20
+    assert store.keyword_search("what does err 4021 mean", k=1)[0][0]["chunk_index"] == 20
+    assert store.keyword_search("max_upload_size", k=1)[0][0]["chunk_index"] == 20
+    assert store.keyword_search("config.max_retries v2.3.1", k=1)[0][0]["chunk_index"] == 21
+    # Built lazily in memory; only save() writes it
+    assert not os.path.exists(store.bm25_path)
+    store.save()
+    assert os.path.exists(store.bm25_path)
+    assert VectorStore(3).keyword_search("ERR-4021", k=1)[0][0]["chunk_index"] == 20
+
+
+def test_keyword_search_during_ingestion(workdir, monkeypatch):
+    store = make_store(monkeypatch, 4, unit_vectors(0))
+    add_texts(store, [f"Round zero chunk {i} mentions ticket ABC-{i}." for i in range(10)])
+    assert store.keyword_search("ABC-3", k=1)[0][0]["chunk_index"] == 3
+    index = store.sparse_index
+
+    # Appended rows keep the index until the store has doubled
+    add_texts(store, [f"Round one chunk {i} mentions ticket XYZ-{i}." for i in range(5)])
+    store.keyword_search("XYZ-1", k=1)
+    assert store.sparse_index is index
+    add_texts(store, [f"Round two chunk {i} mentions ticket QRS-{i}." for i in range(10)])
+    assert store.keyword_search("QRS-7", k=1)[0][0]["chunk_index"] == 22
+    assert store.sparse_index.size == 25
+
+    # Concurrent searches build a missing index once, without errors
+    store.sparse_index = None
+    built = []
+    build = store.build_sparse_index
+    monkeypatch.setattr(store, "build_sparse_index", lambda persist=True: (built.append(persist), build(persist)))
+    errors = []
+
+    def search():
+        try:
+            assert store.keyword_search("ABC-3", k=1)[0][0]["chunk_index"] == 3
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert built == [False]
+
+
+def test_memory_bytes_counts_mapped_arrays(workdir, monkeypatch):
+    store = make_store(monkeypatch, 5, unit_vectors(100), dtype="int8", rerank=True)
+    store.save()
+    reloaded = VectorStore(5)
+    reloaded.sparse_index = None
+    assert isinstance(reloaded.embeddings, np.memmap)
+    assert isinstance(reloaded.full_embeddings, np.memmap)
+    assert reloaded.memory_bytes() == (reloaded.embeddings.nbytes + reloaded.scales.nbytes
+                                       + reloaded.full_embeddings.nbytes + reloaded.metadata.nbytes)
+
+
+def segment_files(store: VectorStore):
+    return [os.path.basename(path) for _, path in store._segment_files()]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int8"])
+def test_flushed_segments_reload_and_compact(workdir, monkeypatch, dtype):
+    store = make_store(monkeypatch, 6, unit_vectors(0), dtype=dtype)
+    add_texts(store, [f"first round chunk {i}" for i in range(4)])
+    store.flush()
+    add_texts(store, [f"second round chunk {i}" for i in range(3)])
+    store.flush()
+    store.flush()  # nothing new: no empty segment
+    assert segment_files(store) == ["doc_6_seg_00000000.npz", "doc_6_seg_00000004.npz"]
+
+    # A process that only sees the segments (interrupted before save()) gets every flushed row
+    reloaded = VectorStore(6)
+    assert len(reloaded) == 7
+    assert reloaded.dtype == dtype
+    assert list(reloaded.metadata.columns["chunk_id"]) == list(store.metadata.columns["chunk_id"])
+    assert reloaded.metadata.text(5) == "second round chunk 1"
+    np.testing.assert_array_equal(reloaded.embeddings, store.embeddings)
+    assert reloaded.resume_point(list(store.metadata.columns["chunk_id"]) + [99999]) == 7
+
+    # save() folds the segments into the base files; later flushes append new segments
+    store.save()
+    assert segment_files(store) == []
+    add_texts(store, ["third round chunk"])
+    store.flush()
+    assert segment_files(store) == ["doc_6_seg_00000007.npz"]
+    reloaded = VectorStore(6)
+    assert len(reloaded) == 8
+    assert reloaded.metadata.text(7) == "third round chunk"
+    assert search(reloaded, store.embeddings[7].astype(np.float32), k=1)[0][0] == 7
+
+
+def test_flush_marks_other_copies_stale(workdir, monkeypatch):
+    store = make_store(monkeypatch, 7, unit_vectors(3))
+    store.save()
+    other = VectorStore(7)
+    assert not other.is_stale()
+
+    add_texts(store, ["a new chunk"])
+    store.flush()
+    assert other.is_stale()
+    assert not store.is_stale()
+    assert len(VectorStore(7)) == 4